@@ -0,0 +1,6 @@
+"""Бенчмарки yanote.
+
+Каждый модуль запускается как ``python -m benchmarks.<имя>`` из корня
+проекта, работает офлайн на временной базе SQLite и печатает результат
+в JSON, чтобы его можно было сравнивать между коммитами.
+"""
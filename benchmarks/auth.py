@@ -0,0 +1,87 @@
+"""SQL-запросы на страницах заметок в обычном и быстром режиме входа.
+
+Для каждого режима (YANOTE_AUTH_MODE) в отдельном процессе заполняет
+временную базу, входит в систему и печатает число запросов и их список
+на списке заметок и странице заметки. Первый запрос после входа
+заполняет кеши и в замер не входит. Кеш страниц выключен, чтобы
+запросы самих view тоже попадали в замер.
+
+    python -m benchmarks.auth --requests 20
+"""
+import argparse
+import multiprocessing
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import dump, migrate, setup_django
+
+MODES = ('default', 'fast')
+TABLE = re.compile(r'FROM "(\w+)"')
+
+
+def measure(mode, requests):
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(
+            Path(directory) / 'db.sqlite3',
+            YANOTE_AUTH_MODE=mode,
+            YANOTE_NOTES_CACHE='0',
+        )
+        migrate()
+        from django.contrib.auth import get_user_model
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        from notes.models import Note
+
+        author = get_user_model().objects.create_user('benchmark', 'x')
+        note = Note.objects.create(
+            title='Заметка', text='Текст заметки', author=author
+        )
+        client = Client()
+        client.force_login(author)
+        result = {'mode': mode}
+        for name, url in (
+            ('list', reverse('notes:list')),
+            ('detail', reverse('notes:detail', args=(note.slug,))),
+        ):
+            client.get(url)
+            counts, timings = [], []
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    client.get(url)
+                    timings.append(time.perf_counter() - started)
+                counts.append(len(queries))
+            result[f'{name}_queries'] = max(counts)
+            result[f'{name}_tables'] = [
+                match.group(1) for match in (
+                    TABLE.search(query['sql']) for query in queries
+                ) if match
+            ]
+            result[f'{name}_ms'] = round(
+                statistics.median(timings) * 1000, 2
+            )
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--mode', choices=MODES, action='append',
+                        help='Режим входа; по умолчанию оба.')
+    options = parser.parse_args()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for mode in options.mode or MODES:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(measure, (mode, options.requests)))
+    dump(results)
+
+
+if __name__ == '__main__':
+    main()
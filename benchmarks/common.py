@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+
+def setup_django(db_path=None, **environ):
+    """Настраивает Django на отдельную базу и переменные окружения.
+
+    Вызывается до первого обращения к настройкам, в том числе
+    в каждом дочернем процессе.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yanote.settings')
+    if db_path is not None:
+        os.environ['YANOTE_DB_PATH'] = str(db_path)
+    os.environ.update(environ)
+    import django
+
+    django.setup()
+
+
+def migrate():
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+
+
+def dump(result):
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
@@ -0,0 +1,85 @@
+"""Сравнение шаблонизаторов Django и Jinja2 на страницах заметок.
+
+Выводит список из --notes заметок, страницу заметки и форму
+редактирования каждым движком и печатает медиану времени вывода.
+База данных не нужна: заметки создаются в памяти.
+
+    python -m benchmarks.engines --notes 10000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import dump, setup_django
+
+
+def median_ms(render, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def pages(notes):
+    from notes.forms import NoteForm
+    from notes.models import Note
+    from notes.pagination import KeysetPage
+    from notes.rendering import split_url
+
+    object_list = [
+        Note(id=number, slug=f'note-{number}', title=f'Заметка {number}')
+        for number in range(notes)
+    ]
+    note = Note(
+        id=1, slug='note-1', title='Заметка', text='Текст заметки. ' * 100
+    )
+    prefix, suffix = split_url('notes:detail')
+    return {
+        'notes/list.html': {
+            'object_list': object_list,
+            'page_obj': KeysetPage(object_list),
+            'detail_url_prefix': prefix,
+            'detail_url_suffix': suffix,
+        },
+        'notes/detail.html': {'note': note},
+        # Метки заданы заранее: иначе форма прочитала бы их из базы.
+        'notes/form.html': {
+            'form': NoteForm(instance=note, initial={'tags': 'работа, дом'}),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--notes', type=int, default=10_000,
+                        help='Заметок в списке.')
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.template import engines
+    from django.template.backends.jinja2 import Jinja2
+    from django.test import RequestFactory
+
+    params = dict(settings.JINJA2_TEMPLATES, NAME='jinja2')
+    del params['BACKEND']
+    backends = {'django': engines['django'], 'jinja2': Jinja2(params)}
+    request = RequestFactory().get('/notes/')
+    request.user = get_user_model()(pk=1, username='benchmark')
+    results = []
+    for name, context in pages(options.notes).items():
+        result = {'template': name}
+        for engine_name, engine in backends.items():
+            template = engine.get_template(name)
+            result[f'{engine_name}_ms'] = median_ms(
+                lambda: template.render(context, request), options.repeat
+            )
+        results.append(result)
+    dump(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Нагрузочный тест всех адресов notes.urls и users:.
+
+Заполняет временную базу набором пользователей и заметок, затем для
+каждого маршрута запускает несколько потоков с собственными клиентами
+(django.test.Client вызывает WSGI-приложение в том же процессе, сеть
+не нужна) и печатает в JSON пропускную способность, перцентили
+задержки, число SQL-запросов на запрос и пиковое потребление памяти.
+
+    python -m benchmarks.load --users 20 --notes 500 --concurrency 8
+    python -m benchmarks.load --output after.json --compare before.json
+"""
+import argparse
+import itertools
+import json
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.common import dump, migrate, setup_django
+
+# GET-параметры для маршрутов, которым они нужны.
+QUERY = {
+    'notes:search': {'q': 'заметка'},
+    'notes:export': {'format': 'jsonl'},
+    'notes:export_start': {'format': 'jsonl'},
+    'notes:api_changes': {'since': 0},
+}
+# Маршруты, которые открываются без входа в систему.
+ANONYMOUS = ('users:login', 'users:logout', 'users:signup')
+# Номер версии для адресов истории: первая версия есть у любой заметки.
+REVISION_NUMBER = 1
+
+
+def seed(users, notes_per_user):
+    from django.contrib.auth import get_user_model
+
+    from notes.bulk import create_notes
+    from notes.models import Note
+    from notes.tasks import enqueue, work
+
+    User = get_user_model()
+    authors = User.objects.bulk_create(
+        User(username=f'user{number}') for number in range(users)
+    )
+    authors = list(User.objects.order_by('id'))
+    for author in authors:
+        for start in range(0, notes_per_user, 1000):
+            create_notes([
+                Note(
+                    title=f'Заметка {number}',
+                    text=f'Текст заметки номер {number}. ' * 20,
+                    author=author,
+                )
+                for number in range(
+                    start, min(start + 1000, notes_per_user)
+                )
+            ])
+    # Готовая выгрузка для адресов tasks/<pk>/.
+    for author in authors:
+        enqueue(
+            'export', {'author_id': author.pk, 'file_format': 'jsonl'},
+            author=author,
+        )
+    work(threading.Event(), once=True)
+    return authors
+
+
+def collect_routes():
+    """Маршруты notes.urls и users:, которые открываются GET-запросом.
+
+    Для каждого маршрута возвращаются имена параметров адреса.
+    """
+    from notes import urls as notes_urls
+
+    routes = []
+    for pattern in notes_urls.urlpatterns:
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class and 'get' not in view_class.http_method_names:
+            continue
+        routes.append((
+            f'{notes_urls.app_name}:{pattern.name}',
+            tuple(pattern.pattern.converters),
+        ))
+    routes.extend((name, ()) for name in ANONYMOUS)
+    return routes
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def make_client(author):
+    from django.test import Client
+
+    client = Client()
+    if author is not None:
+        client.force_login(author)
+    return client
+
+
+def drive(route, params, authors, concurrency, requests):
+    from django.db import connection
+    from django.urls import reverse
+
+    from notes.models import Note, Task
+
+    local = threading.local()
+    thread_numbers = itertools.count()
+
+    def one_request(number):
+        if not hasattr(local, 'client'):
+            # Каждый поток работает от имени своего пользователя.
+            author = authors[next(thread_numbers) % len(authors)]
+            if route in ANONYMOUS:
+                author = None
+            local.client = make_client(author)
+            local.slugs = list(
+                Note.objects.filter(author=author)
+                .values_list('slug', flat=True)[:100]
+            ) if author and 'slug' in params else []
+            local.task_id = Task.objects.filter(author=author).values_list(
+                'pk', flat=True
+            ).first()
+        values = {'number': REVISION_NUMBER, 'pk': local.task_id}
+        if local.slugs:
+            values['slug'] = local.slugs[number % len(local.slugs)]
+        url = reverse(route, args=[values[name] for name in params])
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = local.client.get(url, QUERY.get(route, {}))
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        elapsed = time.perf_counter() - started
+        return elapsed, counter.count, response.status_code < 400
+
+    total = concurrency * requests
+    with ThreadPoolExecutor(concurrency) as pool:
+        # Прогрев: шаблоны, соединения с БД и клиенты потоков.
+        list(pool.map(one_request, range(concurrency)))
+        started = time.perf_counter()
+        results = list(pool.map(one_request, range(total)))
+        elapsed = time.perf_counter() - started
+    latencies = [result[0] * 1000 for result in results]
+    centiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': total,
+        'errors': sum(not result[2] for result in results),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(centiles[49], 3),
+        'p95_ms': round(centiles[94], 3),
+        'p99_ms': round(centiles[98], 3),
+        'queries_per_request': round(
+            statistics.mean(result[1] for result in results), 2
+        ),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """Отношение новых значений к базовым по каждому маршруту."""
+    diff = {}
+    for route, metrics in result['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        diff[route] = {
+            key: round(metrics[key] / before[key], 3)
+            for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+            if before.get(key)
+        }
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--notes', type=int, default=200,
+                        help='Заметок у каждого пользователя.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Запросов на поток для каждого маршрута.')
+    parser.add_argument('--route', action='append',
+                        help='Ограничить прогон этими маршрутами.')
+    parser.add_argument('--output', help='Записать JSON в файл.')
+    parser.add_argument('--compare', help='JSON предыдущего прогона.')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(
+            Path(directory) / 'load.sqlite3',
+            YANOTE_TASK_RESULTS_DIR=str(Path(directory) / 'task_results'),
+        )
+        migrate()
+        authors = seed(options.users, options.notes)
+        routes = {}
+        for route, params in collect_routes():
+            if options.route and route not in options.route:
+                continue
+            routes[route] = drive(
+                route, params, authors,
+                options.concurrency, options.requests,
+            )
+    result = {
+        'revision': git_revision(),
+        'config': {
+            'users': options.users,
+            'notes_per_user': options.notes,
+            'concurrency': options.concurrency,
+            'requests_per_thread': options.requests,
+        },
+        'routes': routes,
+        # На Linux ru_maxrss — в килобайтах.
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if options.compare:
+        with open(options.compare) as file:
+            result['compare'] = compare(result, json.load(file))
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    dump(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Время вывода Markdown-текста заметки без кеша и из кеша.
+
+Текст заметки из --paragraphs абзацев со списками, ссылками и кодом
+создаётся в памяти, база данных не нужна. Печатает медианы отрисовки
+без кеша (render_markdown) и повторного вывода через кеш (text_html).
+
+    python -m benchmarks.markdown --paragraphs 500 --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import dump, setup_django
+
+PARAGRAPH = """## Раздел {number}
+
+Текст с **выделением**, *курсивом*, `кодом`
+и [ссылкой](https://example.com/{number}), <b>с HTML</b>.
+
+- первый пункт
+- второй пункт
+
+> цитата
+"""
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--paragraphs', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+    setup_django()
+    from notes import markup
+    from notes.models import Note
+
+    text = '\n'.join(
+        PARAGRAPH.format(number=number)
+        for number in range(options.paragraphs)
+    )
+    note = Note(title='Markdown', text=text)
+    markup.get_cache().delete(markup.render_key(note))
+    dump({
+        'text_kb': round(len(text.encode()) / 1024, 1),
+        'render_ms': median_ms(
+            lambda: markup.render_markdown(note.text), options.repeat
+        ),
+        'cached_ms': median_ms(lambda: note.text_html, options.repeat),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Конкурентная запись и чтение заметок в SQLite.
+
+Запускает несколько процессов, которые одновременно создают заметки
+и читают список, сначала со стандартными настройками, затем
+с продакшен-профилем (YANOTE_SQLITE_PROFILE=production), и печатает
+пропускную способность и число ошибок "database is locked".
+
+    python -m benchmarks.sqlite_concurrency --workers 8 --writes 200
+"""
+import argparse
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import dump, setup_django
+
+PROFILES = ('default', 'production')
+
+
+def prepare(profile, db_path):
+    setup_django(db_path, YANOTE_SQLITE_PROFILE=profile)
+    from django.contrib.auth import get_user_model
+
+    from benchmarks.common import migrate
+
+    migrate()
+    return get_user_model().objects.create(username='benchmark').pk
+
+
+def work(profile, db_path, author_id, writes, reads, barrier):
+    setup_django(db_path, YANOTE_SQLITE_PROFILE=profile)
+    from django.db import OperationalError
+
+    from notes.models import Note
+
+    done = errors = 0
+    barrier.wait()
+    for number in range(writes):
+        try:
+            Note.objects.create(
+                title=f'Заметка {number}', text='Текст ' * 50,
+                author_id=author_id,
+            )
+            done += 1
+        except OperationalError:
+            errors += 1
+        for _ in range(reads):
+            try:
+                list(
+                    Note.objects.filter(author_id=author_id)
+                    .only('id', 'slug', 'title').order_by('-id')[:50]
+                )
+            except OperationalError:
+                errors += 1
+    return done, errors
+
+
+def run(profile, workers, writes, reads):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / 'benchmark.sqlite3'
+        with context.Pool(1) as pool:
+            author_id = pool.apply(prepare, (profile, db_path))
+        barrier = context.Manager().Barrier(workers + 1)
+        with context.Pool(workers) as pool:
+            results = pool.starmap_async(work, [
+                (profile, db_path, author_id, writes, reads, barrier)
+            ] * workers)
+            barrier.wait()
+            started = time.perf_counter()
+            results = results.get()
+            elapsed = time.perf_counter() - started
+    done = sum(result[0] for result in results)
+    return {
+        'profile': profile,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'writes': done,
+        'reads': done * reads,
+        'errors': sum(result[1] for result in results),
+        'writes_per_second': round(done / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--reads', type=int, default=5,
+                        help='Чтений списка на одну запись.')
+    parser.add_argument('--profile', choices=PROFILES, action='append',
+                        help='Профиль для замера; по умолчанию оба.')
+    options = parser.parse_args()
+    dump([
+        run(profile, options.workers, options.writes, options.reads)
+        for profile in options.profile or PROFILES
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Время вывода списка из 10 000 заметок.
+
+Для каждого режима шаблонов (YANOTE_TEMPLATE_MODE) в отдельном процессе
+измеряет первый вывод страницы вместе с компиляцией шаблонов и медиану
+повторных выводов. Для сравнения выводится тот же список со ссылками
+через {% url %} для каждой строки. База данных не нужна: заметки
+создаются в памяти.
+
+    python -m benchmarks.templates --notes 10000 --repeat 5
+"""
+import argparse
+import multiprocessing
+import statistics
+import time
+
+from benchmarks.common import dump, setup_django
+
+MODES = ('default', 'production')
+URL_PER_ROW = """{% extends "base.html" %}
+{% block content %}
+  <ul>
+    {% for note in object_list %}
+      <li>
+        {{ note.id }}:
+        <a href="{% url 'notes:detail' note.slug %}"> {{ note.title }}</a>
+      </li>
+    {% endfor %}
+  </ul>
+{% endblock content %}"""
+
+
+def timed(render):
+    started = time.perf_counter()
+    render()
+    return time.perf_counter() - started
+
+
+def measure(mode, notes, repeat):
+    setup_django(YANOTE_TEMPLATE_MODE=mode)
+    from django.contrib.auth import get_user_model
+    from django.template import engines
+    from django.template.loader import render_to_string
+    from django.test import RequestFactory
+
+    from notes.models import Note
+    from notes.rendering import split_url
+
+    request = RequestFactory().get('/notes/')
+    request.user = get_user_model()(pk=1, username='benchmark')
+    prefix, suffix = split_url('notes:detail')
+    context = {
+        'object_list': [
+            Note(id=number, slug=f'note-{number}', title=f'Заметка {number}')
+            for number in range(notes)
+        ],
+        'detail_url_prefix': prefix,
+        'detail_url_suffix': suffix,
+    }
+    url_per_row = engines['django'].from_string(URL_PER_ROW)
+
+    def render_list():
+        render_to_string('notes/list.html', context, request)
+
+    first = timed(render_list)
+    prefixed = [timed(render_list) for _ in range(repeat)]
+    per_row = [
+        timed(lambda: url_per_row.render(context, request))
+        for _ in range(repeat)
+    ]
+    return {
+        'mode': mode,
+        'notes': notes,
+        'first_render_ms': round(first * 1000, 1),
+        'render_ms': round(statistics.median(prefixed) * 1000, 1),
+        'url_per_row_render_ms': round(statistics.median(per_row) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--notes', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mode', choices=MODES, action='append',
+                        help='Режим шаблонов; по умолчанию оба.')
+    options = parser.parse_args()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for mode in options.mode or MODES:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(
+                measure, (mode, options.notes, options.repeat)
+            ))
+    dump(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,80 @@
 from django.contrib import admin
+from django.contrib.auth import get_permission_codename, get_user_model
+from django.contrib.auth.admin import UserAdmin
 
-from .models import Note
+from .models import AuthorStats, Note, Task
+from .search import (
+    build_match_expression, filter_by_text, is_supported, matching_ids
+)
+from .tasks import enqueue
 
-admin.site.register(Note)
+
+@admin.register(Note)
+class NoteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'slug', 'author')
+    search_fields = ('title', 'text')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по FTS5-индексу вместо сканирования всей таблицы."""
+        if not search_term:
+            return queryset, False
+        if not build_match_expression(search_term) or not is_supported():
+            return filter_by_text(queryset, search_term), False
+        return queryset.filter(id__in=matching_ids(search_term)), False
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ('author', 'note_count', 'text_length', 'last_modified')
+    list_select_related = ('author',)
+    ordering = ('-last_modified',)
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.unregister(get_user_model())
+
+
+@admin.register(get_user_model())
+class NotesUserAdmin(UserAdmin):
+    actions = ('purge_users',)
+
+    def has_delete_permission(self, request, obj=None):
+        """Пользователи удаляются только действием purge_users.
+
+        Стандартное удаление (страница удаления и delete_selected)
+        загружает все заметки пользователя и удаляет их каскадом одной
+        долгой транзакцией.
+        """
+        return False
+
+    def has_purge_permission(self, request):
+        """purge_users доступно тем, кому разрешено удалять пользователей."""
+        opts = self.opts
+        return request.user.has_perm(
+            f'{opts.app_label}.{get_permission_codename("delete", opts)}'
+        )
+
+    @admin.action(description='Удалить пользователей вместе с заметками '
+                              '(в фоне, частями)', permissions=['purge'])
+    def purge_users(self, request, queryset):
+        """Удаляет пользователей без долгой блокировки базы."""
+        users = list(queryset.values_list('pk', flat=True))
+        for user_id in users:
+            enqueue('purge_user', {'user_id': user_id})
+        self.message_user(
+            request,
+            f'Удаление пользователей поставлено в очередь: {len(users)}.',
+        )
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'author', 'created', 'finished'
+    )
+    list_filter = ('status', 'name')
+    list_select_related = ('author',)
+    readonly_fields = ('worker', 'heartbeat', 'result', 'error', 'finished')
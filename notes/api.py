@@ -0,0 +1,222 @@
+import hashlib
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import generic
+
+from .changes import FeedExpired, changes_since
+from .forms import WARNING, NoteForm
+from .models import Note
+from .pagination import keyset_paginate, parse_cursor
+
+API_PAGE_SIZE = 100
+# Поля формы, которые клиент может передать в теле запроса.
+WRITABLE_FIELDS = NoteForm.Meta.fields
+
+
+def serialize_note(note):
+    return {
+        'id': note.id,
+        'title': note.title,
+        'text': note.text,
+        'slug': note.slug,
+        'modified': note.modified.isoformat(),
+    }
+
+
+def note_etag(note_id, modified):
+    """Сильный ETag заметки: меняется при каждом сохранении."""
+    return quote_etag(f'{note_id}-{int(modified.timestamp() * 10 ** 6)}')
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, **payload):
+        self.status = status
+        self.payload = payload
+
+
+class NoteApiBase(LoginRequiredMixin, generic.View):
+    """Базовый класс JSON API: условные запросы и разбор тела запроса.
+
+    Подклассы возвращают из get_validators() пару (ETag, Last-Modified),
+    вычисленную одним лёгким запросом. Если клиент прислал подходящие
+    If-None-Match / If-Modified-Since (или устаревший If-Match), ответ
+    304 или 412 отдаётся без сериализации заметок. Ошибки, в том числе
+    из get_validators(), отдаются как JSON через ApiError.
+    """
+    raise_exception = True
+
+    def get_queryset(self):
+        return Note.objects.filter(author=self.request.user)
+
+    def get_validators(self):
+        return None, None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.kwargs = kwargs
+        try:
+            return self.conditional_dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse(error.payload, status=error.status)
+
+    def conditional_dispatch(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        conditional = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()),
+        )
+        if conditional is not None:
+            return conditional
+        response = super().dispatch(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            if etag and not response.has_header('ETag'):
+                response['ETag'] = etag
+            if last_modified and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(
+                    last_modified.timestamp()
+                )
+        return response
+
+    def handle_no_permission(self):
+        return JsonResponse(
+            {'detail': 'Требуется авторизация.'}, status=403
+        )
+
+    def get_form(self, instance=None):
+        try:
+            data = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise ApiError(400, detail='Некорректный JSON.')
+        if not isinstance(data, dict):
+            raise ApiError(400, detail='Ожидается JSON-объект.')
+        if instance is not None:
+            # Поля, которые клиент не прислал, остаются прежними.
+            data = {
+                **{field: getattr(instance, field)
+                   for field in WRITABLE_FIELDS},
+                **data,
+            }
+        return NoteForm(data, instance=instance)
+
+    def save_form(self, form, status):
+        if not form.is_valid():
+            raise ApiError(400, errors=form.errors)
+        try:
+            with transaction.atomic():
+                note = form.save()
+        except IntegrityError:
+            # Указанный slug заняли между проверкой формы и вставкой.
+            raise ApiError(
+                400, errors={'slug': [form.instance.slug + WARNING]}
+            )
+        response = JsonResponse(serialize_note(note), status=status)
+        response['ETag'] = note_etag(note.id, note.modified)
+        response['Last-Modified'] = http_date(note.modified.timestamp())
+        return response
+
+
+class NoteListApi(NoteApiBase):
+    """GET — список заметок пользователя, POST — создание заметки."""
+
+    def get_validators(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None, None
+        state = self.get_queryset().aggregate(
+            count=Count('id'), modified=Max('modified')
+        )
+        if state['modified'] is None:
+            return None, None
+        # Страница зависит и от курсоров, поэтому они входят в ETag.
+        key = '{count}-{stamp}-{query}'.format(
+            count=state['count'],
+            stamp=state['modified'].timestamp(),
+            query=self.request.GET.urlencode(),
+        )
+        return (
+            quote_etag(hashlib.md5(key.encode()).hexdigest()),
+            state['modified'],
+        )
+
+    def get(self, request, *args, **kwargs):
+        page = keyset_paginate(
+            self.get_queryset(),
+            API_PAGE_SIZE,
+            after=parse_cursor(request.GET.get('after')),
+            before=parse_cursor(request.GET.get('before')),
+        )
+        return JsonResponse({
+            'results': [serialize_note(note) for note in page],
+            'next': page.next_cursor,
+            'previous': page.prev_cursor,
+        })
+
+    def post(self, request, *args, **kwargs):
+        form = self.get_form()
+        form.instance.author = request.user
+        return self.save_form(form, status=201)
+
+
+class NoteDetailApi(NoteApiBase):
+    """GET, PUT и DELETE одной заметки с поддержкой ETag и If-Match."""
+
+    def get_validators(self):
+        state = self.get_queryset().filter(
+            slug=self.kwargs['slug']
+        ).values_list('id', 'modified').first()
+        if state is None:
+            raise ApiError(404, detail='Заметка не найдена.')
+        return note_etag(*state), state[1]
+
+    def get_object(self):
+        try:
+            return self.get_queryset().get(slug=self.kwargs['slug'])
+        except Note.DoesNotExist:
+            raise ApiError(404, detail='Заметка не найдена.')
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(serialize_note(self.get_object()))
+
+    def put(self, request, *args, **kwargs):
+        return self.save_form(
+            self.get_form(instance=self.get_object()), status=200
+        )
+
+    def delete(self, request, *args, **kwargs):
+        self.get_object().delete()
+        return HttpResponse(status=204)
+
+
+class NoteChangesApi(NoteApiBase):
+    """Изменения заметок пользователя после курсора ?since=."""
+
+    def get(self, request, *args, **kwargs):
+        since = parse_cursor(request.GET.get('since')) or 0
+        try:
+            changes, cursor, more = changes_since(request.user, since)
+        except FeedExpired:
+            raise ApiError(
+                410, detail='Курсор устарел, нужна полная синхронизация.'
+            )
+        return JsonResponse({
+            'changes': [
+                {
+                    'seq': entry.id,
+                    'action': entry.action,
+                    'id': entry.note_id,
+                    'slug': entry.slug,
+                    'note': note and serialize_note(note),
+                }
+                for entry, note in changes
+            ],
+            'cursor': cursor,
+            'more': more,
+        })
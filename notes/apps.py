@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class NotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notes'
+
+    def ready(self):
+        from . import signals
+        from .checks import check_compression, check_session_cache
+
+        checks.register(check_compression)
+        checks.register(check_session_cache)
+        post_migrate.connect(signals.create_search_index, sender=self)
+        if settings.TEMPLATE_MODE == 'production':
+            from .rendering import warm_templates
+
+            warm_templates()
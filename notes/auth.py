@@ -0,0 +1,33 @@
+"""Бэкенд аутентификации с кешем пользователей в памяти процесса."""
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+_users = {}
+
+
+def invalidate_user(user_id):
+    _users.pop(user_id, None)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который не читает пользователя на каждом запросе.
+
+    Пользователь из сессии берётся из кеша процесса, пока не истечёт
+    AUTH_USER_CACHE_TTL секунд. Сохранение пользователя (в том числе
+    смена пароля) и выход сбрасывают запись (см. notes.signals);
+    в других процессах она проживёт не дольше TTL. Каждый запрос
+    получает свою копию объекта.
+    """
+
+    def get_user(self, user_id):
+        entry = _users.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            entry = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, user)
+            _users[user_id] = entry
+        return copy.copy(entry[1])
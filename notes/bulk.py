@@ -0,0 +1,227 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, IntegrityError, connections, router
+)
+
+from .cache import invalidate_author
+from .changes import record_changes
+from .fields import CompressedText
+from .markup import evict_texts
+from .metrics import NOTE_WRITES
+from .models import Note, NoteChange, NoteRevision, SlugRegistry, atomic_for
+from .sharding import (
+    check_shard, for_author, register_notes, shard_for_author
+)
+from .slugs import MAX_ATTEMPTS, SlugAllocator, make_base
+from .stats import add_notes, aggregate_notes, remove_notes
+from .tags import release_tags
+
+# Ограничение на число параметров в одном запросе к SQLite.
+IN_CHUNK_SIZE = 500
+PURGE_BATCH_SIZE = 500
+# Пауза между пачками: за это время блокировку записи SQLite успевают
+# взять другие запросы.
+PURGE_PAUSE = 0.05
+
+
+def created_rows(notes):
+    """Строки (id, slug, author_id) только что вставленных заметок.
+
+    SQLite не возвращает id из bulk_create, поэтому они читаются
+    обратно по уникальному slug. При шардировании id заранее выдал
+    реестр slug.
+    """
+    if all(note.pk is not None for note in notes):
+        for note in notes:
+            yield note.pk, note.slug, note.author_id
+        return
+    slugs = [note.slug for note in notes]
+    for start in range(0, len(slugs), IN_CHUNK_SIZE):
+        yield from Note.objects.filter(
+            slug__in=slugs[start:start + IN_CHUNK_SIZE]
+        ).values_list('id', 'slug', 'author_id')
+
+
+def create_notes(notes):
+    """Создаёт пачку заметок одним bulk_create в транзакции.
+
+    Пустые slug подбираются по заголовку. Заданные приводятся к виду
+    slug (транслитерация, обрезка по длине) и, если заняты, молча
+    получают числовой суффикс, как и подобранные: импорт не падает
+    на совпадениях. Занятость для всей пачки проверяется одним
+    запросом. bulk_create не отправляет сигналы, поэтому журнал
+    изменений и кеш страниц авторов обновляются здесь. При шардировании
+    заметки каждого автора вставляются в его шард отдельной транзакцией.
+    """
+    if settings.NOTES_SHARDS:
+        by_author = defaultdict(list)
+        for note in notes:
+            by_author[note.author_id].append(note)
+        created = []
+        for author_id, group in by_author.items():
+            with for_author(author_id):
+                created += _create_notes(group)
+    else:
+        created = _create_notes(notes)
+    for author_id in {note.author_id for note in notes}:
+        invalidate_author(author_id)
+    NOTE_WRITES.inc(len(created), action=NoteChange.CREATED)
+    return created
+
+
+def _create_notes(notes):
+    max_length = Note._meta.get_field('slug').max_length
+    bases = [
+        make_base(note.slug or note.title, max_length) for note in notes
+    ]
+    using = router.db_for_write(Note)
+    for note in notes:
+        note.text_length = len(note.text)
+    for attempt in range(MAX_ATTEMPTS):
+        allocator = SlugAllocator(
+            SlugRegistry if settings.NOTES_SHARDS else Note
+        )
+        allocator.prefetch(bases)
+        for note, base in zip(notes, bases):
+            note.slug = allocator.allocate(base)
+        try:
+            with atomic_for(using):
+                if settings.NOTES_SHARDS:
+                    register_notes(notes)
+                created = Note.objects.using(using).bulk_create(notes)
+                record_changes(created_rows(notes), NoteChange.CREATED)
+                _add_stats(notes)
+            return created
+        except IntegrityError:
+            # Кто-то занял один из подобранных slug; подбираем заново.
+            for note in notes:
+                note.pk = None
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def _add_stats(notes):
+    by_author = defaultdict(list)
+    for note in notes:
+        by_author[note.author_id].append(note)
+    for author_id, author_notes in by_author.items():
+        add_notes(
+            author_id,
+            len(author_notes),
+            sum(note.text_length for note in author_notes),
+            max(note.modified for note in author_notes),
+        )
+
+
+def _delete_rows(rows, using):
+    """Удаляет заметки rows вместе с версиями по запросу на таблицу.
+
+    rows — кортежи (id, slug, author_id). Объекты не загружаются,
+    сигналы не отправляются: журнал, кеш страниц и метрики — забота
+    вызывающего. Метки, сводка автора и кеш HTML текстов обновляются
+    здесь.
+    """
+    ids = [row[0] for row in rows]
+    placeholders = ', '.join(['%s'] * len(ids))
+    notes = Note.objects.using(using).filter(id__in=ids)
+    removed = aggregate_notes(notes)
+    evict_texts(
+        text.decompress() if isinstance(text, CompressedText) else text
+        for text in notes.values_list('text', flat=True)
+    )
+    release_tags(ids, using)
+    NoteRevision.objects.using(using).filter(note_id__in=ids).delete()
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Note._meta.db_table} WHERE id IN ({placeholders})',
+            ids,
+        )
+    if settings.NOTES_SHARDS:
+        SlugRegistry.objects.filter(id__in=ids).delete()
+    for author_id, (count, length, latest) in removed.items():
+        remove_notes(author_id, count, length, latest, using)
+
+
+def delete_notes(author, ids):
+    """Удаляет заметки автора с id из ids одной транзакцией.
+
+    Чужие и несуществующие id пропускаются. Возвращает число удалённых
+    заметок.
+    """
+    using = router.db_for_write(Note, instance=author)
+    ids = list(ids)
+    deleted = 0
+    with atomic_for(using):
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            rows = list(
+                Note.objects.using(using).filter(
+                    author=author, id__in=ids[start:start + IN_CHUNK_SIZE]
+                ).values_list('id', 'slug', 'author_id')
+            )
+            if rows:
+                _delete_rows(rows, using)
+                record_changes(rows, NoteChange.DELETED)
+                deleted += len(rows)
+        if settings.NOTES_SHARDS:
+            check_shard(author.pk, using)
+    invalidate_author(author.pk)
+    NOTE_WRITES.inc(deleted, action=NoteChange.DELETED)
+    return deleted
+
+
+def purge_notes(author_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE,
+                tombstones=True):
+    """Удаляет все заметки автора пачками по batch_size.
+
+    Каждая пачка — отдельная короткая транзакция, между ними — пауза
+    pause секунд, поэтому остальные запросы ждут блокировку записи
+    не дольше одной пачки. Без tombstones удаление не попадает
+    в журнал изменений: так удаляются заметки удаляемого пользователя.
+    Возвращает число удалённых заметок.
+    """
+    using = (
+        shard_for_author(author_id) if settings.NOTES_SHARDS
+        else DEFAULT_DB_ALIAS
+    )
+    notes = Note.objects.using(using).filter(author_id=author_id)
+    deleted = 0
+    while True:
+        with atomic_for(using):
+            rows = list(
+                notes.order_by('id')
+                .values_list('id', 'slug', 'author_id')[:batch_size]
+            )
+            if not rows:
+                break
+            _delete_rows(rows, using)
+            if tombstones:
+                record_changes(rows, NoteChange.DELETED)
+            if settings.NOTES_SHARDS:
+                check_shard(author_id, using)
+        deleted += len(rows)
+        invalidate_author(author_id)
+        NOTE_WRITES.inc(len(rows), action=NoteChange.DELETED)
+        time.sleep(pause)
+    return deleted
+
+
+def purge_user(user, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE):
+    """Удаляет пользователя, сначала частями удалив заметки и журнал.
+
+    Каскадное удаление загрузило бы все заметки в память и удаляло
+    их одной долгой транзакцией.
+    """
+    purge_notes(user.pk, batch_size, pause, tombstones=False)
+    changes = NoteChange.objects.filter(author_id=user.pk)
+    while True:
+        ids = list(
+            changes.order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        NoteChange.objects.filter(id__in=ids).delete()
+        time.sleep(pause)
+    user.delete()
@@ -0,0 +1,93 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .metrics import PAGE_CACHE_HITS, PAGE_CACHE_MISSES
+
+VERSION_KEY = 'notes:version:{author_id}'
+# В записи — содержимое и заголовки ответа.
+PAGE_KEY = 'notes:response:{author_id}:{version}:{path}'
+
+
+def get_cache():
+    return caches[settings.NOTES_CACHE_ALIAS]
+
+
+def get_version_cache():
+    """Кеш версий, общий для всех процессов (NOTES_VERSION_CACHE_ALIAS)."""
+    return caches[settings.NOTES_VERSION_CACHE_ALIAS]
+
+
+def get_version(author_id):
+    """Текущая версия кеша автора; создаётся при первом обращении."""
+    cache = get_version_cache()
+    key = VERSION_KEY.format(author_id=author_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_author(author_id):
+    """Делает недействительными все закешированные страницы автора.
+
+    Старые записи не удаляются: ключи с прежней версией больше
+    не запрашиваются и вытесняются бэкендом кеша по таймауту.
+    """
+    get_version_cache().set(
+        VERSION_KEY.format(author_id=author_id), uuid.uuid4().hex, None
+    )
+
+
+def page_key(request):
+    author_id = request.user.pk
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(
+        author_id=author_id, version=get_version(author_id), path=path
+    )
+
+
+class CachedPageMixin:
+    """Отдаёт отрисованную страницу из кеша автора, если она там есть."""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.NOTES_CACHE_ENABLED:
+            return super().get(request, *args, **kwargs)
+        cache = get_cache()
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            PAGE_CACHE_HITS.inc()
+            content, headers = cached
+            response = HttpResponse(content)
+            for name, value in headers:
+                response[name] = value
+            return response
+        PAGE_CACHE_MISSES.inc()
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: cache.set(
+                    key,
+                    (rendered.content, list(rendered.items())),
+                    settings.NOTES_CACHE_TIMEOUT,
+                )
+            )
+        return response
+
+
+class InvalidateCacheMixin:
+    """После изменяющего запроса сбрасывает кеш страниц автора."""
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if (
+            request.user.is_authenticated
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+        ):
+            invalidate_author(request.user.pk)
+        return response
@@ -0,0 +1,100 @@
+from django.db.models import Exists, OuterRef
+
+from .models import ChangeFeedState, Note, NoteChange
+
+FEED_PAGE_SIZE = 500
+COMPACT_BATCH_SIZE = 1000
+
+
+class FeedExpired(Exception):
+    """Курсор старше сжатой части журнала: нужна полная синхронизация."""
+
+
+def record_change(note, action):
+    NoteChange.objects.create(
+        author_id=note.author_id, note_id=note.id, slug=note.slug,
+        action=action,
+    )
+
+
+def record_changes(rows, action):
+    """Записывает изменения пачкой; rows — кортежи (id, slug, author_id)."""
+    NoteChange.objects.bulk_create(
+        NoteChange(
+            note_id=note_id, slug=slug, author_id=author_id, action=action
+        )
+        for note_id, slug, author_id in rows
+    )
+
+
+def changes_since(author, since, limit=FEED_PAGE_SIZE):
+    """Изменения заметок автора после курсора since.
+
+    Возвращает список пар (запись журнала, заметка или None для
+    удалённых), новый курсор и признак того, что есть ещё изменения.
+    Несколько изменений одной заметки схлопываются в последнее,
+    а данные берутся из текущего состояния заметки. Если заметку уже
+    удалили, она пропускается: надгробие придёт дальше по журналу.
+    """
+    compacted_through = ChangeFeedState.objects.values_list(
+        'compacted_through', flat=True
+    ).first() or 0
+    if 0 < since < compacted_through:
+        raise FeedExpired
+    entries = list(
+        NoteChange.objects.filter(author=author, id__gt=since)
+        .order_by('id')[:limit + 1]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {entry.note_id: entry for entry in entries}
+    notes = Note.objects.filter(author=author).in_bulk([
+        entry.note_id for entry in latest.values()
+        if entry.action != NoteChange.DELETED
+    ])
+    changes = []
+    for entry in sorted(latest.values(), key=lambda entry: entry.id):
+        if entry.action == NoteChange.DELETED:
+            changes.append((entry, None))
+        elif entry.note_id in notes:
+            changes.append((entry, notes[entry.note_id]))
+    cursor = entries[-1].id if entries else since
+    return changes, cursor, more
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = last_id = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)
+                   [:batch_size])
+        if not ids:
+            return deleted, last_id
+        NoteChange.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        last_id = ids[-1]
+
+
+def compact_changes(cutoff, batch_size=COMPACT_BATCH_SIZE):
+    """Удаляет из журнала записи старше cutoff.
+
+    Записи, за которыми у той же заметки есть более новые, не нужны
+    ни одному клиенту. Старые надгробия тоже удаляются, а их наибольший
+    номер запоминается: клиентам с более старым курсором придётся
+    синхронизироваться заново. Удаление идёт пачками, чтобы не держать
+    блокировку записи SQLite долго.
+    """
+    old = NoteChange.objects.filter(created__lt=cutoff)
+    superseded, _ = _delete_in_batches(
+        old.filter(Exists(NoteChange.objects.filter(
+            note_id=OuterRef('note_id'), id__gt=OuterRef('id')
+        ))),
+        batch_size,
+    )
+    tombstones, last_id = _delete_in_batches(
+        old.filter(action=NoteChange.DELETED), batch_size
+    )
+    if last_id:
+        state = ChangeFeedState.load()
+        state.compacted_through = max(state.compacted_through, last_id)
+        state.save(update_fields=('compacted_through',))
+    return superseded, tombstones
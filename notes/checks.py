@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.checks import Error
+
+from .fields import CODECS
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_compression(app_configs, **kwargs):
+    """NOTES_COMPRESSION должен называть доступный кодек или быть пустым."""
+    codec = settings.NOTES_COMPRESSION
+    if not codec or codec in CODECS:
+        return []
+    return [Error(
+        f'Неизвестный кодек NOTES_COMPRESSION: {codec!r}.',
+        hint=f'Доступны: {", ".join(sorted(CODECS))}; пустое значение '
+             'отключает сжатие.',
+        id='notes.E001',
+    )]
+
+
+def check_session_cache(app_configs, **kwargs):
+    """Сессии notes.sessions должны лежать в общем для процессов кеше."""
+    if settings.SESSION_ENGINE != 'notes.sessions':
+        return []
+    backend = settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'Кеш сессий {settings.SESSION_CACHE_ALIAS!r} не общий для '
+        'процессов сервера.',
+        hint='Выход в одном процессе не завершит сессию в остальных. '
+             'Укажите в SESSION_CACHE_ALIAS файловый кеш, Memcached '
+             'или Redis.',
+        id='notes.E002',
+    )]
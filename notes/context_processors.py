@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def templates(request):
+    """Время жизни кеша фрагментов шаблонов (0 — без кеша)."""
+    return {'fragment_cache_timeout': settings.TEMPLATE_FRAGMENT_TIMEOUT}
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import zipfile
+
+EXPORT_CHUNK_SIZE = 500
+FIELDS = ('id', 'title', 'slug', 'text')
+
+
+def iter_notes(queryset, chunk_size=None):
+    """Отдаёт заметки пачками по возрастанию id.
+
+    Каждая пачка — отдельный короткий запрос: один курсор, открытый
+    на всё время скачивания, держал бы в SQLite читающую транзакцию
+    и мешал записи остальным воркерам.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    last_id = 0
+    while True:
+        batch = list(
+            queryset.filter(id__gt=last_id).order_by('id')[:chunk_size]
+            .iterator(chunk_size=chunk_size)
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def export_jsonl(queryset):
+    for batch in iter_notes(queryset):
+        yield ''.join(
+            json.dumps(
+                {field: getattr(note, field) for field in FIELDS},
+                ensure_ascii=False,
+            ) + '\n'
+            for note in batch
+        )
+
+
+def export_csv(queryset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for batch in iter_notes(queryset):
+        for note in batch:
+            writer.writerow([getattr(note, field) for field in FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Без заметок заголовок всё равно должен попасть в ответ.
+    yield buffer.getvalue()
+
+
+class _ZipStream(io.RawIOBase):
+    """Файловый объект без seek: zipfile пишет в него, а мы забираем байты."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def export_markdown_zip(queryset):
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for batch in iter_notes(queryset):
+            for note in batch:
+                archive.writestr(
+                    f'{note.slug}.md', f'# {note.title}\n\n{note.text}\n'
+                )
+            yield stream.pop()
+    yield stream.pop()
+
+
+EXPORTERS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson', 'notes.jsonl'),
+    'csv': (export_csv, 'text/csv', 'notes.csv'),
+    'md': (export_markdown_zip, 'application/zip', 'notes.zip'),
+}
@@ -0,0 +1,136 @@
+"""Сжатое хранение больших текстов заметок.
+
+Текст длиннее NOTES_COMPRESS_THRESHOLD символов хранится в виде строки
+PREFIX + "<кодек>:<длина в байтах>:<base64>". Из базы такое значение
+приходит как CompressedText и распаковывается только при первом
+обращении к атрибуту модели, поэтому сохранение заметки без изменения
+текста не распаковывает и не сжимает его заново.
+"""
+import base64
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+PREFIX = '\x01'
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+
+try:
+    # zstd есть в стандартной библиотеке начиная с Python 3.14.
+    from compression import zstd
+except ImportError:
+    pass
+else:
+    CODECS['zstd'] = (zstd.compress, zstd.decompress)
+
+
+class CompressedText:
+    """Сжатое значение из базы данных."""
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __repr__(self):
+        return f'<CompressedText {self.codec}, {self.size} bytes>'
+
+    def _split(self):
+        return self.raw[len(PREFIX):].split(':', 2)
+
+    @property
+    def codec(self):
+        return self._split()[0]
+
+    @property
+    def size(self):
+        """Размер исходного текста в байтах UTF-8."""
+        return int(self._split()[1])
+
+    def decompress(self):
+        codec, _, payload = self._split()
+        return CODECS[codec][1](base64.b64decode(payload)).decode()
+
+
+def compress(text, codec):
+    if codec not in CODECS:
+        # Обычно ловится при старте проверкой notes.E001.
+        raise ImproperlyConfigured(f'Неизвестный кодек сжатия: {codec!r}.')
+    data = text.encode()
+    payload = base64.b64encode(CODECS[codec][0](data)).decode('ascii')
+    return f'{PREFIX}{codec}:{len(data)}:{payload}'
+
+
+def prepare_text(text):
+    """Значение для записи в базу: сжатое, если это выгодно.
+
+    Текст, который сам начинается с PREFIX, сжимается всегда, чтобы его
+    нельзя было принять за сжатое значение.
+    """
+    codec = settings.NOTES_COMPRESSION
+    if text.startswith(PREFIX):
+        return compress(text, codec or 'zlib')
+    if not codec or len(text) < settings.NOTES_COMPRESS_THRESHOLD:
+        return text
+    compressed = compress(text, codec)
+    if len(compressed) >= len(text.encode()):
+        return text
+    return compressed
+
+
+def decompress_text(value):
+    """Исходный текст для хранимого значения (функция note_text в SQLite)."""
+    if value is None or not value.startswith(PREFIX):
+        return value
+    return CompressedText(value).decompress()
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """Распаковывает текст при первом обращении к атрибуту.
+
+    Дескриптор данных (с __set__), иначе значение бралось бы напрямую
+    из __dict__ экземпляра в обход __get__.
+    """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = value.decompress()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """Текстовое поле, которое сжимает большие значения."""
+    descriptor_class = CompressedTextDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if value is not None and value.startswith(PREFIX):
+            return CompressedText(value)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, CompressedText):
+            return value.decompress()
+        return super().to_python(value)
+
+    def get_prep_value(self, value):
+        if isinstance(value, CompressedText):
+            return value.raw
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return prepare_text(value)
+
+    def pre_save(self, model_instance, add):
+        # Неизменённое сжатое значение сохраняется как есть.
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
@@ -1,28 +1,68 @@
-from pytils.translit import slugify
-
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import router
 
-from .models import Note
+from .models import Note, SlugRegistry, Tag, atomic_for
+from .tags import MAX_TAGS, SEPARATOR, note_tags, parse_tags, set_tags
 
 WARNING = ' - такой slug уже существует, придумайте уникальное значение!'
 
 
 class NoteForm(forms.ModelForm):
     """Форма для создания или обновления заметки."""
+    tags = forms.CharField(
+        label='Метки',
+        required=False,
+        help_text='Перечислите метки через запятую',
+    )
 
     class Meta:
         model = Note
         fields = ('title', 'text', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None and 'tags' not in self.initial:
+            self.initial['tags'] = f'{SEPARATOR} '.join(
+                note_tags(self.instance)
+            )
+
+    def clean_tags(self):
+        names = parse_tags(self.cleaned_data['tags'])
+        if len(names) > MAX_TAGS:
+            raise ValidationError(f'Не больше {MAX_TAGS} меток.')
+        max_length = Tag._meta.get_field('name').max_length
+        too_long = [name for name in names if len(name) > max_length]
+        if too_long:
+            raise ValidationError(
+                f'Метка длиннее {max_length} символов: {too_long[0]}'
+            )
+        return names
+
+    def save(self, commit=True):
+        """Сохраняет заметку и её метки одной транзакцией.
+
+        Метки меняются, только если поле tags пришло в данных формы:
+        клиент API, не передавший его, прежние метки не теряет.
+        """
+        if not commit or 'tags' not in self.data:
+            return super().save(commit)
+        with atomic_for(router.db_for_write(Note, instance=self.instance)):
+            note = super().save()
+            set_tags(note, self.cleaned_data['tags'])
+        return note
+
     def clean_slug(self):
-        """Обрабатывает случай, если slug не уникален."""
-        cleaned_data = super().clean()
-        slug = cleaned_data.get('slug')
-        if not slug:
-            title = cleaned_data.get('title')
-            slug = slugify(title)[:100]
-        if Note.objects.filter(
+        """Обрабатывает случай, если slug не уникален.
+
+        Пустой slug остаётся пустым: свободное значение по заголовку
+        подберёт модель при сохранении. При шардировании slug
+        проверяется по общему реестру.
+        """
+        slug = self.cleaned_data.get('slug')
+        model = SlugRegistry if settings.NOTES_SHARDS else Note
+        if slug and model.objects.filter(
                 slug=slug
         ).exclude(id=self.instance.pk).exists():
             raise ValidationError(slug + WARNING)
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.changes import COMPACT_BATCH_SIZE, compact_changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Сжимает журнал изменений заметок: удаляет устаревшие записи '
+        'и надгробия старше заданного срока.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Сколько дней хранить записи журнала.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=COMPACT_BATCH_SIZE,
+            help='Сколько записей удалять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        superseded, tombstones = compact_changes(
+            cutoff, options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено устаревших записей: {superseded}, '
+            f'надгробий: {tombstones}.'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from notes.fields import CompressedText
+from notes.models import Note
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько места экономит сжатие текстов заметок.'
+
+    def handle(self, *args, **options):
+        total = compressed = stored = original = 0
+        texts = Note.objects.values_list('text', flat=True)
+        for text in texts.iterator(chunk_size=CHUNK_SIZE):
+            total += 1
+            if isinstance(text, CompressedText):
+                compressed += 1
+                stored += len(text.raw.encode())
+                original += text.size
+            else:
+                size = len(text.encode())
+                stored += size
+                original += size
+        saved = original - stored
+        ratio = original / stored if stored else 1
+        self.stdout.write(
+            f'Заметок: {total}, сжато: {compressed}.\n'
+            f'Исходный размер текстов: {original} байт, '
+            f'в базе: {stored} байт.\n'
+            f'Сэкономлено: {saved} байт (в {ratio:.1f} раза меньше).'
+        )
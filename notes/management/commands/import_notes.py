@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.bulk import create_notes
+from notes.models import Note
+from notes.sharding import for_author
+from notes.tasks import enqueue
+
+FORMATS = ('jsonl', 'csv')
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково импортирует заметки из JSONL или CSV. Каждая запись '
+        'содержит title, text и необязательные slug и author (username); '
+        'занятый slug получает числовой суффикс. '
+        'После каждой пачки позиция сохраняется в файл контрольной точки, '
+        'и повторный запуск продолжает импорт с неё, пропуская уже '
+        'записанные заметки первой пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с заметками.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--author',
+            help='Автор для записей, в которых он не указан.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество заметок в одной транзакции.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; по умолчанию <path>.checkpoint.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Игнорировать контрольную точку и начать сначала.',
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Поставить импорт в очередь фоновых задач (run_workers).',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        if file_format not in FORMATS:
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format.'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        if options['background']:
+            task = enqueue('import', {
+                'path': os.path.abspath(path),
+                'format': file_format,
+                'author': options['author'],
+                'batch_size': options['batch_size'],
+                'checkpoint': options['checkpoint'],
+                'restart': options['restart'],
+            })
+            self.stdout.write(self.style.SUCCESS(
+                f'Импорт поставлен в очередь, задача {task.pk}.'
+            ))
+            return
+        self.checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        self.authors = {}
+        self.default_author = options['author']
+        done = None if options['restart'] else self.read_checkpoint()
+        # Пачку после контрольной точки могли записать в базу, но не
+        # успеть сохранить точку: её заметки проверяются на повтор.
+        resumed = done is not None
+        done = done or 0
+        if done:
+            self.stdout.write(f'Продолжаем импорт с записи {done + 1}.')
+        self.write_checkpoint(done)
+
+        started = time.monotonic()
+        imported = 0
+        with open(path, newline='', encoding='utf-8') as source:
+            records = islice(
+                self.read_records(source, file_format), done, None
+            )
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                notes = [
+                    self.build_note(record, done + number)
+                    for number, record in enumerate(batch, start=1)
+                ]
+                if resumed:
+                    notes = self.skip_imported(notes)
+                    resumed = False
+                create_notes(notes)
+                done += len(batch)
+                imported += len(notes)
+                self.write_checkpoint(done)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Импортировано {imported} (всего {done}), '
+                    f'{imported / elapsed:.0f} заметок/с'
+                )
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: {imported} заметок.'
+        ))
+
+    def read_records(self, source, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+    def build_note(self, record, number):
+        username = record.get('author') or self.default_author
+        if not username:
+            raise CommandError(
+                f'Запись {number}: не указан автор, используйте --author.'
+            )
+        return Note(
+            title=record.get('title') or Note._meta.get_field('title').default,
+            text=record.get('text') or '',
+            slug=record.get('slug') or '',
+            author_id=self.get_author_id(username, number),
+        )
+
+    def get_author_id(self, username, number):
+        if username not in self.authors:
+            user = get_user_model().objects.filter(
+                username=username
+            ).values_list('pk', flat=True).first()
+            if user is None:
+                raise CommandError(
+                    f'Запись {number}: пользователь {username} не найден.'
+                )
+            self.authors[username] = user
+        return self.authors[username]
+
+    def skip_imported(self, notes):
+        """Убирает заметки, которые уже есть у автора.
+
+        Повтором считается заметка с тем же заголовком и текстом: slug
+        мог измениться при импорте, если был занят.
+        """
+        titles = defaultdict(set)
+        for note in notes:
+            titles[note.author_id].add(note.title)
+        existing = set()
+        for author_id, author_titles in titles.items():
+            with for_author(author_id):
+                existing.update(
+                    (author_id, note.title, note.text)
+                    for note in Note.objects.filter(
+                        author_id=author_id, title__in=author_titles
+                    ).only('title', 'text')
+                )
+        return [
+            note for note in notes
+            if (note.author_id, note.title, note.text) not in existing
+        ]
+
+    def read_checkpoint(self):
+        """Число обработанных записей или None, если импорт не начат."""
+        try:
+            with open(self.checkpoint) as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return None
+
+    def write_checkpoint(self, done):
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            file.write(str(done))
+        os.replace(temporary, self.checkpoint)
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.sharding import MOVE_BATCH_SIZE, move_author, shard_for_author
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит заметки пользователя в другой шард, не прерывая '
+        'его работу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Имя пользователя.')
+        parser.add_argument('shard', help='База данных из NOTES_SHARDS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=MOVE_BATCH_SIZE,
+            help='Сколько заметок копировать одной транзакцией.',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.NOTES_SHARDS:
+            raise CommandError('Шардирование не включено.')
+        target = options['shard']
+        if target not in settings.NOTES_SHARDS:
+            raise CommandError(
+                f'Неизвестный шард {target}; доступны: '
+                f'{", ".join(settings.NOTES_SHARDS)}.'
+            )
+        try:
+            author = get_user_model().objects.get_by_natural_key(
+                options['username']
+            )
+        except get_user_model().DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        source = shard_for_author(author.pk)
+        moved = move_author(author.pk, target, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено заметок из {source} в {target}: {moved}.'
+        ))
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.profiling import get_directory, list_profiles, summarize
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает сохранённые профили медленных запросов. Без аргументов '
+        'выводит список, с именем файла или --latest — сводку профиля.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Имя файла профиля.')
+        parser.add_argument(
+            '--latest', action='store_true',
+            help='Показать сводку самого свежего профиля.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=25,
+            help='Сколько функций показывать в сводке.',
+        )
+        parser.add_argument(
+            '--sort', choices=SORT_KEYS, default='cumulative',
+            help='Порядок функций в сводке.',
+        )
+
+    def handle(self, *args, **options):
+        profiles = list_profiles()
+        if options['name'] or options['latest']:
+            if options['latest']:
+                if not profiles:
+                    raise CommandError('Профилей пока нет.')
+                path = profiles[0]
+            else:
+                path = get_directory() / options['name']
+                if not path.is_file():
+                    raise CommandError(f'Профиль {path} не найден.')
+            self.stdout.write(summarize(
+                path, limit=options['limit'], sort=options['sort']
+            ))
+            return
+        for path in profiles:
+            stat = path.stat()
+            modified = datetime.fromtimestamp(stat.st_mtime)
+            self.stdout.write(
+                f'{modified:%Y-%m-%d %H:%M:%S}  '
+                f'{stat.st_size // 1024:>6} КиБ  {path.name}'
+            )
+        self.stdout.write(f'Всего профилей: {len(profiles)}.')
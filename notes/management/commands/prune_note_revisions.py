@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from notes.revisions import PRUNE_BATCH_SIZE, prune_revisions
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет старые версии заметок: сверх заданного числа последних '
+        'и (или) старше заданного срока.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int,
+            help='Сколько последних версий хранить у каждой заметки.',
+        )
+        parser.add_argument(
+            '--days', type=int,
+            help='Удалить версии старше этого числа дней.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=PRUNE_BATCH_SIZE,
+            help='Сколько версий удалять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        keep, days = options['keep'], options['days']
+        if keep is None and days is None:
+            raise CommandError('Укажите --keep и (или) --days.')
+        if keep is not None and keep < 1:
+            raise CommandError('--keep должен быть не меньше 1.')
+        before = None
+        if days is not None:
+            before = timezone.now() - timedelta(days=days)
+        deleted = sum(
+            prune_revisions(keep, before, options['batch_size'], using)
+            for using in settings.NOTES_SHARDS or [DEFAULT_DB_ALIAS]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено версий: {deleted}.'
+        ))
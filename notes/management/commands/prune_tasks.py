@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.tasks import prune_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет завершённые фоновые задачи старше --days дней вместе '
+        'с файлами выгрузок, а также файлы задач, которых уже нет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.TASK_KEEP_DAYS,
+            help='Сколько дней хранить завершённые задачи.',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days не может быть отрицательным.')
+        removed = prune_tasks(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено задач: {removed}.'))
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.bulk import PURGE_BATCH_SIZE, PURGE_PAUSE, purge_user
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет пользователя и его заметки пачками, не блокируя базу '
+        'надолго.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Имя пользователя.')
+        parser.add_argument(
+            '--batch-size', type=int, default=PURGE_BATCH_SIZE,
+            help='Сколько заметок удалять одной транзакцией.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=PURGE_PAUSE,
+            help='Пауза между пачками, секунды.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get_by_natural_key(
+                options['username']
+            )
+        except get_user_model().DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        count = user.note_set.count()
+        purge_user(user, options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователь {options["username"]} удалён, '
+            f'заметок: {count}.'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from notes.search import (
+    ensure_search_index, is_supported, rebuild_search_index
+)
+from notes.tasks import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс заметок (SQLite FTS5).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='База данных, в которой перестраивается индекс.',
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Поставить перестройку в очередь фоновых задач.',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not is_supported(connection):
+            raise CommandError(
+                'Полнотекстовый индекс поддерживается только для SQLite.'
+            )
+        if options['background']:
+            task = enqueue('reindex', {'database': options['database']})
+            self.stdout.write(self.style.SUCCESS(
+                f'Перестройка индекса поставлена в очередь, задача {task.pk}.'
+            ))
+            return
+        ensure_search_index(connection)
+        rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS('Индекс заметок перестроен.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from notes.stats import RECONCILE_BATCH_SIZE, reconcile_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводку по заметкам авторов и исправляет '
+        'расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=RECONCILE_BATCH_SIZE,
+            help='Сколько авторов проверять одной транзакцией.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_stats(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено сводок: {fixed}.'
+        ))
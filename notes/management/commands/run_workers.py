@@ -0,0 +1,110 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class StopFlag:
+    """Флаг остановки, общий для процессов пула.
+
+    Работает без блокировок, в отличие от multiprocessing.Event:
+    процесс, убитый во время ожидания, не мешает остановить остальные.
+    """
+
+    def __init__(self, context):
+        self.value = context.RawValue('b', 0)
+
+    def set(self):
+        self.value.value = 1
+
+    def is_set(self):
+        return bool(self.value.value)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return self.is_set()
+
+
+def run_worker(stop, once):
+    """Процесс пула: выполняет задачи, пока не установлено событие stop.
+
+    Процесс запускается методом spawn, поэтому сам настраивает Django.
+    Ctrl+C и SIGTERM получает вся группа процессов, а останавливает их
+    родитель: начатая задача доводится до конца.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    import django
+    django.setup()
+    from notes.tasks import work
+    work(stop, once=once)
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает пул процессов, выполняющих фоновые задачи из очереди '
+        'в базе данных. Упавший процесс перезапускается, его задачу '
+        'забирает другой процесс. Раз в TASK_PRUNE_INTERVAL секунд '
+        'в очередь ставится очистка старых задач.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.TASK_WORKERS,
+            help='Число процессов.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Завершиться, когда готовых задач не останется.',
+        )
+
+    def restart_dead(self, processes, start):
+        for number, process in enumerate(processes):
+            if not process.is_alive():
+                self.stderr.write(
+                    f'Процесс {process.pid} завершился с кодом '
+                    f'{process.exitcode}, перезапускаем.'
+                )
+                processes[number] = start()
+
+    def handle(self, *args, **options):
+        # Модуль импортируется дочерними процессами до django.setup().
+        from notes.tasks import schedule
+
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть положительным.')
+        context = multiprocessing.get_context('spawn')
+        stop = StopFlag(context)
+        # SIGTERM останавливает пул так же, как Ctrl+C.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        def start():
+            process = context.Process(
+                target=run_worker, args=(stop, options['once'])
+            )
+            process.start()
+            return process
+
+        schedule('prune_tasks')
+        pruned = time.monotonic()
+        processes = [start() for _ in range(options['workers'])]
+        self.stdout.write(f'Запущено процессов: {len(processes)}.')
+        try:
+            while True:
+                time.sleep(settings.TASK_POLL_INTERVAL)
+                if options['once']:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                self.restart_dead(processes, start)
+                if time.monotonic() - pruned >= settings.TASK_PRUNE_INTERVAL:
+                    schedule('prune_tasks')
+                    pruned = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        stop.set()
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Процессы остановлены.'))
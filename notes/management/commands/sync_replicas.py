@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик для чтения '
+        '(YANOTE_REPLICA_PATHS). С --interval повторяет копирование.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Повторять копирование каждые N секунд.',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_PATHS:
+            raise CommandError('Реплики не настроены.')
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Копирование поддерживается только для SQLite.')
+        while True:
+            started = time.perf_counter()
+            for path in settings.REPLICA_PATHS:
+                self.sync(connection, Path(path))
+            self.stdout.write(
+                f'Реплик обновлено: {len(settings.REPLICA_PATHS)} за '
+                f'{time.perf_counter() - started:.2f} с.'
+            )
+            if not options['interval']:
+                return
+            connection.close()
+            time.sleep(options['interval'])
+
+    def sync(self, connection, path):
+        """Снимает копию через backup API и атомарно подменяет файл.
+
+        Читатели с уже открытым соединением дочитывают старый файл.
+        Копия переводится в журнал DELETE, чтобы открываться только
+        на чтение без файлов -wal и -shm.
+        """
+        temporary = path.with_name(f'.{path.name}.tmp')
+        connection.ensure_connection()
+        target = sqlite3.connect(temporary)
+        try:
+            connection.connection.backup(target)
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        os.replace(temporary, path)
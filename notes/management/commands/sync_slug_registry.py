@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.sharding import sync_registry
+
+
+class Command(BaseCommand):
+    help = 'Добавляет в реестр slug заметки, которых в нём ещё нет.'
+
+    def handle(self, *args, **options):
+        if not settings.NOTES_SHARDS:
+            raise CommandError('Шардирование не включено.')
+        added = sync_registry()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено в реестр: {added}.'
+        ))
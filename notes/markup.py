@@ -0,0 +1,187 @@
+"""Markdown в тексте заметок.
+
+Поддерживается подмножество Markdown: заголовки, абзацы, списки,
+цитаты, блоки кода, выделение, код в строке и ссылки. Каждый фрагмент
+текста экранируется до разметки, поэтому HTML из заметки выводится
+как текст, а ссылки допускаются только на http(s), mailto
+и относительные адреса.
+
+Отрисованный HTML кешируется по SHA-256 текста, поэтому повторный
+показ стоит одного чтения из кеша. Изменённый текст получает новый
+ключ, прежние записи вытесняются по NOTES_MARKDOWN_CACHE_TIMEOUT,
+а запись удалённой заметки удаляется сразу.
+"""
+import hashlib
+import html
+import re
+
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from .cache import get_cache
+
+# Меняется вместе с правилами разметки, чтобы не отдавать старый HTML.
+MARKUP_VERSION = 1
+RENDER_KEY = 'notes:markdown:{version}:{digest}'
+SAFE_SCHEMES = frozenset({'http', 'https', 'mailto'})
+
+FENCE = re.compile(r'^\s*```')
+HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+QUOTE = re.compile(r'^\s*>\s?(.*)$')
+LISTS = (
+    ('ul', re.compile(r'^\s*[-*+]\s+(.*)$')),
+    ('ol', re.compile(r'^\s*\d+[.)]\s+(.*)$')),
+)
+INLINE = re.compile(
+    r'`([^`]+)`'
+    r'|\[([^\]]+)\]\(([^)\s]+)\)'
+    r'|\*\*(.+?)\*\*'
+    r'|\*(.+?)\*'
+)
+SCHEME = re.compile(r'([^/?#]*):')
+
+
+def is_safe_url(url):
+    """Адрес без схемы (относительный) или с разрешённой схемой."""
+    match = SCHEME.match(url)
+    return match is None or match.group(1).lower() in SAFE_SCHEMES
+
+
+def _replace(match):
+    code, label, url, strong, emphasis = match.groups()
+    if code is not None:
+        return f'<code>{code}</code>'
+    if strong is not None:
+        return f'<strong>{_format(strong)}</strong>'
+    if emphasis is not None:
+        return f'<em>{_format(emphasis)}</em>'
+    if not is_safe_url(html.unescape(url)):
+        return _format(label)
+    return f'<a href="{url}" rel="nofollow">{_format(label)}</a>'
+
+
+def _format(escaped):
+    return INLINE.sub(_replace, escaped)
+
+
+def render_inline(text):
+    return _format(html.escape(text))
+
+
+def _list_match(line):
+    for tag, pattern in LISTS:
+        match = pattern.match(line)
+        if match:
+            return tag, match.group(1)
+    return None, None
+
+
+def _fenced(lines, index):
+    code = []
+    while index < len(lines) and not FENCE.match(lines[index]):
+        code.append(lines[index])
+        index += 1
+    code = html.escape('\n'.join(code))
+    return f'<pre><code>{code}</code></pre>', index + 1
+
+
+def _quoted(lines, index):
+    quoted = []
+    while index < len(lines) and QUOTE.match(lines[index]):
+        quoted.append(QUOTE.match(lines[index]).group(1))
+        index += 1
+    return f'<blockquote>{_render_blocks(quoted)}</blockquote>', index
+
+
+def _listed(lines, index, tag):
+    items = []
+    while index < len(lines):
+        item_tag, item = _list_match(lines[index])
+        if item_tag != tag:
+            break
+        items.append(f'<li>{render_inline(item)}</li>')
+        index += 1
+    return f'<{tag}>{"".join(items)}</{tag}>', index
+
+
+def _block(lines, index):
+    """Блок со строки index и номер строки после него.
+
+    Для строки абзаца возвращает None вместо блока.
+    """
+    line = lines[index]
+    if FENCE.match(line):
+        return _fenced(lines, index + 1)
+    heading = HEADING.match(line)
+    if heading:
+        level = len(heading.group(1))
+        text = render_inline(heading.group(2))
+        return f'<h{level}>{text}</h{level}>', index + 1
+    if QUOTE.match(line):
+        return _quoted(lines, index)
+    tag, _ = _list_match(line)
+    if tag:
+        return _listed(lines, index, tag)
+    return None, index + 1
+
+
+def _paragraph(lines):
+    return f'<p>{render_inline(chr(10).join(lines))}</p>'
+
+
+def _render_blocks(lines):
+    blocks = []
+    paragraph = []
+    index = 0
+    while index < len(lines):
+        if lines[index].strip():
+            block, next_index = _block(lines, index)
+        else:
+            block, next_index = '', index + 1
+        if block is None:
+            paragraph.append(lines[index])
+        else:
+            if paragraph:
+                blocks.append(_paragraph(paragraph))
+                paragraph = []
+            if block:
+                blocks.append(block)
+        index = next_index
+    if paragraph:
+        blocks.append(_paragraph(paragraph))
+    return '\n'.join(blocks)
+
+
+def render_markdown(text):
+    """Безопасный HTML для текста в Markdown."""
+    return _render_blocks(text.replace('\r\n', '\n').split('\n'))
+
+
+def text_key(text):
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return RENDER_KEY.format(version=MARKUP_VERSION, digest=digest)
+
+
+def render_key(note):
+    return text_key(note.text)
+
+
+def render_note_text(note):
+    """HTML текста заметки из кеша; при промахе текст отрисовывается."""
+    cache = get_cache()
+    key = render_key(note)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = render_markdown(note.text)
+        cache.set(key, rendered, settings.NOTES_MARKDOWN_CACHE_TIMEOUT)
+    return mark_safe(rendered)
+
+
+def evict_note_text(note):
+    """Убирает из кеша HTML текста удалённой заметки."""
+    get_cache().delete(render_key(note))
+
+
+def evict_texts(texts):
+    """Пакетный evict_note_text по текстам удалённых заметок."""
+    get_cache().delete_many([text_key(text) for text in texts])
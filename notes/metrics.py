@@ -0,0 +1,255 @@
+"""Метрики в формате Prometheus без внешних зависимостей.
+
+Каждый процесс копит значения в памяти. Если задана настройка
+METRICS_DIR, процесс периодически сбрасывает их в свой файл в этом
+каталоге, а /metrics суммирует файлы всех процессов — так видны
+значения со всех WSGI-воркеров, какой бы из них ни обработал запрос.
+Каталог стоит очищать при перезапуске сервиса.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{_escape(value)}"' for name, value in labels
+    ) + '}'
+
+
+def _format_number(value):
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def empty(self):
+        return 0.0
+
+    def inc(self, amount=1, **labels):
+        REGISTRY.update(self, labels, lambda value: value + amount)
+
+    @staticmethod
+    def merge(left, right):
+        return left + right
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def empty(self):
+        # Счётчики по корзинам (последняя — +Inf), сумма и количество.
+        return [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+
+        def add(state):
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+            return state
+
+        REGISTRY.update(self, labels, add)
+
+    @staticmethod
+    def merge(left, right):
+        return [a + b for a, b in zip(left, right)]
+
+    def samples(self, labels, state):
+        cumulative = 0
+        bounds = [*map(_format_number, self.buckets), '+Inf']
+        for bound, count in zip(bounds, state):
+            cumulative += count
+            yield f'{self.name}_bucket', (*labels, ('le', bound)), cumulative
+        yield f'{self.name}_sum', labels, state[-2]
+        yield f'{self.name}_count', labels, state[-1]
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.values = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _reset_after_fork(self):
+        # Дочерний процесс не должен повторно отчитываться
+        # значениями родителя и писать в его файл.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.values = {}
+            self.filename = f'{self.pid}-{uuid.uuid4().hex[:8]}.json'
+            self.flushed = time.monotonic()
+
+    def update(self, metric, labels, function):
+        key = tuple(str(labels.get(name, '')) for name in metric.labelnames)
+        with self.lock:
+            self._reset_after_fork()
+            values = self.values.setdefault(metric.name, {})
+            values[key] = function(values.get(key, metric.empty()))
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            self._reset_after_fork()
+            return json.loads(json.dumps({
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self.values.items()
+            }))
+
+    def maybe_flush(self):
+        directory = settings.METRICS_DIR
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if directory and time.monotonic() - self.flushed >= interval:
+            self.flush()
+
+    def flush(self):
+        """Сохраняет значения процесса в его файл в METRICS_DIR."""
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        snapshot = self.snapshot()
+        temporary = directory / f'.{self.filename}.tmp'
+        temporary.write_text(json.dumps(snapshot))
+        os.replace(temporary, directory / self.filename)
+        self.flushed = time.monotonic()
+
+    def collect(self):
+        """Значения всех процессов, сложенные по метрикам и меткам."""
+        snapshots = [self.snapshot()]
+        if settings.METRICS_DIR:
+            own = self.filename
+            for path in Path(settings.METRICS_DIR).glob('*.json'):
+                if path.name == own:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    # Файл удалили или записывают прямо сейчас.
+                    continue
+        totals = {}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in values:
+                    key = tuple(key)
+                    merged[key] = (
+                        metric.merge(merged[key], value)
+                        if key in merged else value
+                    )
+        return totals
+
+    def render(self):
+        lines = []
+        totals = self.collect()
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = tuple(zip(metric.labelnames, key))
+                for sample, sample_labels, sample_value in metric.samples(
+                    labels, value
+                ):
+                    lines.append(
+                        f'{sample}{_format_labels(sample_labels)} '
+                        f'{_format_number(sample_value)}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'yanote_http_requests_total',
+    'Количество HTTP-запросов.',
+    ('view', 'method', 'status'),
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'yanote_http_request_duration_seconds',
+    'Время обработки HTTP-запроса.',
+    ('view',),
+))
+DB_QUERIES = REGISTRY.register(Histogram(
+    'yanote_db_queries_per_request',
+    'Количество SQL-запросов за один HTTP-запрос.',
+    ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+))
+DB_DURATION = REGISTRY.register(Histogram(
+    'yanote_db_duration_seconds',
+    'Суммарное время SQL-запросов за один HTTP-запрос.',
+    ('view',),
+))
+NOTE_WRITES = REGISTRY.register(Counter(
+    'yanote_note_writes_total',
+    'Количество записей заметок по видам изменений.',
+    ('action',),
+))
+PAGE_CACHE_HITS = REGISTRY.register(Counter(
+    'yanote_page_cache_hits_total',
+    'Страницы, отданные из кеша страниц авторов.',
+))
+PAGE_CACHE_MISSES = REGISTRY.register(Counter(
+    'yanote_page_cache_misses_total',
+    'Страницы, которых не было в кеше страниц авторов.',
+))
+
+
+def metrics_view(request):
+    """Метрики всех процессов в текстовом формате Prometheus.
+
+    Доступны, только если включены, и только сотрудникам или с адресов
+    из METRICS_ALLOWED_IPS: по ним видны маршруты и нагрузка сервиса.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not (request.user.is_staff
+            or request.META.get('REMOTE_ADDR')
+            in settings.METRICS_ALLOWED_IPS):
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,255 @@
+import cProfile
+import json
+import logging
+import random
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION, REQUESTS
+from .profiling import save_profile
+from .routers import use_replicas
+from .sharding import ShardContext, current_context
+
+logger = logging.getLogger('notes.performance')
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: число SQL-запросов, их время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """Одинаковые запросы, выполненные threshold раз и больше.
+
+        Параметры в SQL не подставлены, поэтому запросы, отличающиеся
+        только значениями, считаются одним — типичный признак N+1.
+        """
+        return {
+            sql: count for sql, count in self.statements.items()
+            if count >= threshold
+        }
+
+
+def record_queries(recorder):
+    """Подключает recorder ко всем соединениям с базами данных."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class PerformanceMiddleware:
+    """Замеряет время запроса по частям и отдаёт его в Server-Timing.
+
+    Части: middleware до вызова view (сессия, CSRF и т. п.), сама view,
+    отрисовка шаблона и SQL. Обращения к сессии и пользователю ленивые,
+    поэтому их запросы попадают во время view и в sql. Результат
+    пишется в лог notes.performance одной JSON-строкой; повторяющиеся
+    запросы сверх PERF_NPLUSONE_THRESHOLD отмечаются предупреждением.
+
+    Включается настройкой PERF_INSTRUMENTATION и должен стоять первым
+    в MIDDLEWARE, чтобы учитывать время остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.PERF_NPLUSONE_THRESHOLD
+
+    def __call__(self, request):
+        started = perf_counter()
+        request.perf_timings = timings = {'view_started': None,
+                                          'view_finished': None,
+                                          'template': 0.0}
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        finished = perf_counter()
+
+        view_started = timings['view_started'] or finished
+        view_finished = timings['view_finished'] or finished
+        metrics = {
+            'mw': view_started - started,
+            'view': view_finished - view_started,
+            'tpl': timings['template'],
+            'sql': recorder.duration,
+            'total': finished - started,
+        }
+        repeated = recorder.repeated(self.threshold)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value * 1000:.2f}'
+            + (f';desc="{recorder.count} queries"' if name == 'sql' else '')
+            for name, value in metrics.items()
+        )
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            **{f'{name}_ms': round(value * 1000, 2)
+               for name, value in metrics.items()},
+        }
+        logger.info(json.dumps(record, ensure_ascii=False))
+        if repeated:
+            logger.warning(json.dumps({
+                **record,
+                'nplusone': [
+                    {'sql': sql[:200], 'count': count}
+                    for sql, count in repeated.items()
+                ],
+            }, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.perf_timings['view_started'] = perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = request.perf_timings
+        timings['view_finished'] = perf_counter()
+        render = response.render
+
+        def timed_render():
+            render_started = perf_counter()
+            try:
+                return render()
+            finally:
+                timings['template'] += perf_counter() - render_started
+
+        response.render = timed_render
+        return response
+
+
+class MetricsMiddleware:
+    """Считает запросы, их время и SQL по именам маршрутов для /metrics."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code
+        )
+        REQUEST_DURATION.observe(perf_counter() - started, view=view)
+        DB_QUERIES.observe(recorder.count, view=view)
+        DB_DURATION.observe(recorder.duration, view=view)
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует долю запросов и сохраняет профили самых медленных.
+
+    cProfile включается для PROFILER_SAMPLE_RATE запросов; профиль
+    сохраняется, только если запрос шёл дольше PROFILER_THRESHOLD_MS.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILER_SAMPLE_RATE:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Профилировщик уже работает в соседнем потоке.
+            return self.get_response(request)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = perf_counter() - started
+        if duration * 1000 >= settings.PROFILER_THRESHOLD_MS:
+            match = request.resolver_match
+            save_profile(profiler, match and match.view_name, duration)
+        return response
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик для безопасных запросов.
+
+    После запроса с записью пользователь получает cookie на
+    REPLICA_PIN_SECONDS секунд, и пока она жива, все его запросы
+    читают из основной базы: например, страница после создания
+    заметки уже видит новую заметку, даже если реплика отстаёт.
+    Тело потокового ответа читается после выхода из middleware, поэтому
+    его queryset нужно заранее привязать к базе через using().
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    PIN_COOKIE = 'yanote_primary'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in self.SAFE_METHODS
+        token = use_replicas.set(
+            safe and self.PIN_COOKIE not in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        if not safe:
+            response.set_cookie(
+                self.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ShardMiddleware:
+    """Направляет запросы к заметкам в шард текущего пользователя.
+
+    Пользователь и его шард определяются лениво, при первом запросе
+    к заметкам. Должен стоять после AuthenticationMiddleware. Как и
+    у ReplicaMiddleware, контекст не действует при чтении тела
+    потокового ответа.
+    """
+
+    def __init__(self, get_response):
+        if not settings.NOTES_SHARDS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_context.set(
+            ShardContext(lambda: request.user.pk)
+        )
+        try:
+            return self.get_response(request)
+        finally:
+            current_context.reset(token)
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.15 on 2026-10-18 04:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0003_note_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compacted_through', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NoteChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note_id', models.BigIntegerField(verbose_name='ID заметки')),
+                ('slug', models.SlugField(db_index=False, max_length=100, verbose_name='Адрес заметки')),
+                ('action', models.CharField(choices=[('created', 'Создана'), ('updated', 'Изменена'), ('deleted', 'Удалена')], max_length=7, verbose_name='Действие')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notechange',
+            index=models.Index(fields=['author', 'id'], name='notes_change_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notechange',
+            index=models.Index(fields=['note_id', 'id'], name='notes_change_note_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_changes(apps, schema_editor):
+    """Существующие заметки попадают в журнал как созданные."""
+    Note = apps.get_model('notes', 'Note')
+    NoteChange = apps.get_model('notes', 'NoteChange')
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.using(db_alias).filter(id__gt=last_id)
+            .order_by('id').values_list('id', 'slug', 'author_id')
+            [:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        NoteChange.objects.using(db_alias).bulk_create(
+            NoteChange(
+                note_id=note_id, slug=slug, author_id=author_id,
+                action='created',
+            )
+            for note_id, slug, author_id in batch
+        )
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_note_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.15 on 2026-10-18 04:56
+
+from django.db import migrations
+from django.db.models import TextField, Value
+
+import notes.fields
+
+BATCH_SIZE = 1000
+
+
+def batches(Note, db_alias):
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.using(db_alias).filter(id__gt=last_id)
+            .order_by('id').values_list('id', 'text')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        yield batch
+        last_id = batch[-1][0]
+
+
+def compress_texts(apps, schema_editor):
+    """Сжимает большие тексты существующих заметок пачками."""
+    Note = apps.get_model('notes', 'Note')
+    db_alias = schema_editor.connection.alias
+    for batch in batches(Note, db_alias):
+        Note.objects.using(db_alias).bulk_update([
+            Note(id=note_id, text=text) for note_id, text in batch
+            if isinstance(text, str)
+            and notes.fields.prepare_text(text) != text
+        ], ['text'])
+
+
+def decompress_texts(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    db_alias = schema_editor.connection.alias
+    for batch in batches(Note, db_alias):
+        for note_id, text in batch:
+            if isinstance(text, notes.fields.CompressedText):
+                Note.objects.using(db_alias).filter(id=note_id).update(
+                    text=Value(text.decompress(), output_field=TextField())
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_backfill_note_changes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='text',
+            field=notes.fields.CompressedTextField(
+                help_text='Добавьте подробностей', verbose_name='Текст'
+            ),
+        ),
+        migrations.RunPython(compress_texts, decompress_texts),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.15 on 2026-10-18 04:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import notes.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_compress_note_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('title', models.CharField(max_length=100, verbose_name='Заголовок')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Полная копия')),
+                ('data', notes.fields.CompressedTextField(verbose_name='Текст или дельта')),
+                ('modified', models.DateTimeField(verbose_name='Изменено')),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='notes.note')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='noterevision',
+            constraint=models.UniqueConstraint(fields=('note', 'number'), name='notes_revision_number_uniq'),
+        ),
+    ]
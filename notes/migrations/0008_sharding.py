@@ -0,0 +1,54 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_slug_registry(apps, schema_editor):
+    """Slug существующих заметок занимаются в реестре с их id."""
+    Note = apps.get_model('notes', 'Note')
+    SlugRegistry = apps.get_model('notes', 'SlugRegistry')
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.using(db_alias).filter(id__gt=last_id)
+            .order_by('id').values_list('id', 'slug', 'author_id')
+            [:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        SlugRegistry.objects.using(db_alias).bulk_create(
+            SlugRegistry(id=note_id, slug=slug, author_id=author_id)
+            for note_id, slug, author_id in batch
+        )
+        last_id = batch[-1][0]
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0007_note_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('shard', models.CharField(max_length=100, verbose_name='База данных')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SlugRegistry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_slug_registry, migrations.RunPython.noop),
+    ]
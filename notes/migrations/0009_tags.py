@@ -0,0 +1,46 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0008_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+                ('note_count', models.PositiveIntegerField(default=0, verbose_name='Заметок')),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NoteTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='notes.note')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='notes.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='notes', through='notes.NoteTag', to='notes.Tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('author', 'name'), name='notes_tag_author_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='notetag',
+            constraint=models.UniqueConstraint(fields=('tag', 'note'), name='notes_notetag_tag_note_uniq'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:32
+
+from django.conf import settings
+from django.db import migrations, models, router
+from django.db.models import Count, Max, Sum
+import django.db.models.deletion
+
+import notes.fields
+
+BATCH_SIZE = 1000
+
+
+def fill_stats(apps, schema_editor):
+    """Заполняет длину текста заметок и сводку их авторов.
+
+    При шардировании сводка считается по заметкам основной базы;
+    после миграции шардов её исправит reconcile_author_stats.
+    """
+    Note = apps.get_model('notes', 'Note')
+    AuthorStats = apps.get_model('notes', 'AuthorStats')
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.using(db_alias).filter(id__gt=last_id)
+            .order_by('id').values_list('id', 'text')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        Note.objects.using(db_alias).bulk_update([
+            Note(id=note_id, text_length=len(
+                text.decompress()
+                if isinstance(text, notes.fields.CompressedText) else text
+            ))
+            for note_id, text in batch
+        ], ['text_length'])
+        last_id = batch[-1][0]
+    if not router.allow_migrate_model(db_alias, AuthorStats):
+        return
+    AuthorStats.objects.using(db_alias).bulk_create(
+        (
+            AuthorStats(
+                author_id=row['author_id'],
+                note_count=row['count'],
+                text_length=row['length'],
+                last_modified=row['latest'],
+            )
+            for row in Note.objects.using(db_alias).order_by()
+            .values('author_id').annotate(
+                count=Count('id'),
+                length=Sum('text_length'),
+                latest=Max('modified'),
+            )
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0009_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('note_count', models.PositiveIntegerField(default=0, verbose_name='Заметок')),
+                ('text_length', models.PositiveBigIntegerField(default=0, verbose_name='Символов')),
+                ('last_modified', models.DateTimeField(blank=True, null=True, verbose_name='Последнее изменение')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='text_length',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Длина текста'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,53 @@
+from contextlib import ExitStack
+
 from django.conf import settings
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.utils import timezone
+
+from .fields import CompressedTextField
+from .markup import render_note_text
+from .slugs import save_with_unique_slug
+
+
+def atomic_for(using):
+    """Транзакция в базе заметок using и в основной базе.
+
+    В основную базу пишутся журнал изменений и реестр slug. Основная
+    база блокируется первой — в том же порядке, что и при переносе
+    автора между шардами, иначе они ждали бы друг друга.
+    """
+    stack = ExitStack()
+    stack.enter_context(transaction.atomic(using=DEFAULT_DB_ALIAS))
+    if using != DEFAULT_DB_ALIAS:
+        stack.enter_context(transaction.atomic(using=using))
+    return stack
+
+
+class Tag(models.Model):
+    """Метка заметок автора.
+
+    note_count — число заметок с меткой; меняется вместе со связями
+    (см. notes.tags), чтобы список меток не считал их GROUP BY.
+    """
+    # Метки автора читаются по уникальному индексу (author, name).
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,
+    )
+    name = models.CharField('Название', max_length=50)
+    note_count = models.PositiveIntegerField('Заметок', default=0)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('author', 'name'), name='notes_tag_author_name_uniq'
+            ),
+        )
 
-from pytils.translit import slugify
+    def __str__(self):
+        return self.name
 
 
 class Note(models.Model):
@@ -11,7 +57,7 @@ class Note(models.Model):
         default='Название заметки',
         help_text='Дайте короткое название заметке'
     )
-    text = models.TextField(
+    text = CompressedTextField(
         'Текст',
         help_text='Добавьте подробностей'
     )
@@ -27,12 +73,256 @@ class Note(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    modified = models.DateTimeField('Изменено', auto_now=True)
+    text_length = models.PositiveIntegerField(
+        'Длина текста', default=0, editable=False
+    )
+    tags = models.ManyToManyField(
+        Tag,
+        through='NoteTag',
+        blank=True,
+        related_name='notes',
+    )
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', 'id'), name='notes_note_author_id_idx'
+            ),
+        )
 
     def __str__(self):
         return self.title
 
+    @property
+    def text_html(self):
+        """Текст заметки, отрисованный из Markdown."""
+        return render_note_text(self)
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            max_slug_length = self._meta.get_field('slug').max_length
-            self.slug = slugify(self.title)[:max_slug_length]
-        super().save(*args, **kwargs)
+        # Нераспакованный сжатый текст не менялся, его длина тоже.
+        if isinstance(self.__dict__.get('text'), str):
+            self.text_length = len(self.text)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'text' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'text_length'}
+        # Журнал изменений пишется в post_save той же транзакцией.
+        using = kwargs.get('using') or router.db_for_write(
+            Note, instance=self
+        )
+        with atomic_for(using):
+            if self.slug:
+                return super().save(*args, **kwargs)
+            return save_with_unique_slug(
+                self,
+                lambda: super(Note, self).save(*args, **kwargs),
+                SlugRegistry if settings.NOTES_SHARDS else Note,
+            )
+
+    def delete(self, using=None, keep_parents=False):
+        # Журнал, реестр slug и сводка автора меняются в post_delete:
+        # при откате удаления из шарда они откатываются вместе с ним.
+        using = using or router.db_for_write(Note, instance=self)
+        with atomic_for(using):
+            return super().delete(using, keep_parents)
+
+
+class NoteTag(models.Model):
+    """Связь заметки с меткой."""
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    # Поиск по метке идёт по уникальному индексу (tag, note).
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('tag', 'note'), name='notes_notetag_tag_note_uniq'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}: {self.tag_id}'
+
+
+class NoteRevision(models.Model):
+    """Прежняя версия заметки.
+
+    Полная копия хранит текст версии, остальные записи — дельту,
+    которая получает этот текст из следующей версии.
+    """
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+    )
+    number = models.PositiveIntegerField('Номер версии')
+    title = models.CharField('Заголовок', max_length=100)
+    is_snapshot = models.BooleanField('Полная копия', default=False)
+    data = CompressedTextField('Текст или дельта')
+    modified = models.DateTimeField('Изменено')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('note', 'number'), name='notes_revision_number_uniq'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}: версия {self.number}'
+
+
+class AuthorShard(models.Model):
+    """Шард, в котором лежат заметки автора."""
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    shard = models.CharField('База данных', max_length=100)
+
+    def __str__(self):
+        return f'{self.author_id}: {self.shard}'
+
+
+class SlugRegistry(models.Model):
+    """Занятый slug заметки из любого шарда.
+
+    id записи становится id заметки, поэтому id заметок тоже
+    уникальны во всех шардах.
+    """
+    slug = models.SlugField(max_length=100, unique=True)
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    def __str__(self):
+        return self.slug
+
+
+class NoteChange(models.Model):
+    """Запись журнала изменений заметок для инкрементальной синхронизации.
+
+    Порядковый номер записи (id) служит курсором для клиентов. Удалённые
+    заметки остаются в журнале записями-надгробиями с action=deleted.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = (
+        (CREATED, 'Создана'),
+        (UPDATED, 'Изменена'),
+        (DELETED, 'Удалена'),
+    )
+
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    note_id = models.BigIntegerField('ID заметки')
+    slug = models.SlugField('Адрес заметки', max_length=100, db_index=False)
+    action = models.CharField('Действие', max_length=7, choices=ACTIONS)
+    created = models.DateTimeField('Время изменения', auto_now_add=True)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', 'id'), name='notes_change_author_id_idx'
+            ),
+            models.Index(
+                fields=('note_id', 'id'), name='notes_change_note_id_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.id}: {self.action} {self.slug}'
+
+
+class AuthorStats(models.Model):
+    """Сводка по заметкам автора.
+
+    Меняется в одной транзакции с заметками (см. notes.stats),
+    расхождения исправляет команда reconcile_author_stats.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    note_count = models.PositiveIntegerField('Заметок', default=0)
+    text_length = models.PositiveBigIntegerField('Символов', default=0)
+    last_modified = models.DateTimeField(
+        'Последнее изменение', null=True, blank=True
+    )
+
+    def __str__(self):
+        return f'{self.author_id}: {self.note_count}'
+
+
+class Task(models.Model):
+    """Фоновая задача из очереди notes.tasks."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=50)
+    params = models.JSONField('Параметры', default=dict)
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    status = models.CharField(
+        'Состояние', max_length=7, choices=STATUSES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    run_after = models.DateTimeField('Не раньше', default=timezone.now)
+    worker = models.CharField('Процесс', max_length=100, blank=True)
+    heartbeat = models.DateTimeField('Сигнал жизни', null=True, blank=True)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('status', 'run_after'), name='notes_task_queue_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.id}: {self.name} ({self.status})'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class ChangeFeedState(models.Model):
+    """Состояние журнала изменений; в таблице одна строка.
+
+    compacted_through — наибольший номер удалённого при сжатии
+    надгробия. Клиент с более старым курсором мог пропустить удаление
+    и должен выполнить полную синхронизацию.
+    """
+    compacted_through = models.BigIntegerField(default=0)
+
+    @classmethod
+    def load(cls):
+        state, _ = cls.objects.get_or_create(pk=1)
+        return state
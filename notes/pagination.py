@@ -0,0 +1,72 @@
+from django.http import Http404
+
+# Наибольшее значение id: большее число SQLite не примет как параметр.
+MAX_CURSOR = 2 ** 63 - 1
+
+
+class KeysetPage:
+    """Страница выборки, построенная по курсору (keyset pagination)."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def parse_cursor(value):
+    """Преобразует значение курсора из GET-параметра в число."""
+    if value in (None, ''):
+        return None
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        raise Http404('Некорректный курсор страницы.')
+    if not 0 <= cursor <= MAX_CURSOR:
+        raise Http404('Некорректный курсор страницы.')
+    return cursor
+
+
+def keyset_paginate(queryset, per_page, after=None, before=None):
+    """Возвращает страницу выборки, упорядоченной по id.
+
+    Вместо OFFSET используется условие по id, поэтому стоимость запроса
+    не зависит от номера страницы. Запрашивается на одну запись больше,
+    чтобы узнать, есть ли следующая (или предыдущая) страница.
+    """
+    if before is not None:
+        rows = list(
+            queryset.filter(id__lt=before).order_by('-id')[:per_page + 1]
+        )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        next_cursor = rows[-1].id if rows else None
+        prev_cursor = rows[0].id if rows and has_more else None
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    rows = list(queryset.order_by('id')[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = rows[-1].id if rows and has_more else None
+    prev_cursor = rows[0].id if rows and after is not None else None
+    return KeysetPage(rows, next_cursor, prev_cursor)
@@ -0,0 +1,65 @@
+"""Хранилище профилей медленных запросов.
+
+Профили сохраняются в формате pstats в каталог PROFILER_DIR; в имени
+файла — время, длительность запроса и имя маршрута. Хранится не больше
+PROFILER_MAX_FILES файлов, самые старые удаляются.
+"""
+import io
+import os
+import pstats
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+SUFFIX = '.prof'
+
+
+def get_directory():
+    return Path(settings.PROFILER_DIR)
+
+
+def save_profile(profiler, view_name, duration):
+    directory = get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    view = re.sub(r'[^\w.-]+', '_', view_name or 'unmatched')
+    name = (
+        f'{time.strftime("%Y%m%dT%H%M%S")}-{duration * 1000:.0f}ms-'
+        f'{view}-{uuid.uuid4().hex[:8]}{SUFFIX}'
+    )
+    temporary = directory / f'.{name}.tmp'
+    profiler.dump_stats(temporary)
+    os.replace(temporary, directory / name)
+    rotate()
+    return directory / name
+
+
+def list_profiles():
+    """Сохранённые профили, новые первыми."""
+    directory = get_directory()
+    if not directory.is_dir():
+        return []
+    return sorted(
+        directory.glob(f'*{SUFFIX}'),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+
+
+def rotate():
+    for path in list_profiles()[settings.PROFILER_MAX_FILES:]:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            # Тот же файл мог удалить соседний воркер.
+            pass
+
+
+def summarize(path, limit=25, sort='cumulative'):
+    """Текстовая сводка профиля: самые тяжёлые функции."""
+    stream = io.StringIO()
+    stats = pstats.Stats(str(path), stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
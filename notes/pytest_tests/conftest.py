@@ -1,10 +1,19 @@
 import pytest
 
+from django.core.cache import cache
 from django.test.client import Client
 
 from notes.models import Note
 
 
+@pytest.fixture(autouse=True)
+def clear_page_cache():
+    """Тест идёт в транзакции, которая не фиксируется, поэтому версии
+    кеша страниц не меняются: страницы прошлых тестов убираются явно.
+    """
+    cache.clear()
+
+
 @pytest.fixture
 def author(django_user_model):
     """Фиктсутра возвращает автора заметки."""
@@ -0,0 +1,214 @@
+import json
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from notes.bulk import create_notes
+from notes.forms import WARNING, NoteForm
+from notes.models import Note, NoteChange
+from notes.tags import author_tags, note_tags, set_tags
+
+
+@pytest.fixture
+def detail_url(note):
+    return reverse('notes:api_detail', args=(note.slug,))
+
+
+def test_detail_returns_note_with_validators(author_client, note, detail_url):
+    response = author_client.get(detail_url)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['text'] == note.text
+    assert response['ETag'].startswith('"')
+    assert response.has_header('Last-Modified')
+
+
+def test_detail_not_modified(
+    author_client, detail_url, django_assert_num_queries
+):
+    etag = author_client.get(detail_url)['ETag']
+    # Сессия, пользователь и один запрос за id и временем изменения.
+    with django_assert_num_queries(3):
+        response = author_client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b''
+
+
+def test_list_etag_changes_after_write(author_client, note):
+    url = reverse('notes:api_list')
+    etag = author_client.get(url)['ETag']
+    assert author_client.get(
+        url, HTTP_IF_NONE_MATCH=etag
+    ).status_code == HTTPStatus.NOT_MODIFIED
+    note.title = 'Другое название'
+    note.save()
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['results'][0]['title'] == 'Другое название'
+
+
+def test_create_note(author_client, author, form_data):
+    response = author_client.post(
+        reverse('notes:api_list'), data=json.dumps(form_data),
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert Note.objects.get(author=author).slug == form_data['slug']
+
+
+def test_put_with_stale_etag_is_rejected(author_client, note, detail_url):
+    etag = author_client.get(detail_url)['ETag']
+    note.text = 'Изменено другим клиентом'
+    note.save()
+    response = author_client.put(
+        detail_url, data=json.dumps({'text': 'Моя правка'}),
+        content_type='application/json', HTTP_IF_MATCH=etag,
+    )
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    note.refresh_from_db()
+    assert note.text == 'Изменено другим клиентом'
+
+
+def test_put_with_current_etag(author_client, note, detail_url):
+    etag = author_client.get(detail_url)['ETag']
+    response = author_client.put(
+        detail_url, data=json.dumps({'text': 'Моя правка'}),
+        content_type='application/json', HTTP_IF_MATCH=etag,
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
+    note.refresh_from_db()
+    assert (note.title, note.text) == ('Заголовок', 'Моя правка')
+
+
+def test_put_keeps_tags_unless_given(author_client, note, detail_url):
+    set_tags(note, ['работа', 'дом'])
+    author_client.put(
+        detail_url, data=json.dumps({'title': 'Новый'}),
+        content_type='application/json',
+    )
+    assert note_tags(note) == ['дом', 'работа']
+    author_client.put(
+        detail_url, data=json.dumps({'tags': 'дом'}),
+        content_type='application/json',
+    )
+    assert note_tags(note) == ['дом']
+    assert list(author_tags(note.author)) == [('дом', 1)]
+
+
+def test_invalid_json(author_client, detail_url):
+    response = author_client.put(
+        detail_url, data='{', content_type='application/json'
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_delete_note(author_client, detail_url):
+    response = author_client.delete(detail_url)
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert Note.objects.count() == 0
+
+
+@pytest.mark.parametrize(
+    'parametrized_client, expected_status',
+    (
+        (pytest.lazy_fixture('client'), HTTPStatus.FORBIDDEN),
+        (pytest.lazy_fixture('not_author_client'), HTTPStatus.NOT_FOUND),
+    )
+)
+def test_detail_is_private(parametrized_client, detail_url, expected_status):
+    response = parametrized_client.get(detail_url)
+    assert response.status_code == expected_status
+    assert response['Content-Type'] == 'application/json'
+
+
+@pytest.mark.parametrize('method', ('get', 'put', 'delete'))
+def test_missing_note_is_json_404(author_client, method):
+    url = reverse('notes:api_detail', args=('missing',))
+    response = getattr(author_client, method)(url)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'detail': 'Заметка не найдена.'}
+
+
+def test_slug_race_is_reported_as_error(
+    author_client, author, note, form_data, monkeypatch
+):
+    # Проверка формы проходит, но к моменту записи slug уже занят.
+    monkeypatch.setattr(NoteForm, 'clean_slug', lambda form: note.slug)
+    monkeypatch.setattr(NoteForm, 'validate_unique', lambda form: None)
+    other = Note.objects.create(title='Другая', text='Текст', author=author)
+    for response in (
+        author_client.put(
+            reverse('notes:api_detail', args=(other.slug,)),
+            data=json.dumps({'slug': note.slug}),
+            content_type='application/json',
+        ),
+        author_client.post(
+            reverse('notes:api_list'), data=json.dumps(form_data),
+            content_type='application/json',
+        ),
+    ):
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json() == {'errors': {'slug': [note.slug + WARNING]}}
+    assert Note.objects.count() == 2
+
+
+def get_changes(client, since=0):
+    response = client.get(reverse('notes:api_changes'), {'since': since})
+    assert response.status_code == HTTPStatus.OK
+    return response.json()
+
+
+def test_changes_feed_reports_created_updated_deleted(author_client, author):
+    first = get_changes(author_client)
+    assert first['changes'] == []
+    note = Note.objects.create(
+        title='Заметка', text='Текст', slug='feed', author=author
+    )
+    note.text = 'Новый текст'
+    note.save()
+    page = get_changes(author_client, first['cursor'])
+    # Создание и правка схлопываются в одну запись с текущими данными.
+    assert [change['action'] for change in page['changes']] == ['updated']
+    assert page['changes'][0]['note']['text'] == 'Новый текст'
+    note_id = note.id
+    note.delete()
+    page = get_changes(author_client, page['cursor'])
+    assert page['changes'] == [{
+        'seq': page['cursor'], 'action': 'deleted', 'id': note_id,
+        'slug': 'feed', 'note': None,
+    }]
+    assert get_changes(author_client, page['cursor'])['changes'] == []
+
+
+def test_changes_feed_is_private(not_author_client, note):
+    assert get_changes(not_author_client)['changes'] == []
+
+
+def test_bulk_created_notes_are_in_feed(author_client, author):
+    create_notes([
+        Note(title='Первая', text='Текст', author=author),
+        Note(title='Вторая', text='Текст', author=author),
+    ])
+    changes = get_changes(author_client)['changes']
+    assert [change['slug'] for change in changes] == ['pervaya', 'vtoraya']
+
+
+def test_compaction_expires_old_cursors(author_client, author):
+    note = Note.objects.create(
+        title='Заметка', text='Текст', slug='old', author=author
+    )
+    cursor = get_changes(author_client)['cursor']
+    note.save()
+    note.delete()
+    call_command('compact_note_changes', days=0, stdout=StringIO())
+    assert not NoteChange.objects.exists()
+    response = author_client.get(
+        reverse('notes:api_changes'), {'since': cursor}
+    )
+    assert response.status_code == HTTPStatus.GONE
+    # Полная синхронизация с нуля по-прежнему возможна.
+    assert get_changes(author_client)['changes'] == []
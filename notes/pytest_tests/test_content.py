@@ -1,8 +1,27 @@
+import csv
+import io
+import json
+import zipfile
+
 import pytest
+from http import HTTPStatus
 
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.utils import make_template_fragment_key
 from django.urls import reverse
 
+from notes import export, markup
+from notes.bulk import delete_notes
+from notes.cache import (
+    VERSION_KEY, get_cache, get_version, get_version_cache
+)
 from notes.forms import NoteForm
+from notes.metrics import PAGE_CACHE_HITS, REGISTRY
+from notes.models import Note
+from notes.rendering import warm_templates
+from notes.tags import set_tags
+from notes.views import NotesList
 
 
 @pytest.mark.parametrize(
@@ -36,3 +55,326 @@ def test_pages_contains_form(author_client, name, args):
     # Проверяем, что объект формы относится к нужному классу.
     assert isinstance(response.context['form'], NoteForm)
 
+
+@pytest.fixture
+def many_notes(author):
+    """Фикстура создаёт заметок больше, чем помещается на страницу."""
+    return Note.objects.bulk_create(
+        Note(title=f'Заметка {index}', text='Текст', slug=f'note-{index}',
+             author=author)
+        for index in range(NotesList.paginate_by + 5)
+    )
+
+
+def test_notes_list_is_paginated_by_cursor(author_client, many_notes):
+    url = reverse('notes:list')
+    first_page = author_client.get(url).context['page_obj']
+    assert len(first_page) == NotesList.paginate_by
+    assert not first_page.has_previous
+    second_page = author_client.get(
+        url, {'after': first_page.next_cursor}
+    ).context['page_obj']
+    assert len(second_page) == 5
+    assert not second_page.has_next
+    assert {note.id for note in first_page}.isdisjoint(
+        note.id for note in second_page
+    )
+    back = author_client.get(
+        url, {'before': second_page.prev_cursor}
+    ).context['page_obj']
+    assert list(back) == list(first_page)
+
+
+def test_notes_list_loads_only_needed_fields(author_client, note):
+    response = author_client.get(reverse('notes:list'))
+    listed_note = response.context['object_list'][0]
+    assert listed_note.get_deferred_fields() == {
+        'text', 'author_id', 'modified', 'text_length'
+    }
+
+
+@pytest.mark.parametrize('cursor', ('abc', '-1', str(2 ** 63)))
+@pytest.mark.parametrize(
+    'name, parameter',
+    (
+        ('notes:list', 'after'),
+        ('notes:list', 'before'),
+        ('notes:api_list', 'after'),
+        ('notes:api_changes', 'since'),
+    ),
+)
+def test_invalid_cursor(author_client, name, parameter, cursor):
+    response = author_client.get(reverse(name), {parameter: cursor})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_search_finds_only_own_notes(
+    author_client, not_author, note
+):
+    Note.objects.create(
+        title='Чужая заметка', text='Текст заметки', slug='other',
+        author=not_author,
+    )
+    response = author_client.get(reverse('notes:search'), {'q': 'текст'})
+    assert list(response.context['object_list']) == [note]
+
+
+def test_search_ranks_title_matches_first(author_client, author):
+    in_text = Note.objects.create(
+        title='Список покупок', text='купить молоко', slug='in-text',
+        author=author,
+    )
+    in_title = Note.objects.create(
+        title='Молоко', text='в магазине', slug='in-title', author=author,
+    )
+    response = author_client.get(reverse('notes:search'), {'q': 'молок'})
+    assert list(response.context['object_list']) == [in_title, in_text]
+
+
+@pytest.mark.parametrize('query', ('', '"*()', 'AND OR NOT'))
+def test_search_handles_any_query(author_client, note, query):
+    response = author_client.get(reverse('notes:search'), {'q': query})
+    assert response.status_code == HTTPStatus.OK
+
+
+def cache_hits():
+    return REGISTRY.collect().get(PAGE_CACHE_HITS.name, {}).get((), 0)
+
+
+def test_repeat_detail_request_is_served_from_cache(
+    author_client, note, django_assert_num_queries
+):
+    url = reverse('notes:detail', args=(note.slug,))
+    first = author_client.get(url)
+    hits = cache_hits()
+    # Повторный запрос обращается к БД только за сессией и пользователем.
+    with django_assert_num_queries(2):
+        second = author_client.get(url)
+    assert second.content == first.content
+    assert dict(second.items()) == dict(first.items())
+    assert cache_hits() == hits + 1
+
+
+def test_invalidation_reaches_other_processes(author_client, note):
+    """Версии страниц видны всем процессам, а не только записавшему."""
+    url = reverse('notes:detail', args=(note.slug,))
+    author_client.get(url)
+    # Кеш версий, каким его видит другой процесс сервера.
+    other = FileBasedCache(get_version_cache()._dir, {})
+    Note.objects.filter(pk=note.pk).update(title='Изменено в другом')
+    other.set(VERSION_KEY.format(author_id=note.author_id), 'new', None)
+    response = author_client.get(url)
+    assert 'Изменено в другом' in response.content.decode()
+
+
+def test_note_change_invalidates_cached_list(
+    author_client, note, django_capture_on_commit_callbacks
+):
+    url = reverse('notes:list')
+    author_client.get(url)
+    with django_capture_on_commit_callbacks(execute=True):
+        note.title = 'Новое название'
+        note.save()
+    response = author_client.get(url)
+    assert 'Новое название' in response.content.decode()
+
+
+def test_pages_are_invalidated_after_commit(
+    note, django_capture_on_commit_callbacks
+):
+    version = get_version(note.author_id)
+    with django_capture_on_commit_callbacks(execute=True):
+        note.save()
+        assert get_version(note.author_id) == version
+    assert get_version(note.author_id) != version
+
+
+def test_cache_is_separate_for_each_user(
+    author_client, not_author_client, note
+):
+    url = reverse('notes:list')
+    author_client.get(url)
+    response = not_author_client.get(url)
+    assert note.title not in response.content.decode()
+
+
+def read_export(client, export_format):
+    response = client.get(reverse('notes:export'), {'format': export_format})
+    assert response.streaming
+    return b''.join(response.streaming_content)
+
+
+def test_export_jsonl(author_client, note, not_author):
+    Note.objects.create(
+        title='Чужая', text='Текст', slug='other', author=not_author
+    )
+    lines = read_export(author_client, 'jsonl').decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{
+        'id': note.id, 'title': note.title, 'slug': note.slug,
+        'text': note.text,
+    }]
+
+
+def test_export_csv_reads_in_chunks(author_client, many_notes, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_CHUNK_SIZE', 10)
+    rows = list(csv.reader(
+        io.StringIO(read_export(author_client, 'csv').decode())
+    ))
+    assert rows[0] == list(export.FIELDS)
+    assert [int(row[0]) for row in rows[1:]] == list(
+        Note.objects.order_by('id').values_list('id', flat=True)
+    )
+
+
+def test_export_markdown_zip(author_client, note):
+    archive = zipfile.ZipFile(io.BytesIO(read_export(author_client, 'md')))
+    assert archive.namelist() == [f'{note.slug}.md']
+    assert archive.read(f'{note.slug}.md').decode() == (
+        f'# {note.title}\n\n{note.text}\n'
+    )
+
+
+def test_export_unknown_format(author_client):
+    response = author_client.get(reverse('notes:export'), {'format': 'pdf'})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_notes_list_links_to_detail(author_client, note):
+    response = author_client.get(reverse('notes:list'))
+    detail_url = reverse('notes:detail', args=(note.slug,))
+    assert f'href="{detail_url}"' in response.content.decode()
+
+
+def test_header_fragment_is_cached(settings, author_client, author):
+    settings.TEMPLATE_FRAGMENT_TIMEOUT = 600
+    key = make_template_fragment_key('header', (author.pk, author.username))
+    cache.delete(key)
+    author_client.get(reverse('notes:home'))
+    assert author.username in cache.get(key)
+
+
+def test_header_fragment_cache_is_off_by_default(author_client, author):
+    key = make_template_fragment_key('header', (author.pk, author.username))
+    cache.set(key, 'Устаревшая шапка')
+    response = author_client.get(reverse('notes:home'))
+    assert 'Устаревшая шапка' not in response.content.decode()
+    cache.delete(key)
+
+
+def test_all_templates_are_warmed(settings):
+    templates = list((settings.BASE_DIR / 'templates').rglob('*.html'))
+    assert warm_templates() == len(templates)
+
+
+def test_detail_renders_markdown(author_client, author):
+    note = Note.objects.create(
+        title='Markdown',
+        text='# План\n\n**Важно** <script>alert(1)</script>\n\n- пункт',
+        author=author,
+    )
+    response = author_client.get(reverse('notes:detail', args=(note.slug,)))
+    content = response.content.decode()
+    assert '<h1>План</h1>' in content
+    assert '<strong>Важно</strong> &lt;script&gt;' in content
+    assert '<ul><li>пункт</li></ul>' in content
+
+
+@pytest.mark.parametrize('url, is_link', (
+    ('https://example.com/?a=1', True),
+    ('/notes/', True),
+    ('mailto:me@example.com', True),
+    ('javascript:alert', False),
+    ('JavaScript:alert', False),
+    ('data:text/html,x', False),
+))
+def test_markdown_links_are_sanitized(url, is_link):
+    rendered = markup.render_markdown(f'[ссылка]({url})')
+    assert ('<a href=' in rendered) is is_link
+
+
+def test_rendered_text_is_cached(note, monkeypatch):
+    get_cache().delete(markup.render_key(note))
+    calls = []
+    render = markup.render_markdown
+    monkeypatch.setattr(
+        markup, 'render_markdown',
+        lambda text: calls.append(text) or render(text),
+    )
+    first = note.text_html
+    assert Note.objects.get(pk=note.pk).text_html == first
+    assert calls == [note.text]
+
+
+def test_deleted_note_evicts_rendered_text(note):
+    note.text_html
+    key = markup.render_key(note)
+    note.delete()
+    assert get_cache().get(key) is None
+
+
+def test_bulk_delete_evicts_rendered_text(author, note):
+    # Длинный текст хранится сжатым, ключ кеша — по исходному тексту.
+    large = Note.objects.create(
+        title='Большая', text='Строка текста\n' * 1000, author=author,
+    )
+    keys = []
+    for item in (note, large):
+        item.text_html
+        keys.append(markup.render_key(item))
+    delete_notes(author, [note.pk, large.pk])
+    assert get_cache().get_many(keys) == {}
+
+
+@pytest.fixture
+def tagged_notes(author):
+    notes = {}
+    for slug, tags in (
+        ('home', ['дом']),
+        ('work', ['работа', 'срочно']),
+        ('both', ['дом', 'работа']),
+        ('none', []),
+    ):
+        notes[slug] = Note.objects.create(
+            title=slug, text='Текст', slug=slug, author=author
+        )
+        set_tags(notes[slug], tags)
+    return notes
+
+
+@pytest.mark.parametrize('query, expected', (
+    ('?tag=дом', ['home', 'both']),
+    ('?tag=дом,срочно', ['home', 'work', 'both']),
+    ('?tag=работа&tag=дом', ['both']),
+    ('?tag=дом,срочно&tag=работа', ['work', 'both']),
+    ('?tag=нет', []),
+    ('?tag=дом&tag=нет', []),
+))
+def test_notes_list_tag_filter(author_client, tagged_notes, query, expected):
+    response = author_client.get(reverse('notes:list') + query)
+    assert [
+        note.slug for note in response.context['object_list']
+    ] == expected
+
+
+def test_notes_list_tag_sidebar(author_client, tagged_notes):
+    set_tags(tagged_notes['both'], ['работа'])
+    response = author_client.get(reverse('notes:list'))
+    assert list(response.context['tags']) == [
+        ('дом', 1), ('работа', 2), ('срочно', 1)
+    ]
+
+
+def test_tag_filter_is_kept_in_page_links(author_client, many_notes):
+    for note in Note.objects.all():
+        set_tags(note, ['метка'])
+    response = author_client.get(reverse('notes:list') + '?tag=метка')
+    assert '&amp;tag=%D0%BC%D0%B5%D1%82%D0%BA%D0%B0' in (
+        response.content.decode()
+    )
+
+
+@pytest.mark.parametrize('name', ('notes:home', 'notes:list'))
+def test_stats_panel(author_client, note, name):
+    response = author_client.get(reverse(name))
+    assert response.context['stats'].note_count == 1
+    assert f'символов: {len(note.text)}' in response.content.decode()
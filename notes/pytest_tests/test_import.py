@@ -0,0 +1,121 @@
+import json
+import threading
+from io import StringIO
+
+import pytest
+
+from django.core.management import CommandError, call_command
+
+from notes.management.commands.import_notes import Command
+from notes.models import Note, Task
+from notes.tasks import work
+
+
+@pytest.fixture
+def jsonl_file(tmp_path, author):
+    path = tmp_path / 'notes.jsonl'
+    records = [
+        {'title': f'Заметка {index}', 'text': f'Текст {index}'}
+        for index in range(5)
+    ]
+    records.append({'title': 'Заметка 0', 'text': 'Повтор заголовка'})
+    path.write_text(
+        '\n'.join(json.dumps(record, ensure_ascii=False)
+                  for record in records),
+        encoding='utf-8',
+    )
+    return path
+
+
+def test_import_jsonl_in_batches(jsonl_file, author):
+    call_command(
+        'import_notes', str(jsonl_file), author=author.username,
+        batch_size=2, stdout=StringIO(),
+    )
+    assert Note.objects.filter(author=author).count() == 6
+    slugs = set(Note.objects.values_list('slug', flat=True))
+    assert {'zametka-0', 'zametka-0-2'} <= slugs
+    assert not (jsonl_file.parent / 'notes.jsonl.checkpoint').exists()
+
+
+def test_import_csv_with_author_column(tmp_path, author):
+    path = tmp_path / 'notes.csv'
+    path.write_text(
+        'title,text,slug,author\n'
+        f'Первая,"Текст, с запятой",first,{author.username}\n',
+        encoding='utf-8',
+    )
+    call_command('import_notes', str(path), stdout=StringIO())
+    note = Note.objects.get()
+    assert (note.slug, note.text, note.author) == (
+        'first', 'Текст, с запятой', author
+    )
+
+
+def test_import_resumes_from_checkpoint(jsonl_file, author):
+    checkpoint = jsonl_file.parent / 'notes.jsonl.checkpoint'
+    checkpoint.write_text('4')
+    call_command(
+        'import_notes', str(jsonl_file), author=author.username,
+        stdout=StringIO(),
+    )
+    assert Note.objects.count() == 2
+
+
+def test_import_skips_batch_written_before_crash(
+    tmp_path, author, monkeypatch
+):
+    path = tmp_path / 'notes.jsonl'
+    path.write_text('\n'.join(
+        json.dumps({'title': f'Заметка {index}', 'text': 'Текст',
+                    'slug': f'note-{index}'})
+        for index in range(3)
+    ), encoding='utf-8')
+    checkpoints = []
+
+    def crash_after_first_batch(command, done):
+        # Пачка записана, а контрольная точка — нет.
+        if done:
+            raise KeyboardInterrupt
+        checkpoints.append(done)
+        write_checkpoint(command, done)
+
+    write_checkpoint = Command.write_checkpoint
+    monkeypatch.setattr(Command, 'write_checkpoint', crash_after_first_batch)
+    with pytest.raises(KeyboardInterrupt):
+        call_command(
+            'import_notes', str(path), author=author.username,
+            batch_size=2, stdout=StringIO(),
+        )
+    monkeypatch.undo()
+    call_command(
+        'import_notes', str(path), author=author.username,
+        batch_size=2, stdout=StringIO(),
+    )
+    assert checkpoints == [0]
+    assert sorted(Note.objects.values_list('slug', flat=True)) == [
+        'note-0', 'note-1', 'note-2',
+    ]
+
+
+@pytest.mark.django_db
+def test_import_unknown_author_fails(jsonl_file):
+    with pytest.raises(CommandError):
+        call_command(
+            'import_notes', str(jsonl_file), author='nobody', stdout=StringIO()
+        )
+    assert Note.objects.count() == 0
+
+
+def test_import_in_background(jsonl_file, author):
+    call_command(
+        'import_notes', str(jsonl_file), author=author.username,
+        background=True, stdout=StringIO(),
+    )
+    assert not Note.objects.exists()
+    task = Task.objects.get()
+    assert task.params['path'] == str(jsonl_file)
+    work(threading.Event(), once=True)
+    task.refresh_from_db()
+    assert task.status == Task.DONE
+    assert Note.objects.filter(author=author).count() == 6
@@ -0,0 +1,138 @@
+import re
+
+import pytest
+
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.contrib.auth.models import AnonymousUser
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from notes.forms import NoteForm
+from notes.models import AuthorStats, Note, Task
+from notes.pagination import KeysetPage
+from notes.rendering import split_url
+from notes.revisions import diff_lines, load_versions
+from notes.views import task_state
+
+pytest.importorskip('jinja2')
+
+# Django и MarkupSafe по-разному записывают экранированные кавычки.
+ENTITIES = {'&#x27;': '&#39;', '&quot;': '&#34;'}
+CSRF_VALUE = re.compile(r'(name="csrfmiddlewaretoken") value="[^"]+"')
+
+
+def normalize(html):
+    html = CSRF_VALUE.sub(r'\1', html)
+    for entity, replacement in ENTITIES.items():
+        html = html.replace(entity, replacement)
+    return ' '.join(html.split())
+
+
+@pytest.fixture
+def jinja2_engine(settings):
+    from django.template.backends.jinja2 import Jinja2
+
+    params = dict(settings.JINJA2_TEMPLATES, NAME='jinja2')
+    del params['BACKEND']
+    return Jinja2(params)
+
+
+@pytest.fixture
+def tricky_note(author):
+    note = Note.objects.create(
+        title='<b>"Кавычки" & \'апострофы\'</b>',
+        text='Текст <script>alert(1)</script>',
+        author=author,
+    )
+    note.text += '\n<i>Вторая строка</i>'
+    note.save()
+    return note
+
+
+def context_for(name, note):
+    prefix, suffix = split_url('notes:detail')
+    versions = load_versions(note, 1)
+    links = {'detail_url_prefix': prefix, 'detail_url_suffix': suffix}
+    task = Task(
+        id=5,
+        name='export',
+        status=Task.DONE,
+        attempts=2,
+        created=note.modified,
+        finished=note.modified,
+        result={'file': '5-notes.csv', 'filename': note.title},
+    )
+    return {
+        'notes/home.html': {'stats': AuthorStats(
+            note_count=2, text_length=10, last_modified=note.modified
+        )},
+        'notes/success.html': {},
+        'notes/list.html': {
+            'object_list': [note],
+            'page_obj': KeysetPage([note], next_cursor=7, prev_cursor=3),
+            'tags': [('<b>', 2), ('работа и дом', 1)],
+            'tag_filter': [['<b>', 'дом'], ['работа']],
+            'tag_query': '&tag=%3Cb%3E%2C%D0%B4%D0%BE%D0%BC',
+            'stats': AuthorStats(note_count=1),
+            **links,
+        },
+        'notes/search.html': {
+            'object_list': [note], 'query': '"<&>"', **links
+        },
+        'notes/detail.html': {'note': note},
+        'notes/history.html': {
+            'note': note, 'revisions': note.revisions.all(), 'current': 2,
+        },
+        'notes/revision.html': {
+            'note': note,
+            'version': versions[1],
+            'previous': None,
+            'diff': list(diff_lines('', versions[1].text)),
+            'current': 2,
+        },
+        'notes/delete.html': {'note': note},
+        'notes/bulk_delete.html': {'object_list': [note]},
+        'notes/export_start.html': {
+            'filename': note.title, 'limit_reached': True,
+        },
+        'notes/task.html': {
+            'object': task, 'state': task_state(task), 'refresh_seconds': 2,
+        },
+        'notes/form.html': {
+            'form': NoteForm(data={'title': '', 'text': note.text}),
+        },
+        'registration/login.html': {
+            'form': AuthenticationForm(data={'username': note.title}),
+        },
+        'registration/logout.html': {},
+        'registration/signup.html': {'form': UserCreationForm()},
+    }[name]
+
+
+@pytest.mark.parametrize('name', (
+    'notes/home.html',
+    'notes/success.html',
+    'notes/list.html',
+    'notes/search.html',
+    'notes/detail.html',
+    'notes/history.html',
+    'notes/revision.html',
+    'notes/delete.html',
+    'notes/bulk_delete.html',
+    'notes/export_start.html',
+    'notes/task.html',
+    'notes/form.html',
+    'registration/login.html',
+    'registration/logout.html',
+    'registration/signup.html',
+))
+@pytest.mark.parametrize('logged_in', (True, False))
+def test_jinja2_output_matches_django(
+    jinja2_engine, tricky_note, name, logged_in
+):
+    request = RequestFactory().get('/add/')
+    request.user = tricky_note.author if logged_in else AnonymousUser()
+    context = context_for(name, tricky_note)
+    expected = render_to_string(name, context, request)
+    rendered = jinja2_engine.get_template(name).render(context, request)
+    assert normalize(rendered) == normalize(expected)
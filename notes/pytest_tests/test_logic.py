@@ -1,14 +1,34 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
 import pytest
 
 from http import HTTPStatus
 
 from pytest_django.asserts import assertRedirects, assertFormError
 
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
+from django.utils import timezone
 from pytils.translit import slugify
 
-from notes.forms import WARNING
-from notes.models import Note
+from notes.bulk import create_notes, purge_notes
+from notes.checks import check_compression
+from notes.fields import PREFIX, CompressedText
+from notes.forms import WARNING, NoteForm
+from notes.models import (
+    AuthorStats, Note, NoteChange, SlugRegistry, Tag, Task
+)
+from notes.revisions import load_versions
+from notes.search import search_notes
+from notes.sharding import ShardMoved
+from notes.slugs import SlugAllocator
+from notes import tasks
+from notes.tasks import TaskType, claim, enqueue, work
+from notes.tags import set_tags
 
 
 def test_user_can_create_note(author_client, author, form_data):
@@ -105,3 +125,548 @@ def test_other_user_cant_delete_note(not_author_client, slug_for_args):
     response = not_author_client.post(url)
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert Note.objects.count() == 1
+
+
+def test_search_index_follows_note_changes(author_client, author, note):
+    url = reverse('notes:search')
+    note.text = 'Обновлённое содержимое'
+    note.save()
+    response = author_client.get(url, {'q': 'содержимое'})
+    assert list(response.context['object_list']) == [note]
+    note.delete()
+    response = author_client.get(url, {'q': 'содержимое'})
+    assert list(response.context['object_list']) == []
+
+
+@pytest.mark.django_db
+def test_rebuild_search_index_command(note):
+    call_command('rebuild_search_index')
+    assert search_notes(note.author, note.title) == [note]
+
+
+def test_empty_slug_gets_free_suffix(author_client, author, form_data):
+    form_data.pop('slug')
+    expected_slug = slugify(form_data['title'])
+    Note.objects.create(
+        title=form_data['title'], text='Текст', slug=expected_slug,
+        author=author,
+    )
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertRedirects(response, reverse('notes:success'))
+    assert Note.objects.filter(slug=f'{expected_slug}-2').exists()
+
+
+@pytest.mark.django_db
+def test_slug_allocator_uses_single_query(
+    author, django_assert_num_queries
+):
+    Note.objects.bulk_create(
+        Note(title='Заметка', text='Текст', slug=slug, author=author)
+        for slug in ('zametka', 'zametka-2', 'zametka-7', 'zametka-x')
+    )
+    allocator = SlugAllocator(Note)
+    with django_assert_num_queries(1):
+        assert allocator.allocate_for_title('Заметка') == 'zametka-8'
+        assert allocator.allocate_for_title('Заметка') == 'zametka-9'
+
+
+def test_create_notes_renames_taken_slugs(author, note):
+    created = create_notes([
+        Note(title='Первая', text='Текст', slug=note.slug, author=author),
+        Note(title='Вторая', text='Текст', slug='Моя заметка', author=author),
+        Note(title='Третья', text='Текст', slug='moya-zametka', author=author),
+    ])
+    assert [item.slug for item in created] == [
+        f'{note.slug}-2', 'moya-zametka', 'moya-zametka-2',
+    ]
+
+
+@pytest.mark.django_db
+def test_slug_allocator_reads_only_numbered_variants(author):
+    Note.objects.bulk_create(
+        Note(title='Заметка', text='Текст', slug=slug, author=author)
+        for slug in (
+            'zametka', 'zametka-3', 'zametka-plan', 'zametka-2024-plan',
+            'zametka-2x', 'zametkaa-5',
+        )
+    )
+    allocator = SlugAllocator(Note)
+    allocator.prefetch(['zametka'])
+    assert allocator.taken == {'zametka', 'zametka-3'}
+    assert allocator.allocate('zametka') == 'zametka-4'
+
+
+@pytest.mark.django_db
+def test_note_save_retries_on_slug_race(author, monkeypatch):
+    Note.objects.create(
+        title='Заметка', text='Текст', slug='zametka', author=author
+    )
+    results = iter(('zametka', 'zametka-2'))
+    monkeypatch.setattr(
+        SlugAllocator, 'allocate_for_title', lambda self, title: next(results)
+    )
+    note = Note.objects.create(title='Заметка', text='Текст', author=author)
+    assert note.slug == 'zametka-2'
+
+
+def test_slug_race_shows_form_error(
+    author_client, author, form_data, monkeypatch
+):
+    # Проверка формы проходит, но к моменту вставки slug уже занят.
+    monkeypatch.setattr(NoteForm, 'clean_slug', lambda form: form_data['slug'])
+    monkeypatch.setattr(NoteForm, 'validate_unique', lambda form: None)
+    Note.objects.create(
+        title='Заметка', text='Текст', slug=form_data['slug'], author=author
+    )
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertFormError(
+        response, 'form', 'slug', errors=(form_data['slug'] + WARNING)
+    )
+    assert Note.objects.count() == 1
+
+
+def stored_text(note):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT text FROM notes_note WHERE id = %s', [note.id])
+        return cursor.fetchone()[0]
+
+
+@pytest.fixture
+def log_note(author):
+    return Note.objects.create(
+        title='Лог', text='ERROR кофеварка перегрелась\n' * 1000,
+        author=author,
+    )
+
+
+def test_large_text_is_stored_compressed(log_note):
+    assert len(stored_text(log_note)) < len(log_note.text) / 10
+    assert Note.objects.get(id=log_note.id).text == log_note.text
+
+
+def test_small_text_is_stored_as_is(note):
+    assert stored_text(note) == note.text
+
+
+def test_text_is_decompressed_on_access(log_note):
+    note = Note.objects.get(id=log_note.id)
+    assert isinstance(note.__dict__['text'], CompressedText)
+    note.title = 'Новый заголовок'
+    note.save()
+    assert isinstance(note.__dict__['text'], CompressedText)
+    assert note.text == log_note.text
+
+
+def test_text_with_compression_prefix_round_trips(author):
+    text = f'{PREFIX}zlib:1:не сжатый текст'
+    note = Note.objects.create(title='Префикс', text=text, author=author)
+    assert Note.objects.get(id=note.id).text == text
+
+
+def test_compressed_text_is_searchable(author, log_note):
+    assert search_notes(author, 'кофеварка') == [log_note]
+    call_command('rebuild_search_index')
+    assert search_notes(author, 'перегрелась') == [log_note]
+
+
+def test_compressed_text_is_searchable_without_index(
+    author, log_note, note, monkeypatch
+):
+    monkeypatch.setattr('notes.search.is_supported', lambda using: False)
+    assert search_notes(author, 'Кофеварка') == [log_note]
+    assert search_notes(author, 'Текст заметки') == [note]
+    assert search_notes(author, 'zlib') == []
+
+
+def test_admin_search_without_index(admin_client, log_note, monkeypatch):
+    monkeypatch.setattr('notes.admin.is_supported', lambda: False)
+    response = admin_client.get(
+        reverse('admin:notes_note_changelist'), {'q': 'кофеварка'}
+    )
+    assert list(response.context['cl'].result_list) == [log_note]
+
+
+def test_unknown_compression_codec(settings, author):
+    settings.NOTES_COMPRESSION = 'lz4'
+    assert [error.id for error in check_compression(None)] == ['notes.E001']
+    with pytest.raises(ImproperlyConfigured):
+        Note.objects.create(title='Лог', text='x' * 5000, author=author)
+
+
+def test_compression_report(log_note, note):
+    output = StringIO()
+    call_command('compression_report', stdout=output)
+    assert 'Заметок: 2, сжато: 1.' in output.getvalue()
+
+
+def edit_note(note, number):
+    lines = note.text.splitlines(keepends=True)
+    lines[number % len(lines)] = f'Строка {number} исправлена\n'
+    note.title = f'Правка {number}'
+    note.text = ''.join(lines)
+    note.save()
+    return note.title, note.text
+
+
+@pytest.fixture
+def long_note(author):
+    return Note.objects.create(
+        title='Длинная', author=author,
+        text=''.join(f'Строка {number}: {number ** 7}\n'
+                     for number in range(300)),
+    )
+
+
+def test_every_version_is_restorable(settings, long_note):
+    settings.NOTES_REVISION_SNAPSHOT_INTERVAL = 4
+    versions = [(long_note.title, long_note.text)]
+    versions += [edit_note(long_note, number) for number in range(10)]
+    assert long_note.revisions.filter(is_snapshot=True).count() == 2
+    for number, (title, text) in enumerate(versions, start=1):
+        version = load_versions(long_note, number)[number]
+        assert (version.title, version.text) == (title, text)
+
+
+def test_revisions_grow_with_edits(long_note):
+    for number in range(15):
+        edit_note(long_note, number)
+    stored = sum(len(data) for data in long_note.revisions.filter(
+        is_snapshot=False
+    ).values_list('data', flat=True))
+    assert stored < len(long_note.text)
+
+
+def test_author_can_restore_version(author_client, note, form_data):
+    author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    url = reverse('notes:history', args=(form_data['slug'],))
+    assert 'Версия 2' in author_client.get(url).content.decode()
+    url = reverse('notes:revision', args=(form_data['slug'], 1))
+    response = author_client.get(url)
+    assert response.context['version'].text == note.text
+    response = author_client.post(
+        reverse('notes:restore', args=(form_data['slug'], 1))
+    )
+    assertRedirects(
+        response, reverse('notes:detail', args=(form_data['slug'],))
+    )
+    restored = Note.objects.get()
+    assert (restored.title, restored.text) == (note.title, note.text)
+    assert restored.revisions.count() == 2
+
+
+def test_prune_keeps_latest_versions(settings, long_note):
+    settings.NOTES_REVISION_SNAPSHOT_INTERVAL = 4
+    texts = [edit_note(long_note, number)[1] for number in range(10)]
+    call_command('prune_note_revisions', '--keep', '3', stdout=StringIO())
+    assert list(
+        long_note.revisions.values_list('number', flat=True).order_by('number')
+    ) == [8, 9, 10]
+    assert load_versions(long_note, 8)[8].text == texts[6]
+
+
+@pytest.fixture
+def sharded(settings):
+    """Шардирование с единственным шардом — основной базой."""
+    settings.NOTES_SHARDS = ['default']
+    return settings
+
+
+def registry():
+    return set(SlugRegistry.objects.values_list('id', 'slug', 'author_id'))
+
+
+def test_sharded_notes_get_ids_from_registry(
+    sharded, author_client, author, form_data
+):
+    author_client.post(reverse('notes:add'), data=form_data)
+    form_data['slug'] = ''
+    author_client.post(reverse('notes:add'), data=form_data)
+    create_notes([Note(title='Пачка', text='Текст', author=author)])
+    assert registry() == set(
+        Note.objects.values_list('id', 'slug', 'author_id')
+    )
+    assert len(registry()) == 3
+
+
+def test_slug_taken_in_other_shard(
+    sharded, author_client, not_author, form_data
+):
+    SlugRegistry.objects.create(slug=form_data['slug'], author=not_author)
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertFormError(
+        response, 'form', 'slug', errors=(form_data['slug'] + WARNING)
+    )
+    form_data['slug'] = ''
+    author_client.post(reverse('notes:add'), data=form_data)
+    assert Note.objects.get().slug == slugify(form_data['title'])
+
+
+def test_deleted_note_frees_registry_slug(sharded, author_client, form_data):
+    author_client.post(reverse('notes:add'), data=form_data)
+    author_client.post(reverse('notes:delete', args=(form_data['slug'],)))
+    assert registry() == set()
+
+
+def test_delete_rolled_back_with_shard(
+    sharded, monkeypatch, author_client, author, form_data
+):
+    author_client.post(reverse('notes:add'), data=form_data)
+    note = Note.objects.get()
+
+    def moved(author_id, using):
+        raise ShardMoved(using)
+
+    monkeypatch.setattr('notes.signals.check_shard', moved)
+    with pytest.raises(ShardMoved):
+        note.delete()
+    assert Note.objects.filter(pk=note.pk).exists()
+    assert registry() == {(note.pk, note.slug, author.pk)}
+    assert not NoteChange.objects.filter(action=NoteChange.DELETED).exists()
+    assert AuthorStats.objects.get(author=author).note_count == 1
+
+
+@pytest.fixture
+def many_notes(author, not_author):
+    create_notes([
+        Note(title=f'Заметка {number}', text='Текст', author=author)
+        for number in range(5)
+    ])
+    create_notes([Note(title='Чужая', text='Текст', author=not_author)])
+    return list(Note.objects.filter(author=author).order_by('id'))
+
+
+def test_bulk_delete_confirmation(author_client, many_notes):
+    url = reverse('notes:bulk_delete')
+    ids = [note.id for note in many_notes[:2]]
+    response = author_client.get(url, {'ids': ids})
+    assert list(response.context['object_list']) == many_notes[:2]
+    assertRedirects(author_client.get(url), reverse('notes:list'))
+
+
+def test_author_can_bulk_delete_notes(author_client, many_notes):
+    foreign = Note.objects.get(title='Чужая')
+    ids = [note.id for note in many_notes[:3]] + [foreign.id]
+    response = author_client.post(
+        reverse('notes:bulk_delete'), data={'ids': ids}
+    )
+    assertRedirects(response, reverse('notes:success'))
+    assert list(Note.objects.order_by('id')) == many_notes[3:] + [foreign]
+    assert set(NoteChange.objects.filter(
+        action=NoteChange.DELETED
+    ).values_list('note_id', flat=True)) == set(ids[:3])
+
+
+@pytest.mark.parametrize('bad_id', (str(2 ** 64), '²'))
+def test_bulk_delete_skips_invalid_ids(author_client, many_notes, bad_id):
+    url = reverse('notes:bulk_delete')
+    ids = [bad_id, many_notes[0].id]
+    response = author_client.get(url, {'ids': ids})
+    assert list(response.context['object_list']) == many_notes[:1]
+    response = author_client.post(url, data={'ids': ids})
+    assertRedirects(response, reverse('notes:success'))
+    assert not Note.objects.filter(id=many_notes[0].id).exists()
+
+
+def test_bulk_delete_is_bounded(monkeypatch, author_client, many_notes):
+    monkeypatch.setattr('notes.views.IN_CHUNK_SIZE', 2)
+    author_client.post(
+        reverse('notes:bulk_delete'),
+        data={'ids': [note.id for note in many_notes]},
+    )
+    assert list(
+        Note.objects.filter(title__startswith='Заметка').order_by('id')
+    ) == many_notes[2:]
+
+
+def test_purge_notes_in_batches(author, many_notes):
+    assert purge_notes(author.pk, batch_size=2, pause=0) == 5
+    assert Note.objects.filter(author=author).count() == 0
+    assert Note.objects.count() == 1
+
+
+def test_purge_user(author, many_notes, django_user_model):
+    call_command('purge_user', author.username, '--batch-size=2', '--pause=0',
+                 stdout=StringIO())
+    assert not django_user_model.objects.filter(pk=author.pk).exists()
+    assert not NoteChange.objects.filter(author_id=author.pk).exists()
+    assert Note.objects.count() == 1
+
+
+def tag_counts(author):
+    return dict(Tag.objects.filter(author=author).values_list(
+        'name', 'note_count'
+    ))
+
+
+def test_tag_counts_follow_note_changes(author_client, author, form_data):
+    form_data['tags'] = 'Работа,  дом, работа'
+    author_client.post(reverse('notes:add'), data=form_data)
+    note = Note.objects.get()
+    assert sorted(note.tags.values_list('name', flat=True)) == [
+        'дом', 'работа'
+    ]
+    create_notes([Note(title='Вторая', text='Текст', author=author)])
+    set_tags(Note.objects.get(title='Вторая'), ['дом'])
+    assert tag_counts(author) == {'дом': 2, 'работа': 1}
+    form_data['tags'] = 'отпуск'
+    author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    assert tag_counts(author) == {'дом': 1, 'работа': 0, 'отпуск': 1}
+    author_client.post(reverse('notes:delete', args=(note.slug,)))
+    assert tag_counts(author) == {'дом': 1, 'работа': 0, 'отпуск': 0}
+
+
+def test_bulk_delete_releases_tags(author_client, author, many_notes):
+    for note in many_notes:
+        set_tags(note, ['все'])
+    author_client.post(
+        reverse('notes:bulk_delete'),
+        data={'ids': [note.id for note in many_notes[:3]]},
+    )
+    assert tag_counts(author) == {'все': 2}
+    purge_notes(author.pk, pause=0)
+    assert tag_counts(author) == {'все': 0}
+
+
+def stats(author):
+    return AuthorStats.objects.filter(author=author).values_list(
+        'note_count', 'text_length', 'last_modified'
+    ).first()
+
+
+def test_stats_follow_note_changes(author_client, author, form_data):
+    author_client.post(reverse('notes:add'), data=form_data)
+    note = Note.objects.get()
+    assert stats(author) == (1, len(form_data['text']), note.modified)
+    form_data['text'] = 'Короче'
+    author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    note.refresh_from_db()
+    assert stats(author) == (1, 6, note.modified)
+    create_notes([
+        Note(title='Пачка', text='Текст пачки', author=author),
+        Note(title='Пачка', text='Ещё', author=author),
+    ])
+    latest = Note.objects.latest('modified')
+    assert stats(author) == (3, 6 + 11 + 3, latest.modified)
+    author_client.post(reverse('notes:delete', args=(latest.slug,)))
+    author_client.post(reverse('notes:bulk_delete'), data={'ids': [note.id]})
+    remaining = Note.objects.get()
+    assert stats(author) == (1, len(remaining.text), remaining.modified)
+
+
+def test_reconcile_author_stats(author, not_author, note, many_notes):
+    AuthorStats.objects.filter(author=author).update(
+        note_count=100, text_length=0
+    )
+    AuthorStats.objects.filter(author=not_author).delete()
+    expected = {
+        user.pk: (
+            Note.objects.filter(author=user).count(),
+            sum(len(item.text) for item in Note.objects.filter(author=user)),
+            Note.objects.filter(author=user).latest('modified').modified,
+        )
+        for user in (author, not_author)
+    }
+    out = StringIO()
+    call_command('reconcile_author_stats', '--batch-size=1', stdout=out)
+    assert 'Исправлено сводок: 2.' in out.getvalue()
+    assert {
+        user.pk: stats(user) for user in (author, not_author)
+    } == expected
+    call_command('reconcile_author_stats', stdout=out)
+    assert 'Исправлено сводок: 0.' in out.getvalue()
+
+
+def test_background_export(
+    settings, tmp_path, author_client, not_author_client, many_notes
+):
+    settings.TASK_RESULTS_DIR = tmp_path
+    url = reverse('notes:export_start') + '?format=csv'
+    assert author_client.get(url).status_code == HTTPStatus.OK
+    response = author_client.post(url)
+    task = Task.objects.get()
+    assertRedirects(response, reverse('notes:task', args=(task.pk,)))
+    assert 'http-equiv="refresh"' in author_client.get(
+        reverse('notes:task', args=(task.pk,))
+    ).content.decode()
+    status_url = reverse('notes:task_status', args=(task.pk,))
+    assert author_client.get(status_url).json()['status'] == Task.QUEUED
+    assert not_author_client.get(status_url).status_code == (
+        HTTPStatus.NOT_FOUND
+    )
+    work(threading.Event(), once=True)
+    state = author_client.get(status_url).json()
+    assert (state['status'], state['finished']) == (Task.DONE, True)
+    response = author_client.get(state['download_url'])
+    assert response['Content-Type'] == 'text/csv'
+    content = b''.join(response.streaming_content).decode()
+    assert content.count('Заметка') == 5
+    assert 'Чужая' not in content
+
+
+def test_active_exports_are_limited(settings, author_client):
+    settings.TASK_MAX_ACTIVE_EXPORTS = 1
+    url = reverse('notes:export_start') + '?format=csv'
+    author_client.post(url)
+    response = author_client.post(url)
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert Task.objects.count() == 1
+
+
+def test_prune_tasks(settings, tmp_path, author, not_author):
+    settings.TASK_RESULTS_DIR = tmp_path
+    params = {'author_id': author.pk, 'file_format': 'csv'}
+    old, recent = enqueue('export', params), enqueue('export', params)
+    gone = enqueue('export', dict(params, author_id=not_author.pk))
+    work(threading.Event(), once=True)
+    Task.objects.filter(pk=old.pk).update(
+        finished=timezone.now() - timedelta(days=settings.TASK_KEEP_DAYS + 1)
+    )
+    Task.objects.filter(pk=gone.pk).delete()
+    out = StringIO()
+    call_command('prune_tasks', stdout=out)
+    assert 'Удалено задач: 1.' in out.getvalue()
+    assert list(Task.objects.values_list('pk', flat=True)) == [recent.pk]
+    assert [path.name for path in tmp_path.iterdir()] == [
+        f'{recent.pk}-notes.csv'
+    ]
+
+
+def test_failed_task_is_retried(db, settings, monkeypatch):
+    settings.TASK_RETRY_DELAY = 0
+
+    def fail(task):
+        raise ValueError('сбой')
+
+    monkeypatch.setitem(tasks.registry, 'fail', TaskType(fail, 1, 2))
+    task = enqueue('fail')
+    work(threading.Event(), once=True)
+    task.refresh_from_db()
+    assert (task.status, task.attempts) == (Task.FAILED, 2)
+    assert 'ValueError: сбой' in task.error
+
+
+def test_claim_respects_concurrency_and_reclaims_stale_tasks(
+    db, settings, monkeypatch
+):
+    monkeypatch.setitem(tasks.registry, 'slow', TaskType(None, 1, 2))
+    first = enqueue('slow')
+    second = enqueue('slow')
+    assert claim('w1').pk == first.pk
+    assert claim('w2') is None
+    stale = timezone.now() - timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    Task.objects.filter(pk=first.pk).update(heartbeat=stale)
+    reclaimed = claim('w2')
+    assert (reclaimed.pk, reclaimed.worker, reclaimed.attempts) == (
+        first.pk, 'w2', 2
+    )
+    Task.objects.filter(pk=first.pk).update(heartbeat=stale)
+    assert claim('w3').pk == second.pk
+    first.refresh_from_db()
+    assert first.status == Task.FAILED
+
+
+def test_purge_user_task(author, many_notes, django_user_model):
+    enqueue('purge_user', {'user_id': author.pk})
+    work(threading.Event(), once=True)
+    assert not django_user_model.objects.filter(pk=author.pk).exists()
+    assert Note.objects.count() == 1
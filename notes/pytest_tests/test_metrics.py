@@ -0,0 +1,85 @@
+import json
+import re
+
+import pytest
+from http import HTTPStatus
+
+from django.urls import reverse
+
+from notes.metrics import REGISTRY
+from notes.models import Note
+
+
+@pytest.fixture(autouse=True)
+def metrics_enabled(settings):
+    settings.METRICS_ENABLED = True
+
+
+def read_metric(client, sample):
+    body = client.get(reverse('metrics')).content.decode()
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', body, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_requests_are_counted_by_route(author_client, client):
+    sample = (
+        'yanote_http_requests_total'
+        '{view="notes:list",method="GET",status="200"}'
+    )
+    before = read_metric(client, sample)
+    author_client.get(reverse('notes:list'))
+    assert read_metric(client, sample) == before + 1
+    assert read_metric(
+        client,
+        'yanote_http_request_duration_seconds_count{view="notes:list"}',
+    ) >= 1
+
+
+@pytest.mark.django_db
+def test_note_writes_are_counted(client, author):
+    sample = 'yanote_note_writes_total{action="created"}'
+    before = read_metric(client, sample)
+    Note.objects.create(title='Заметка', text='Текст', author=author)
+    assert read_metric(client, sample) == before + 1
+
+
+def test_page_cache_hits_are_counted(author_client, client):
+    url = reverse('notes:list')
+    author_client.get(url)
+    before = read_metric(client, 'yanote_page_cache_hits_total')
+    author_client.get(url)
+    assert read_metric(client, 'yanote_page_cache_hits_total') == before + 1
+
+
+@pytest.mark.django_db
+def test_metrics_of_other_workers_are_aggregated(client, settings, tmp_path):
+    settings.METRICS_DIR = str(tmp_path)
+    sample = 'yanote_note_writes_total{action="deleted"}'
+    before = read_metric(client, sample)
+    (tmp_path / 'other-worker.json').write_text(json.dumps({
+        'yanote_note_writes_total': [[['deleted'], 5.0]],
+    }))
+    assert read_metric(client, sample) == before + 5
+    REGISTRY.flush()
+    assert (tmp_path / REGISTRY.filename).exists()
+
+
+@pytest.mark.parametrize(
+    'enabled, remote_addr, expected_status',
+    (
+        (False, '127.0.0.1', HTTPStatus.NOT_FOUND),
+        (True, '127.0.0.1', HTTPStatus.OK),
+        (True, '203.0.113.5', HTTPStatus.FORBIDDEN),
+    ),
+)
+def test_metrics_access(
+    client, settings, enabled, remote_addr, expected_status
+):
+    settings.METRICS_ENABLED = enabled
+    response = client.get(reverse('metrics'), REMOTE_ADDR=remote_addr)
+    assert response.status_code == expected_status
+
+
+def test_metrics_are_open_to_staff(admin_client):
+    response = admin_client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5')
+    assert response.status_code == HTTPStatus.OK
@@ -0,0 +1,329 @@
+import json
+import logging
+import sqlite3
+from contextlib import closing
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from notes import sessions
+from notes.auth import CachedModelBackend
+from notes.bulk import create_notes
+from notes.checks import check_session_cache
+from notes.middleware import ReplicaMiddleware
+from notes.models import AuthorShard, Note, NoteRevision
+from notes.sharding import for_author, shard_for_author
+
+
+@pytest.fixture
+def instrumented(settings):
+    settings.PERF_INSTRUMENTATION = True
+    settings.PERF_NPLUSONE_THRESHOLD = 100
+    return settings
+
+
+def test_server_timing_header(instrumented, author_client, note):
+    response = author_client.get(reverse('notes:detail', args=(note.slug,)))
+    timings = {
+        part.split(';')[0]: part for part in
+        response['Server-Timing'].split(', ')
+    }
+    assert set(timings) == {'mw', 'view', 'tpl', 'sql', 'total'}
+    assert 'queries"' in timings['sql']
+
+
+def test_request_is_logged(instrumented, author_client, caplog):
+    with caplog.at_level(logging.INFO, logger='notes.performance'):
+        author_client.get(reverse('notes:list'))
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record['view'] == 'notes:list'
+    assert record['queries'] > 0
+
+
+def test_repeated_queries_are_flagged(instrumented, author_client, caplog):
+    instrumented.PERF_NPLUSONE_THRESHOLD = 1
+    with caplog.at_level(logging.INFO, logger='notes.performance'):
+        author_client.get(reverse('notes:list'))
+    warnings = [
+        record for record in caplog.records
+        if record.levelno == logging.WARNING
+    ]
+    assert json.loads(warnings[0].getMessage())['nplusone']
+
+
+def test_disabled_by_default(author_client):
+    response = author_client.get(reverse('notes:home'))
+    assert not response.has_header('Server-Timing')
+
+
+@pytest.fixture
+def profiling(settings, tmp_path):
+    settings.PROFILER_SAMPLE_RATE = 1
+    settings.PROFILER_THRESHOLD_MS = 0
+    settings.PROFILER_DIR = tmp_path
+    return settings
+
+
+def test_slow_request_is_profiled(profiling, author_client, tmp_path):
+    author_client.get(reverse('notes:list'))
+    profiles = list(tmp_path.glob('*.prof'))
+    assert len(profiles) == 1
+    assert 'notes_list' in profiles[0].name
+    output = StringIO()
+    call_command('profiles', '--latest', stdout=output)
+    assert 'function calls' in output.getvalue()
+
+
+def test_fast_request_is_not_profiled(profiling, author_client, tmp_path):
+    profiling.PROFILER_THRESHOLD_MS = 60_000
+    author_client.get(reverse('notes:list'))
+    assert not list(tmp_path.glob('*.prof'))
+
+
+def test_profiles_are_rotated(profiling, author_client, tmp_path):
+    profiling.PROFILER_MAX_FILES = 2
+    for _ in range(4):
+        author_client.get(reverse('notes:list'))
+    assert len(list(tmp_path.glob('*.prof'))) == 2
+
+
+@pytest.fixture
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica1']
+    return settings
+
+
+def route_read(request):
+    """База для чтения внутри запроса и ответ ReplicaMiddleware."""
+    databases = []
+
+    def view(request):
+        databases.append(router.db_for_read(Note))
+        return HttpResponse()
+
+    response = ReplicaMiddleware(view)(request)
+    return databases[0], response
+
+
+def test_safe_request_reads_from_replica(replicas, rf):
+    database, response = route_read(rf.get(reverse('notes:list')))
+    assert database == 'replica1'
+    assert ReplicaMiddleware.PIN_COOKIE not in response.cookies
+
+
+def test_write_pins_reads_to_primary(replicas, rf):
+    database, response = route_read(rf.post(reverse('notes:add')))
+    assert database == 'default'
+    cookie = response.cookies[ReplicaMiddleware.PIN_COOKIE]
+    assert cookie['max-age'] == replicas.REPLICA_PIN_SECONDS
+    request = rf.get(reverse('notes:success'))
+    request.COOKIES[ReplicaMiddleware.PIN_COOKIE] = cookie.value
+    assert route_read(request)[0] == 'default'
+
+
+def test_reads_outside_requests_use_primary(replicas):
+    assert router.db_for_read(Note) == 'default'
+
+
+@pytest.fixture
+def replica_after_sync(settings, tmp_path, author):
+    """Реплика, синхронизированная до входа пользователя."""
+    replica = tmp_path / 'replica.sqlite3'
+    settings.REPLICA_PATHS = [str(replica)]
+    call_command('sync_replicas', stdout=StringIO())
+    connections.databases['replica1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': replica.resolve().as_uri() + '?mode=ro',
+        'OPTIONS': {'uri': True},
+    }
+    connections.ensure_defaults('replica1')
+    connections.prepare_test_settings('replica1')
+    settings.DATABASE_REPLICAS = ['replica1']
+    yield replica
+    connections['replica1'].close()
+    del connections['replica1']
+    del connections.databases['replica1']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_session_created_after_sync_is_read_from_primary(
+    replica_after_sync, client, author
+):
+    client.force_login(author)
+    response = client.get(reverse('notes:list'))
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sync_replicas(settings, tmp_path, note):
+    replica = tmp_path / 'replica.sqlite3'
+    settings.REPLICA_PATHS = [str(replica)]
+    call_command('sync_replicas', stdout=StringIO())
+    with closing(sqlite3.connect(replica)) as connection:
+        assert connection.execute(
+            'SELECT slug FROM notes_note'
+        ).fetchall() == [(note.slug,)]
+
+
+@pytest.fixture
+def shards(settings, author):
+    settings.NOTES_SHARDS = ['default', 'shard1']
+    AuthorShard.objects.create(author=author, shard='shard1')
+    return settings
+
+
+def test_notes_are_routed_to_author_shard(shards, author):
+    assert router.db_for_write(Note, instance=Note(author=author)) == (
+        'shard1'
+    )
+    assert router.db_for_read(Note) == 'default'
+    with for_author(author.pk):
+        assert router.db_for_read(Note) == 'shard1'
+        assert router.db_for_read(NoteRevision) == 'shard1'
+        assert router.db_for_read(get_user_model()) == 'default'
+
+
+@pytest.fixture
+def real_shard(settings, tmp_path, author):
+    """Шард shard1 в отдельном файле SQLite, автор живёт в нём."""
+    connections.databases['shard1'] = {
+        **connections.databases['default'],
+        'ENGINE': 'yanote.sqlite3',
+        'NAME': str(tmp_path / 'shard1.sqlite3'),
+        'SHARD': True,
+    }
+    connections.ensure_defaults('shard1')
+    connections.prepare_test_settings('shard1')
+    settings.NOTES_SHARDS = ['default', 'shard1']
+    call_command('migrate', database='shard1', verbosity=0)
+    AuthorShard.objects.create(author=author, shard='shard1')
+    yield settings
+    connections['shard1'].close()
+    del connections['shard1']
+    del connections.databases['shard1']
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+@pytest.mark.parametrize('file_format', ('jsonl', 'csv'))
+def test_streaming_export_reads_author_shard(
+    real_shard, author_client, author, file_format
+):
+    create_notes([
+        Note(title=f'Заметка {number}', text='Текст', author=author)
+        for number in range(3)
+    ])
+    response = author_client.get(
+        reverse('notes:export'), {'format': file_format}
+    )
+    body = b''.join(response.streaming_content).decode()
+    assert body.count('Заметка') == 3
+
+
+def test_shards_have_only_note_tables(shards):
+    assert router.allow_migrate('shard1', 'notes', model_name='note')
+    assert router.allow_migrate('shard1', 'notes', model_name='noterevision')
+    assert not router.allow_migrate('shard1', 'notes', model_name='notechange')
+    assert not router.allow_migrate('shard1', 'auth', model_name='user')
+    assert not router.allow_migrate('shard1', 'notes')
+    assert router.allow_migrate('default', 'notes', model_name='note')
+
+
+def test_existing_author_stays_in_default_shard(settings, note, not_author):
+    settings.NOTES_SHARDS = ['default', 'shard1']
+    assert shard_for_author(note.author_id) == 'default'
+    assert shard_for_author(not_author.pk) in settings.NOTES_SHARDS
+    assert AuthorShard.objects.count() == 2
+
+
+@pytest.fixture
+def fast_auth(settings, tmp_path):
+    settings.SESSION_ENGINE = 'notes.sessions'
+    settings.CACHES = {**settings.CACHES, 'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(tmp_path / 'sessions'),
+    }}
+    settings.SESSION_CACHE_ALIAS = 'sessions'
+    settings.AUTHENTICATION_BACKENDS = ['notes.auth.CachedModelBackend']
+    settings.SESSION_WRITE_BEHIND_SECONDS = 3600
+    return settings
+
+
+def test_fast_auth_skips_session_and_user_queries(
+    fast_auth, author_client, note
+):
+    url = reverse('notes:detail', args=(note.slug,))
+    author_client.get(url)
+    with CaptureQueriesContext(connection) as queries:
+        assert author_client.get(url).status_code == 200
+    tables = ' '.join(query['sql'] for query in queries)
+    assert 'django_session' not in tables
+    assert 'auth_user' not in tables
+
+
+def test_cached_user_is_reloaded_after_password_change(
+    fast_auth, author, django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    backend = CachedModelBackend()
+    backend.get_user(author.pk)
+    with django_assert_num_queries(0):
+        assert backend.get_user(author.pk) == author
+    with django_capture_on_commit_callbacks(execute=True):
+        author.set_password('new-password')
+        author.save()
+    assert backend.get_user(author.pk).check_password('new-password')
+
+
+def test_session_changes_are_written_behind(fast_auth, author_client):
+    session_key = author_client.session.session_key
+    store = sessions.SessionStore(session_key)
+    store['theme'] = 'dark'
+    store.save()
+    stored = Session.objects.get(session_key=session_key)
+    assert 'theme' not in stored.get_decoded()
+    assert sessions.SessionStore(session_key)['theme'] == 'dark'
+    assert sessions.flush_pending() == 1
+    stored = Session.objects.get(session_key=session_key)
+    assert stored.get_decoded()['theme'] == 'dark'
+
+
+def test_deleted_session_is_not_resurrected(fast_auth, author_client):
+    session_key = author_client.session.session_key
+    store = sessions.SessionStore(session_key)
+    store['theme'] = 'dark'
+    # Пользователь вышел в другом процессе, пока шёл этот запрос.
+    sessions.SessionStore(session_key).delete()
+    with pytest.raises(UpdateError):
+        store.save()
+    assert not sessions.SessionStore().exists(session_key)
+
+
+def test_session_missing_from_cache_is_saved_at_once(
+    fast_auth, author_client
+):
+    session_key = author_client.session.session_key
+    store = sessions.SessionStore(session_key)
+    store['theme'] = 'dark'
+    caches['sessions'].clear()
+    store.save()
+    stored = Session.objects.get(session_key=session_key)
+    assert stored.get_decoded()['theme'] == 'dark'
+
+
+def test_fast_sessions_need_shared_cache(fast_auth):
+    assert check_session_cache(None) == []
+    fast_auth.SESSION_CACHE_ALIAS = 'default'
+    assert [error.id for error in check_session_cache(None)] == [
+        'notes.E002'
+    ]
@@ -1,9 +1,12 @@
 import pytest
 from http import HTTPStatus
 
+from django.contrib.auth.models import Permission
 from django.urls import reverse
 from pytest_django.asserts import assertRedirects
 
+from notes.models import Task
+
 
 @pytest.mark.parametrize(
     'name',
@@ -39,6 +42,7 @@ def test_pages_availability_for_auth_user(not_author_client, name):
         ('notes:detail', pytest.lazy_fixture('slug_for_args')),
         ('notes:edit', pytest.lazy_fixture('slug_for_args')),
         ('notes:delete', pytest.lazy_fixture('slug_for_args')),
+        ('notes:history', pytest.lazy_fixture('slug_for_args')),
     )
 )
 def test_pages_availability_for_different_users(
@@ -55,8 +59,14 @@ def test_pages_availability_for_different_users(
         ('notes:detail', pytest.lazy_fixture('slug_for_args')),
         ('notes:edit', pytest.lazy_fixture('slug_for_args')),
         ('notes:delete', pytest.lazy_fixture('slug_for_args')),
+        ('notes:history', pytest.lazy_fixture('slug_for_args')),
         ('notes:add', None),
         ('notes:list', None),
+        ('notes:bulk_delete', None),
+        ('notes:export_start', None),
+        ('notes:task', (1,)),
+        ('notes:task_status', (1,)),
+        ('notes:task_download', (1,)),
         ('notes:success', None)
     ),
 )
@@ -66,3 +76,29 @@ def test_redirects(name, args, client):
     expected_url = f'{login_url}?next={url}'
     response = client.get(url)
     assertRedirects(response, expected_url)
+
+
+def test_users_are_deleted_only_by_purge(admin_client, author):
+    url = reverse('admin:auth_user_delete', args=(author.pk,))
+    assert admin_client.get(url).status_code == HTTPStatus.FORBIDDEN
+    response = admin_client.get(reverse('admin:auth_user_changelist'))
+    actions = dict(response.context['action_form'].fields['action'].choices)
+    assert 'delete_selected' not in actions
+    assert 'purge_users' in actions
+
+
+def test_purge_requires_delete_permission(client, django_user_model, author):
+    staff = django_user_model.objects.create_user(
+        username='Сотрудник', is_staff=True
+    )
+    staff.user_permissions.set(Permission.objects.filter(
+        codename__in=('view_user', 'change_user')
+    ))
+    client.force_login(staff)
+    url = reverse('admin:auth_user_changelist')
+    # Других действий нет, поэтому форма действий не выводится вовсе.
+    assert client.get(url).context['action_form'] is None
+    client.post(url, {
+        'action': 'purge_users', '_selected_action': [author.pk],
+    })
+    assert not Task.objects.exists()
@@ -0,0 +1,52 @@
+"""Подготовка шаблонов к быстрому выводу страниц."""
+from pathlib import Path
+
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.urls import reverse
+
+try:
+    from django.template.backends.jinja2 import Jinja2
+except ImportError:
+    # Jinja2 не установлен — движок не используется.
+    Jinja2 = None
+
+SLUG_PLACEHOLDER = 'slug-placeholder'
+
+
+def split_url(viewname):
+    """Делит адрес маршрута со slug на части до slug и после него.
+
+    Список подставляет slug между частями вместо вызова reverse()
+    для каждой заметки; slug состоит из безопасных для URL символов.
+    """
+    prefix, suffix = reverse(viewname, args=(SLUG_PLACEHOLDER,)).split(
+        SLUG_PLACEHOLDER
+    )
+    return prefix, suffix
+
+
+def template_names(engine):
+    """Имена всех шаблонов из DIRS движка."""
+    if Jinja2 is not None and isinstance(engine, Jinja2):
+        return engine.env.list_templates(extensions=('html',))
+    if not isinstance(engine, DjangoTemplates):
+        return []
+    names = []
+    for directory in engine.engine.dirs:
+        directory = Path(directory)
+        names.extend(
+            path.relative_to(directory).as_posix()
+            for path in sorted(directory.rglob('*.html'))
+        )
+    return names
+
+
+def warm_templates():
+    """Компилирует все шаблоны из DIRS, чтобы наполнить кеш загрузчика."""
+    count = 0
+    for engine in engines.all():
+        for name in template_names(engine):
+            engine.get_template(name)
+            count += 1
+    return count
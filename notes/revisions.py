@@ -0,0 +1,182 @@
+"""История версий заметок в виде обратных дельт.
+
+Текущая версия хранится в самой заметке. При изменении заметки
+заменяемая версия записывается в NoteRevision как построчная дельта,
+которая из более новой версии получает эту. Поэтому история растёт
+на размер правок, а самые старые версии можно удалять, не трогая
+остальные. Чтобы восстановление не проходило по длинной цепочке,
+каждая NOTES_REVISION_SNAPSHOT_INTERVAL-я версия хранится целиком.
+"""
+import json
+from collections import namedtuple
+from difflib import SequenceMatcher, unified_diff
+
+from django.conf import settings
+from django.db.models import F, Max, OuterRef, Subquery
+
+from .fields import CompressedText
+from .models import Note, NoteRevision
+
+PRUNE_BATCH_SIZE = 1000
+# Дельта для версии с тем же текстом, что у следующей.
+SAME_TEXT = '[[0,null]]'
+
+Version = namedtuple('Version', 'number title text modified is_snapshot')
+
+
+def make_delta(source, target):
+    """Построчная дельта, превращающая source в target.
+
+    Совпадающие участки записываются парой номеров строк source
+    (конец null — до конца текста), остальные — текстом строк target.
+    """
+    source_lines = source.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    operations = []
+    matcher = SequenceMatcher(None, source_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j1 < j2:
+            operations.append(''.join(target_lines[j1:j2]))
+    return json.dumps(operations, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_delta(source, delta):
+    lines = source.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(delta):
+        if isinstance(operation, list):
+            parts.extend(lines[operation[0]:operation[1]])
+        else:
+            parts.append(operation)
+    return ''.join(parts)
+
+
+def current_number(note):
+    """Номер текущей версии заметки."""
+    last = note.revisions.aggregate(last=Max('number'))['last']
+    return (last or 0) + 1
+
+
+def record_revision(note, using=None):
+    """Сохраняет заменяемую версию заметки перед её обновлением.
+
+    using — база, в которую сохраняется заметка. Если текст
+    не менялся и ещё не распакован, он не распаковывается: дельта
+    в этом случае — ссылка на весь текст следующей версии.
+    """
+    old = Note.objects.db_manager(using).filter(pk=note.pk).values_list(
+        'title', 'text', 'modified'
+    ).first()
+    if old is None:
+        return None
+    title, text, modified = old
+    current = note.__dict__.get('text')
+    if isinstance(current, CompressedText) and isinstance(
+        text, CompressedText
+    ):
+        same_text = current.raw == text.raw
+    else:
+        text = Note._meta.get_field('text').to_python(text)
+        same_text = text == note.text
+    if same_text and title == note.title:
+        return None
+    interval = settings.NOTES_REVISION_SNAPSHOT_INTERVAL
+    recent = list(
+        note.revisions.order_by('-number')
+        .values_list('number', 'is_snapshot')[:interval]
+    )
+    deltas = 0
+    for _, is_snapshot in recent:
+        if is_snapshot:
+            break
+        deltas += 1
+    is_snapshot = deltas >= interval - 1
+    if is_snapshot:
+        data = text
+    elif same_text:
+        data = SAME_TEXT
+    else:
+        data = make_delta(note.text, text)
+    return NoteRevision.objects.db_manager(using).create(
+        note=note,
+        number=recent[0][0] + 1 if recent else 1,
+        title=title,
+        is_snapshot=is_snapshot,
+        data=data,
+        modified=modified,
+    )
+
+
+def load_versions(note, lowest):
+    """Версии заметки с номерами от lowest до ближайшей опорной.
+
+    Опорная версия — ближайшая полная копия не ниже lowest или текущая
+    версия заметки. Возвращает словарь {номер: Version}; версий,
+    удалённых при очистке истории, в нём нет.
+    """
+    revisions = note.revisions.filter(number__gte=lowest)
+    snapshot = revisions.filter(is_snapshot=True).order_by(
+        'number'
+    ).values_list('number', flat=True).first()
+    if snapshot is not None:
+        revisions = revisions.filter(number__lte=snapshot)
+        versions = {}
+        text = None
+    else:
+        number = current_number(note)
+        text = note.text
+        versions = {number: Version(
+            number, note.title, text, note.modified, False
+        )}
+    for revision in revisions.order_by('-number'):
+        if revision.is_snapshot:
+            text = revision.data
+        else:
+            text = apply_delta(text, revision.data)
+        versions[revision.number] = Version(
+            revision.number, revision.title, text, revision.modified,
+            revision.is_snapshot,
+        )
+    return versions
+
+
+def diff_lines(old, new):
+    """Строки унифицированного diff с видом строки для шаблона."""
+    kinds = {'+': 'added', '-': 'removed', '@': 'hunk'}
+    lines = unified_diff(
+        old.splitlines(), new.splitlines(), lineterm='', n=3
+    )
+    for line in list(lines)[2:]:
+        yield kinds.get(line[:1], 'context'), line
+
+
+def prune_revisions(keep=None, before=None, batch_size=PRUNE_BATCH_SIZE,
+                    using=None):
+    """Удаляет старые версии, оставляя у каждой заметки keep последних.
+
+    С before удаляются версии, сохранённые раньше этого момента;
+    using — база (шард), в которой идёт очистка.
+    Последняя сохранённая версия заметки не удаляется никогда: по ней
+    продолжается нумерация. Дельты ссылаются только на более новые
+    версии, поэтому оставшиеся версии восстанавливаются как раньше.
+    """
+    revisions = NoteRevision.objects.db_manager(using)
+    queryset = revisions.annotate(latest=Subquery(
+        NoteRevision.objects.filter(note=OuterRef('note'))
+        .order_by('-number').values('number')[:1]
+    )).filter(number__lt=F('latest'))
+    if keep is not None:
+        queryset = queryset.filter(number__lte=F('latest') - keep)
+    if before is not None:
+        queryset = queryset.filter(modified__lt=before)
+    deleted = 0
+    while True:
+        ids = list(
+            queryset.order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        revisions.filter(id__in=ids).delete()
+        deleted += len(ids)
@@ -0,0 +1,95 @@
+"""Маршрутизация запросов между базами данных.
+
+Реплики перечислены в DATABASE_REPLICAS. Чтение уходит на реплику,
+только если запрос разрешил это (см. ReplicaMiddleware): безопасный
+метод и у пользователя не было недавней записи. Всё остальное — запись,
+чтение внутри транзакции, команды управления — идёт в основную базу.
+С реплик читаются только модели заметок (REPLICA_APPS): сессия или
+пользователь, созданные после последнего sync_replicas, на реплике ещё
+не появились, и вход не должен от этого зависеть.
+
+При шардировании (NOTES_SHARDS) заметки и их версии обслуживает
+ShardRouter, реплик у шардов нет.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .sharding import SHARDED_MODELS, current_shard, shard_for_instance
+
+use_replicas = ContextVar('use_replicas', default=False)
+REPLICA_APPS = frozenset({'notes'})
+
+
+def is_sharded(model):
+    return bool(settings.NOTES_SHARDS) and (
+        model._meta.label_lower in SHARDED_MODELS
+    )
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not use_replicas.get():
+            return None
+        if model._meta.app_label not in REPLICA_APPS:
+            return DEFAULT_DB_ALIAS
+        if is_sharded(model):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Прочитанное в транзакции может тут же записываться.
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if is_sharded(model):
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики — копии основной базы, схема приходит вместе с данными.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ShardRouter:
+    """Отправляет заметки и версии в шард автора.
+
+    Шард определяется по объекту из подсказки instance, а для запросов
+    без объекта — по контексту (см. ShardMiddleware и for_author).
+    Остальные модели живут в основной базе: без явного ответа Django
+    искал бы, например, автора заметки в её шарде.
+    """
+
+    def _db(self, model, **hints):
+        if not settings.NOTES_SHARDS:
+            return None
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        shard = None
+        if instance is not None:
+            shard = shard_for_instance(instance)
+        return shard or current_shard() or DEFAULT_DB_ALIAS
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if settings.NOTES_SHARDS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in settings.NOTES_SHARDS:
+            return None
+        return f'{app_label}.{model_name}' in SHARDED_MODELS
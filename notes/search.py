@@ -0,0 +1,163 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .fields import PREFIX
+from .models import Note
+
+FTS_TABLE = 'notes_note_fts'
+# SQL-функция, которая распаковывает сжатый текст заметки.
+TEXT_FUNCTION = 'note_text'
+SEARCH_LIMIT = 20
+# Вес совпадений в заголовке, тексте и служебной колонке автора для bm25.
+RANK_WEIGHTS = (10.0, 1.0, 0.0)
+
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "title, text, author_id, content='notes_note', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS = {
+    f'{FTS_TABLE}_ai': (
+        'AFTER INSERT ON notes_note BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, title, text, author_id) '
+        f'VALUES (new.id, new.title, {TEXT_FUNCTION}(new.text), '
+        'new.author_id); END'
+    ),
+    f'{FTS_TABLE}_ad': (
+        'AFTER DELETE ON notes_note BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text, author_id) '
+        "VALUES ('delete', old.id, old.title, "
+        f'{TEXT_FUNCTION}(old.text), old.author_id); END'
+    ),
+    f'{FTS_TABLE}_au': (
+        'AFTER UPDATE OF title, text, author_id ON notes_note BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text, author_id) '
+        "VALUES ('delete', old.id, old.title, "
+        f'{TEXT_FUNCTION}(old.text), old.author_id); '
+        f'INSERT INTO {FTS_TABLE}(rowid, title, text, author_id) '
+        f'VALUES (new.id, new.title, {TEXT_FUNCTION}(new.text), '
+        'new.author_id); END'
+    ),
+}
+
+
+def is_supported(using=connection):
+    """Полнотекстовый индекс есть только у SQLite."""
+    return using.vendor == 'sqlite'
+
+
+def ensure_search_index(using=connection):
+    """Создаёт FTS5-таблицу и триггеры синхронизации, если их нет.
+
+    SQLite при изменении схемы пересоздаёт таблицу notes_note и теряет
+    триггеры, поэтому функция вызывается после каждой миграции.
+    Триггеры с устаревшим текстом создаются заново. Если индекс или
+    триггеры пришлось создать, индекс перестраивается целиком.
+    """
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT name, sql FROM sqlite_master '
+            "WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f'{FTS_TABLE}%'],
+        )
+        existing = dict(cursor.fetchall())
+        cursor.execute(CREATE_TABLE)
+        rebuild = FTS_TABLE not in existing
+        for name, body in TRIGGERS.items():
+            definition = f'CREATE TRIGGER {name} {body}'
+            if existing.get(name) == definition:
+                continue
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(definition)
+            rebuild = True
+    if rebuild:
+        rebuild_search_index(using)
+
+
+def rebuild_search_index(using=connection):
+    """Перестраивает индекс по содержимому таблицы заметок.
+
+    Команда FTS5 'rebuild' читает текст из таблицы заметок как есть,
+    поэтому индекс заполняется заново через распаковку note_text().
+    """
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, text, author_id) '
+            f'SELECT id, title, {TEXT_FUNCTION}(text), author_id '
+            'FROM notes_note'
+        )
+
+
+def build_match_expression(query):
+    """Превращает пользовательский запрос в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки, чтобы символы синтаксиса FTS5
+    не вызывали ошибок, а последнее слово ищется по префиксу.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return '{title text} : (' + ' '.join(terms) + ')'
+
+
+def search_notes(author, query, limit=SEARCH_LIMIT):
+    """Возвращает заметки автора, упорядоченные по релевантности.
+
+    Индекс читается из той же базы (шарда или реплики), что и заметки.
+    """
+    expression = build_match_expression(query)
+    if not expression:
+        return []
+    queryset = Note.objects.filter(author=author).only('id', 'slug', 'title')
+    queryset = queryset.using(queryset.db)
+    using = connections[queryset.db]
+    if not is_supported(using):
+        return list(filter_by_text(queryset, query)[:limit])
+    expression = f'author_id : "{author.pk}" AND {expression}'
+    with using.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s',
+            [expression, *RANK_WEIGHTS, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    notes = queryset.in_bulk(ids)
+    return [notes[note_id] for note_id in ids if note_id in notes]
+
+
+def filter_by_text(queryset, query):
+    """Заметки queryset с query в заголовке или тексте, без индекса.
+
+    Запасной вариант для баз без FTS5. Сжатый текст в базе не похож
+    на исходный, поэтому такие заметки проверяются после распаковки.
+    """
+    needle = query.lower()
+    compressed = [
+        pk for pk, text in queryset.filter(
+            text__startswith=PREFIX
+        ).values_list('pk', 'text').iterator()
+        if needle in text.decompress().lower()
+    ]
+    return queryset.filter(
+        Q(title__icontains=query)
+        | Q(text__icontains=query) & ~Q(text__startswith=PREFIX)
+        | Q(pk__in=compressed)
+    )
+
+
+def matching_ids(query):
+    """Подзапрос с id всех заметок, подходящих под запрос."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [build_match_expression(query)],
+    )
@@ -0,0 +1,88 @@
+"""Сессии в кеше с отложенной записью в базу (SESSION_ENGINE).
+
+Сессия читается из кеша, а база читается только при промахе кеша.
+Новая сессия записывается в базу сразу, вместе с изменениями того же
+запроса (например, входом). Изменения существующей сессии копятся
+в памяти процесса и сбрасываются в базу одной транзакцией не реже раза
+в SESSION_WRITE_BEHIND_SECONDS — при очередном сохранении сессии или
+при завершении процесса. Если процесс упадёт, изменения за это окно
+останутся только в кеше.
+
+Кеш должен быть общим для всех процессов (проверка notes.E002):
+удаление сессии при выходе сразу пишется в базу и в кеш, и остальные
+процессы его видят. Сессия, которой нет в кеше, сохраняется в базу
+синхронно: удалённую так не воскресить, а вытесненную из кеша — не
+потерять.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.models import Session
+from django.db import router, transaction
+
+_pending = {}
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def flush_pending():
+    """Записывает в базу отложенные изменения сессий процесса."""
+    global _flushed_at
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    if not pending:
+        return 0
+    using = router.db_for_write(Session)
+    with transaction.atomic(using=using):
+        for session_key, (data, expire_date) in pending.items():
+            # Удалённую за это время сессию update не воскресит.
+            Session.objects.using(using).filter(
+                session_key=session_key
+            ).update(session_data=data, expire_date=expire_date)
+    return len(pending)
+
+
+atexit.register(flush_pending)
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = 'notes.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self.created = False
+
+    def create(self):
+        super().create()
+        self.created = True
+
+    def save(self, must_create=False):
+        if (self.session_key is None or must_create or self.created
+                or not self._cache.touch(
+                    self.cache_key, self.get_expiry_age()
+                )):
+            # Обновление удалённой сессии завершится UpdateError.
+            return super().save(must_create)
+        data = self._get_session()
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+        entry = self.create_model_instance(data)
+        with _lock:
+            _pending[entry.session_key] = (
+                entry.session_data, entry.expire_date
+            )
+            due = (
+                time.monotonic() - _flushed_at
+                >= settings.SESSION_WRITE_BEHIND_SECONDS
+            )
+        if due:
+            flush_pending()
+
+    def delete(self, session_key=None):
+        with _lock:
+            _pending.pop(session_key or self.session_key, None)
+        super().delete(session_key)
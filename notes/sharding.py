@@ -0,0 +1,371 @@
+"""Шардирование заметок по авторам.
+
+Включается переменной YANOTE_SHARD_PATHS (см. settings). Заметки автора
+и их версии лежат в одной базе из NOTES_SHARDS — её назначает
+AuthorShard. Основная база тоже шард, а ещё в ней остаются пользователи,
+журнал изменений и реестр slug (SlugRegistry): он выдаёт заметкам id
+и следит, чтобы slug были уникальны во всех шардах сразу.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .cache import invalidate_author
+from .models import (
+    AuthorShard, Note, NoteRevision, NoteTag, SlugRegistry, Tag
+)
+
+SHARDED_MODELS = frozenset(
+    {'notes.note', 'notes.noterevision', 'notes.tag', 'notes.notetag'}
+)
+MOVE_BATCH_SIZE = 500
+# Ограничение на число параметров в одном запросе к SQLite.
+IN_CHUNK_SIZE = 500
+
+current_context = ContextVar('shard_context', default=None)
+
+
+class ShardMoved(Exception):
+    """Заметки автора перенесли в другой шард во время записи."""
+
+
+class ShardContext:
+    """Автор, с заметками которого работает запрос или команда.
+
+    Автор узнаётся лениво, а его шард запоминается при первом
+    обращении: запросы, не касающиеся заметок, не читают AuthorShard.
+    """
+
+    def __init__(self, get_author_id):
+        self.get_author_id = get_author_id
+        self._shard = None
+
+    @property
+    def author_id(self):
+        return self.get_author_id()
+
+    @property
+    def shard(self):
+        if self._shard is None:
+            author_id = self.author_id
+            self._shard = (
+                DEFAULT_DB_ALIAS if author_id is None
+                else shard_for_author(author_id)
+            )
+        return self._shard
+
+
+@contextmanager
+def for_author(author_id):
+    """Направляет запросы к заметкам без явной базы в шард автора."""
+    token = current_context.set(ShardContext(lambda: author_id))
+    try:
+        yield
+    finally:
+        current_context.reset(token)
+
+
+def shard_for_author(author_id):
+    """Шард автора; новому автору он назначается при первом обращении.
+
+    Привязка читается только из основной базы: реплика может не знать
+    о недавнем переносе. Авторы заметок, созданных до включения
+    шардирования, остаются в основной базе, остальные распределяются
+    по остатку от деления id.
+    """
+    shards = AuthorShard.objects.using(DEFAULT_DB_ALIAS)
+    shard = shards.filter(author_id=author_id).values_list(
+        'shard', flat=True
+    ).first()
+    if shard is not None:
+        return shard
+    if Note.objects.using(DEFAULT_DB_ALIAS).filter(
+        author_id=author_id
+    ).exists():
+        shard = DEFAULT_DB_ALIAS
+    else:
+        shard = settings.NOTES_SHARDS[author_id % len(settings.NOTES_SHARDS)]
+    return shards.get_or_create(
+        author_id=author_id, defaults={'shard': shard}
+    )[0].shard
+
+
+def shard_for_instance(instance):
+    """Шард заметки или версии.
+
+    Берётся база, из которой загружен объект или его заметка, затем
+    шард автора заметки, затем шард текущего контекста. Объект другой
+    модели — это автор: например, присваиваемый новой заметке.
+    """
+    if instance._meta.label_lower in SHARDED_MODELS:
+        if instance._state.db in settings.NOTES_SHARDS:
+            return instance._state.db
+        note = instance._state.fields_cache.get('note', instance)
+        if note._state.db in settings.NOTES_SHARDS:
+            return note._state.db
+        author_id = getattr(note, 'author_id', None)
+    else:
+        author_id = instance.pk
+    context = current_context.get()
+    if context is not None and (
+        author_id is None or author_id == context.author_id
+    ):
+        return context.shard
+    if author_id is not None:
+        return shard_for_author(author_id)
+    return None
+
+
+def current_shard():
+    context = current_context.get()
+    return None if context is None else context.shard
+
+
+def register_note(note):
+    """Занимает slug заметки в реестре; новой заметке реестр выдаёт id.
+
+    Занятый кем-то slug вызывает IntegrityError, как и уникальный
+    индекс таблицы заметок без шардирования.
+    """
+    if note.pk is None:
+        note.pk = SlugRegistry.objects.create(
+            slug=note.slug, author_id=note.author_id
+        ).pk
+    elif not SlugRegistry.objects.filter(pk=note.pk).update(
+        slug=note.slug
+    ):
+        SlugRegistry.objects.create(
+            pk=note.pk, slug=note.slug, author_id=note.author_id
+        )
+
+
+def register_notes(notes):
+    """Пакетный register_note для новых заметок одного bulk_create."""
+    SlugRegistry.objects.bulk_create(
+        SlugRegistry(slug=note.slug, author_id=note.author_id)
+        for note in notes
+    )
+    slugs = [note.slug for note in notes]
+    ids = {}
+    for start in range(0, len(slugs), IN_CHUNK_SIZE):
+        ids.update(SlugRegistry.objects.filter(
+            slug__in=slugs[start:start + IN_CHUNK_SIZE]
+        ).values_list('slug', 'id'))
+    for note in notes:
+        note.pk = ids[note.slug]
+
+
+def sync_registry():
+    """Добавляет в реестр slug заметок, которых в нём нет.
+
+    Нужна при включении шардирования, если заметки создавались уже
+    после миграции, заполнившей реестр. Возвращает число записей.
+    """
+    added = 0
+    for shard in settings.NOTES_SHARDS:
+        notes = Note.objects.using(shard).order_by('id').values_list(
+            'id', 'slug', 'author_id'
+        )
+        last_id = 0
+        while True:
+            rows = list(notes.filter(id__gt=last_id)[:IN_CHUNK_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            known = set(SlugRegistry.objects.filter(
+                id__in=[row[0] for row in rows]
+            ).values_list('id', flat=True))
+            missing = [
+                SlugRegistry(id=note_id, slug=slug, author_id=author_id)
+                for note_id, slug, author_id in rows
+                if note_id not in known
+            ]
+            SlugRegistry.objects.bulk_create(missing)
+            added += len(missing)
+    return added
+
+
+def check_shard(author_id, using):
+    """Запись в шард, из которого автора уже перенесли, откатывается."""
+    if shard_for_author(author_id) != using:
+        raise ShardMoved(f'Заметки автора {author_id} перенесены из {using}.')
+
+
+def _copy_rows(source, target, model, where, params, skip=()):
+    """Копирует строки model, подходящие под where, как есть.
+
+    Текст остаётся сжатым, id заметок сохраняются: они выданы
+    реестром и уникальны во всех шардах.
+    """
+    quote = connections[target].ops.quote_name
+    columns = [
+        field.column for field in model._meta.concrete_fields
+        if field.column not in skip
+    ]
+    names = ', '.join(quote(column) for column in columns)
+    table = quote(model._meta.db_table)
+    with connections[source].cursor() as cursor:
+        cursor.execute(
+            f'SELECT {names} FROM {table} WHERE {where}', params
+        )
+        rows = cursor.fetchall()
+    if rows:
+        with connections[target].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} ({names}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))})',
+                rows,
+            )
+
+
+def _in(ids):
+    return f'id IN ({", ".join(["%s"] * len(ids))})'
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
+
+
+def _copy_notes(source, target, ids):
+    """Копирует заметки ids вместе с версиями.
+
+    Версии получают новые id: у каждого шарда своя нумерация.
+    """
+    _copy_rows(source, target, Note, _in(ids), ids)
+    _copy_rows(
+        source, target, NoteRevision, 'note_' + _in(ids), ids, skip=('id',)
+    )
+
+
+def _delete_notes(using, where, params):
+    """Удаляет заметки и их версии без сигналов.
+
+    Для журнала изменений и реестра перенесённые заметки не удалены.
+    Связи с метками удаляются, а число заметок у меток не меняется:
+    метки автора копируются и удаляются целиком (_copy_tags).
+    """
+    with connections[using].cursor() as cursor:
+        for table in ('notes_noterevision', 'notes_notetag'):
+            cursor.execute(
+                f'DELETE FROM {table} WHERE note_id IN '
+                f'(SELECT id FROM notes_note WHERE {where})',
+                params,
+            )
+        cursor.execute(f'DELETE FROM notes_note WHERE {where}', params)
+
+
+def _delete_tags(using, author_id):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM notes_notetag WHERE tag_id IN '
+            '(SELECT id FROM notes_tag WHERE author_id = %s)',
+            [author_id],
+        )
+        cursor.execute(
+            'DELETE FROM notes_tag WHERE author_id = %s', [author_id]
+        )
+
+
+def _copy_tags(source, target, author_id):
+    """Заменяет метки автора в target копией из source.
+
+    Метки получают новые id, связи с заметками переводятся на них
+    по названию метки.
+    """
+    _delete_tags(target, author_id)
+    _copy_rows(
+        source, target, Tag, 'author_id = %s', [author_id], skip=('id',)
+    )
+    names = dict(
+        Tag.objects.using(source).filter(author_id=author_id)
+        .values_list('id', 'name')
+    )
+    ids = dict(
+        Tag.objects.using(target).filter(author_id=author_id)
+        .values_list('name', 'id')
+    )
+    links = NoteTag.objects.using(source).filter(
+        tag__author_id=author_id
+    ).values_list('note_id', 'tag_id')
+    NoteTag.objects.using(target).bulk_create(
+        (
+            NoteTag(note_id=note_id, tag_id=ids[names[tag_id]])
+            for note_id, tag_id in links.iterator()
+        ),
+        batch_size=IN_CHUNK_SIZE,
+    )
+
+
+def _versions(using, author_id):
+    """{id заметки: время изменения} всех заметок автора в базе."""
+    return dict(
+        Note.objects.using(using).filter(author_id=author_id)
+        .values_list('id', 'modified')
+    )
+
+
+def move_author(author_id, target, batch_size=MOVE_BATCH_SIZE):
+    """Переносит заметки автора с версиями и метками в шард target, не
+    прерывая работу автора.
+
+    Сначала заметки копируются пачками, пока автор продолжает писать
+    в старый шард. Затем под блокировкой записи старого шарда
+    докопируются заметки, изменённые за это время (у них другое время
+    изменения), из копии удаляются удалённые, AuthorShard переключается
+    на target, и заметки удаляются из старого шарда. Запись, которая
+    дождалась блокировки уже после переключения, не пройдёт
+    check_shard и откатится. Возвращает число перенесённых заметок.
+    """
+    source = shard_for_author(author_id)
+    if source == target:
+        return 0
+    # Остатки прерванного переноса.
+    _delete_notes(target, 'author_id = %s', [author_id])
+    notes = Note.objects.using(source).filter(author_id=author_id)
+    last_id = 0
+    while True:
+        ids = list(
+            notes.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic(using=target):
+            for chunk in _chunks(ids):
+                _copy_notes(source, target, chunk)
+        last_id = ids[-1]
+    # Порядок блокировок тот же, что у записи заметки (atomic_for).
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+            transaction.atomic(using=source), \
+            transaction.atomic(using=target):
+        with connections[source].cursor() as cursor:
+            # Пустое изменение берёт блокировку записи и при обычном
+            # BEGIN: до конца транзакции автор в старый шард не пишет.
+            cursor.execute(
+                'UPDATE notes_note SET author_id = author_id WHERE 0'
+            )
+        current = _versions(source, author_id)
+        copied = _versions(target, author_id)
+        stale = [
+            note_id for note_id, modified in copied.items()
+            if current.get(note_id) != modified
+        ]
+        for chunk in _chunks(stale):
+            _delete_notes(target, _in(chunk), chunk)
+        missing = sorted(
+            note_id for note_id, modified in current.items()
+            if copied.get(note_id) != modified
+        )
+        for chunk in _chunks(missing):
+            _copy_notes(source, target, chunk)
+        _copy_tags(source, target, author_id)
+        AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            author_id=author_id, defaults={'shard': target}
+        )
+        _delete_notes(source, 'author_id = %s', [author_id])
+        _delete_tags(source, author_id)
+    invalidate_author(author_id)
+    return len(current)
@@ -0,0 +1,226 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from .auth import invalidate_user
+from .cache import invalidate_author
+from .changes import record_change
+from .fields import decompress_text
+from .markup import evict_note_text
+from .metrics import NOTE_WRITES
+from .models import AuthorShard, Note, NoteChange, SlugRegistry, Tag
+from .revisions import record_revision
+from .search import TEXT_FUNCTION, ensure_search_index
+from .sharding import check_shard, register_note
+from .stats import add_notes, remove_notes
+from .tags import release_tags
+
+
+def create_search_index(using, **kwargs):
+    """После миграций восстанавливает полнотекстовый индекс заметок."""
+    ensure_search_index(connections[using])
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def invalidate_note_pages(sender, instance, using, **kwargs):
+    """Любое изменение заметки сбрасывает кеш страниц её автора.
+
+    Версия меняется после фиксации транзакции: иначе параллельный
+    запрос успел бы закешировать прежнюю страницу под новой версией.
+    """
+    transaction.on_commit(
+        partial(invalidate_author, instance.author_id), using=using
+    )
+
+
+@receiver(pre_delete, sender=Note)
+def release_note_tags(sender, instance, using, **kwargs):
+    """Удаляемая заметка уменьшает число заметок у своих меток."""
+    release_tags([instance.pk], using)
+
+
+@receiver(pre_save, sender=Note)
+def remember_text_length(sender, instance, using, **kwargs):
+    """Прежняя длина текста нужна сводке автора, если текст изменён."""
+    if instance._state.adding or not isinstance(
+        instance.__dict__.get('text'), str
+    ):
+        return
+    instance._old_text_length = Note.objects.using(using).filter(
+        pk=instance.pk
+    ).values_list('text_length', flat=True).first()
+
+
+@receiver(post_save, sender=Note)
+def count_note_stats(sender, instance, created, **kwargs):
+    old_length = instance.__dict__.pop('_old_text_length', None)
+    if created:
+        length = instance.text_length
+    elif old_length is None:
+        length = 0
+    else:
+        length = instance.text_length - old_length
+    add_notes(instance.author_id, int(created), length, instance.modified)
+
+
+@receiver(post_delete, sender=Note)
+def discount_note_stats(sender, instance, using, **kwargs):
+    # Отложенные поля уже не загрузить: строки заметки нет.
+    remove_notes(
+        instance.author_id, 1, instance.__dict__.get('text_length', 0),
+        instance.__dict__.get('modified'), using,
+    )
+
+
+@receiver(post_delete, sender=Note)
+def evict_note_markup(sender, instance, **kwargs):
+    evict_note_text(instance)
+
+
+@receiver(post_save, sender=Note)
+def log_note_saved(sender, instance, created, **kwargs):
+    record_change(
+        instance, NoteChange.CREATED if created else NoteChange.UPDATED
+    )
+
+
+@receiver(post_delete, sender=Note)
+def log_note_deleted(sender, instance, **kwargs):
+    record_change(instance, NoteChange.DELETED)
+
+
+@receiver(pre_save, sender=Note)
+def save_note_revision(sender, instance, raw, using, update_fields,
+                       **kwargs):
+    """Перед изменением заметки её прежняя версия уходит в историю."""
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {'title', 'text'} & set(
+        update_fields
+    ):
+        return
+    record_revision(instance, using)
+
+
+@receiver(pre_save, sender=Note)
+def register_note_slug(sender, instance, raw, update_fields, **kwargs):
+    """При шардировании slug и id заметки выдаёт реестр."""
+    if not settings.NOTES_SHARDS or raw:
+        return
+    if update_fields is not None and 'slug' not in update_fields:
+        return
+    register_note(instance)
+
+
+@receiver(post_delete, sender=Note)
+def unregister_note_slug(sender, instance, **kwargs):
+    if settings.NOTES_SHARDS:
+        SlugRegistry.objects.filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def check_note_shard(sender, instance, using, **kwargs):
+    """Откатывает запись, пришедшую в шард во время переноса автора."""
+    if settings.NOTES_SHARDS:
+        check_shard(instance.author_id, using)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def delete_sharded_notes(sender, instance, **kwargs):
+    """Каскад удаления пользователя не видит заметок в других базах."""
+    if not settings.NOTES_SHARDS:
+        return
+    shard = AuthorShard.objects.filter(author=instance).values_list(
+        'shard', flat=True
+    ).first()
+    if shard not in (None, DEFAULT_DB_ALIAS):
+        Note.objects.using(shard).filter(author_id=instance.pk).delete()
+        Tag.objects.using(shard).filter(author_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Note)
+def count_note_saved(sender, instance, created, **kwargs):
+    NOTE_WRITES.inc(
+        action=NoteChange.CREATED if created else NoteChange.UPDATED
+    )
+
+
+@receiver(post_delete, sender=Note)
+def count_note_deleted(sender, instance, **kwargs):
+    NOTE_WRITES.inc(action=NoteChange.DELETED)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_pages(sender, instance, using, **kwargs):
+    """В шапке страниц выводится имя пользователя."""
+    transaction.on_commit(partial(invalidate_author, instance.pk), using)
+
+
+@receiver(user_logged_in)
+def invalidate_pages_on_login(sender, user, **kwargs):
+    transaction.on_commit(partial(invalidate_author, user.pk))
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    """Смена пароля и другие изменения сбрасывают кеш пользователя."""
+    transaction.on_commit(partial(invalidate_user, instance.pk), using)
+
+
+@receiver(user_logged_out)
+def invalidate_cached_user_on_logout(sender, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.pk)
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    """Функция note_text() распаковывает текст для триггеров поиска."""
+    if connection.vendor != 'sqlite':
+        return
+    connection.connection.create_function(
+        TEXT_FUNCTION, 1, decompress_text, deterministic=True
+    )
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применяет прагмы продакшен-профиля к новому соединению SQLite."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            if name == 'journal_mode' and connection.settings_dict.get(
+                'READ_ONLY'
+            ):
+                # Режим журнала реплики задаёт sync_replicas.
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """Закрывает сломанные постоянные соединения до начала запроса.
+
+    В Django 3.2 нет встроенной настройки CONN_HEALTH_CHECKS,
+    поэтому проверка выполняется здесь.
+    """
+    for connection in connections.all():
+        if (
+            connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and connection.connection is not None
+            and not connection.is_usable()
+        ):
+            connection.close()
@@ -0,0 +1,142 @@
+"""Сводка по заметкам автора (AuthorStats).
+
+Число заметок, суммарная длина текста и время последнего изменения
+меняются приращениями в той же транзакции, что и заметки: обычное
+сохранение и удаление — через сигналы (notes.signals), пакетные
+операции — в notes.bulk. Сводка лежит в основной базе и при
+шардировании: atomic_for открывает транзакцию в ней вместе с шардом.
+
+Время последнего изменения — наибольшее Note.modified среди заметок
+автора; после удаления самой свежей заметки оно пересчитывается.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Greatest
+
+from .models import AuthorStats, Note
+
+RECONCILE_BATCH_SIZE = 500
+
+
+def _stats(author_id):
+    return AuthorStats.objects.using(DEFAULT_DB_ALIAS).filter(
+        author_id=author_id
+    )
+
+
+def stats_for(author):
+    """Сводка автора; для автора без заметок — пустая."""
+    return AuthorStats.objects.filter(author=author).first() or (
+        AuthorStats(author=author)
+    )
+
+
+def add_notes(author_id, count, length, modified):
+    """Учитывает созданные (count) или изменённые заметки автора.
+
+    length — на сколько изменилась суммарная длина текста.
+    """
+    if not _stats(author_id).update(
+        note_count=F('note_count') + count,
+        text_length=Greatest(F('text_length') + length, Value(0)),
+        last_modified=modified,
+    ):
+        AuthorStats.objects.using(DEFAULT_DB_ALIAS).create(
+            author_id=author_id,
+            note_count=count,
+            text_length=max(length, 0),
+            last_modified=modified,
+        )
+
+
+def remove_notes(author_id, count, length, latest, using):
+    """Учитывает удаление count заметок суммарной длиной length.
+
+    latest — наибольшее время изменения удалённых заметок (None —
+    неизвестно), using — база, из которой они удалены. Сводка не уходит
+    ниже нуля, даже если успела разойтись с заметками.
+    """
+    stats = _stats(author_id)
+    stats.update(
+        note_count=Greatest(F('note_count') - count, Value(0)),
+        text_length=Greatest(F('text_length') - length, Value(0)),
+    )
+    if latest is None or stats.filter(
+        last_modified__lte=latest
+    ).exists():
+        stats.update(last_modified=Note.objects.using(using).filter(
+            author_id=author_id
+        ).aggregate(latest=Max('modified'))['latest'])
+
+
+def aggregate_notes(notes):
+    """{id автора: (число, длина, последнее изменение)} для notes."""
+    return {
+        row['author_id']: (row['count'], row['length'], row['latest'])
+        for row in notes.order_by().values('author_id').annotate(
+            count=Count('id'),
+            length=Sum('text_length'),
+            latest=Max('modified'),
+        )
+    }
+
+
+def _reconcile(author_ids):
+    """Исправляет сводку авторов author_ids; возвращает число исправлений.
+
+    Блокировка записи основной базы берётся до подсчёта: запись
+    заметки ждёт её, не успев закоммитить шард, и прибавит своё
+    изменение уже к исправленной сводке.
+    """
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                'UPDATE notes_authorstats SET note_count = note_count '
+                'WHERE 0'
+            )
+        actual = {}
+        for using in settings.NOTES_SHARDS or [DEFAULT_DB_ALIAS]:
+            actual.update(aggregate_notes(
+                Note.objects.using(using).filter(author_id__in=author_ids)
+            ))
+        stored = AuthorStats.objects.using(DEFAULT_DB_ALIAS).in_bulk(
+            author_ids
+        )
+        fixed = 0
+        for author_id in author_ids:
+            values = actual.get(author_id, (0, 0, None))
+            stats = stored.get(author_id)
+            if stats is None:
+                if not values[0]:
+                    continue
+                stats = AuthorStats(author_id=author_id)
+            elif values == (
+                stats.note_count, stats.text_length, stats.last_modified
+            ):
+                continue
+            stats.note_count, stats.text_length, stats.last_modified = values
+            stats.save(using=DEFAULT_DB_ALIAS)
+            fixed += 1
+    return fixed
+
+
+def reconcile_stats(batch_size=RECONCILE_BATCH_SIZE):
+    """Пересчитывает сводку всех авторов пачками по batch_size.
+
+    Каждая пачка — отдельная короткая транзакция. Возвращает число
+    исправленных сводок.
+    """
+    users = get_user_model().objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    fixed = 0
+    last_id = 0
+    while True:
+        author_ids = list(
+            users.filter(pk__gt=last_id).values_list('pk', flat=True)
+            [:batch_size]
+        )
+        if not author_ids:
+            return fixed
+        fixed += _reconcile(author_ids)
+        last_id = author_ids[-1]
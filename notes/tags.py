@@ -0,0 +1,144 @@
+"""Метки заметок.
+
+Число заметок с меткой (Tag.note_count) меняется в той же транзакции,
+что и связи заметок с метками: при сохранении меток заметки (set_tags)
+и при удалении заметок (release_tags). Поэтому список меток автора
+читается по индексу без GROUP BY. Метка без заметок остаётся в таблице,
+но в списке не показывается.
+"""
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Count, F
+
+from .models import Note, NoteTag, Tag, atomic_for
+from .sharding import check_shard
+
+MAX_TAGS = 20
+SEPARATOR = ','
+
+
+def parse_tags(value):
+    """Названия меток из строки через запятую.
+
+    Названия приводятся к нижнему регистру, пробелы внутри схлопываются,
+    повторы убираются.
+    """
+    names = []
+    for name in value.split(SEPARATOR):
+        name = ' '.join(name.split()).lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def parse_filter(values):
+    """Фильтр из параметров ?tag=: список групп названий меток.
+
+    Внутри группы (значения через запятую) метки объединяются по ИЛИ,
+    группы — по И: ?tag=python,django&tag=work.
+    """
+    groups = [names for names in map(parse_tags, values) if names]
+    return groups[:MAX_TAGS]
+
+
+def filter_query(groups):
+    """Часть адреса с фильтром для ссылок на соседние страницы."""
+    if not groups:
+        return ''
+    return '&' + urlencode(
+        [('tag', SEPARATOR.join(names)) for names in groups]
+    )
+
+
+def filter_by_tags(queryset, author, groups):
+    """Заметки queryset, подходящие под фильтр groups.
+
+    Каждая группа — подзапрос по индексу (tag, note) связей.
+    """
+    names = {name for names in groups for name in names}
+    ids = dict(
+        Tag.objects.filter(author=author, name__in=names)
+        .values_list('name', 'id')
+    )
+    for names in groups:
+        queryset = queryset.filter(id__in=NoteTag.objects.filter(
+            tag_id__in=[ids[name] for name in names if name in ids]
+        ).values('note_id'))
+    return queryset
+
+
+def author_tags(author):
+    """Метки автора с заметками и их число, по названию."""
+    return Tag.objects.filter(
+        author=author, note_count__gt=0
+    ).order_by('name').values_list('name', 'note_count')
+
+
+def note_tags(note):
+    return list(
+        note.tags.order_by('name').values_list('name', flat=True)
+    )
+
+
+def _change_counts(using, counts, sign):
+    """Меняет note_count меток на counts ({id метки: число}) со знаком sign.
+
+    Один UPDATE на каждое различное число.
+    """
+    by_count = defaultdict(list)
+    for tag_id, count in counts.items():
+        by_count[count].append(tag_id)
+    for count, ids in by_count.items():
+        Tag.objects.using(using).filter(id__in=ids).update(
+            note_count=F('note_count') + sign * count
+        )
+
+
+def set_tags(note, names):
+    """Заменяет метки заметки на names; недостающие метки создаются."""
+    using = router.db_for_write(Note, instance=note)
+    tags = Tag.objects.using(using).filter(author_id=note.author_id)
+    with atomic_for(using):
+        ids = dict(tags.filter(name__in=names).values_list('name', 'id'))
+        missing = [name for name in names if name not in ids]
+        if missing:
+            Tag.objects.using(using).bulk_create(
+                [Tag(author_id=note.author_id, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            ids.update(
+                tags.filter(name__in=missing).values_list('name', 'id')
+            )
+        links = NoteTag.objects.using(using).filter(note_id=note.pk)
+        current = set(links.values_list('tag_id', flat=True))
+        wanted = set(ids.values())
+        removed = current - wanted
+        added = wanted - current
+        if removed:
+            links.filter(tag_id__in=removed).delete()
+            _change_counts(using, dict.fromkeys(removed, 1), -1)
+        if added:
+            NoteTag.objects.using(using).bulk_create(
+                NoteTag(note_id=note.pk, tag_id=tag_id) for tag_id in added
+            )
+            _change_counts(using, dict.fromkeys(added, 1), 1)
+        if settings.NOTES_SHARDS:
+            check_shard(note.author_id, using)
+
+
+def release_tags(note_ids, using):
+    """Удаляет связи заметок note_ids с метками и уменьшает note_count.
+
+    Вызывается перед удалением заметок в той же транзакции.
+    """
+    links = NoteTag.objects.using(using).filter(note_id__in=note_ids)
+    counts = dict(
+        links.values('tag_id').annotate(count=Count('id'))
+        .values_list('tag_id', 'count')
+    )
+    if counts:
+        links.delete()
+        _change_counts(using, counts, -1)
@@ -0,0 +1,322 @@
+"""Очередь фоновых задач в базе данных, без внешнего брокера.
+
+Задача — строка Task с именем зарегистрированной функции (register)
+и её параметрами в JSON. Процессы manage.py run_workers забирают
+задачи по одной: выбор и пометка идут в транзакции под блокировкой
+записи основной базы, поэтому два процесса не возьмут одну задачу,
+а лимит одновременно выполняемых задач одного вида соблюдается точно.
+
+Пока задача выполняется, процесс раз в TASK_HEARTBEAT_SECONDS
+обновляет её heartbeat. Задачу, у которой он старше TASK_LEASE_SECONDS
+(процесс упал), забирает другой процесс. Задача, завершившаяся
+исключением, повторяется с удваивающейся паузой, пока не кончатся
+попытки. Завершённые задачи и их файлы удаляет prune_tasks.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .bulk import purge_user
+from .export import EXPORTERS
+from .models import Note, Task
+from .sharding import IN_CHUNK_SIZE, for_author
+
+TaskType = namedtuple('TaskType', 'function concurrency max_attempts')
+ACTIVE = (Task.QUEUED, Task.RUNNING)
+PRUNE_BATCH_SIZE = 500
+
+logger = logging.getLogger('notes.tasks')
+registry = {}
+
+
+class UnknownTask(Exception):
+    """Задача с таким именем не зарегистрирована."""
+
+
+class TaskLimit(Exception):
+    """Незавершённых задач этого вида уже слишком много."""
+
+
+def register(name, concurrency=1, max_attempts=3):
+    """Регистрирует функцию задачи name.
+
+    Функция получает задачу и её параметры как именованные аргументы,
+    а её результат сохраняется в Task.result и должен сериализоваться
+    в JSON. concurrency — сколько таких задач выполняется одновременно
+    во всех процессах.
+    """
+    def decorator(function):
+        registry[name] = TaskType(function, concurrency, max_attempts)
+        return function
+    return decorator
+
+
+def _tasks():
+    return Task.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _lock():
+    """Берёт блокировку записи основной базы до конца транзакции."""
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('UPDATE notes_task SET status = status WHERE 0')
+
+
+def enqueue(name, params=None, author=None, limit=None):
+    """Ставит задачу в очередь; author — пользователь, который видит её.
+
+    С limit задача не ставится (TaskLimit), если у author уже есть
+    limit незавершённых задач name.
+    """
+    if name not in registry:
+        raise UnknownTask(name)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if limit is not None:
+            _lock()
+            if _tasks().filter(
+                name=name, author=author, status__in=ACTIVE
+            ).count() >= limit:
+                raise TaskLimit(name)
+        return _tasks().create(name=name, author=author, params=params or {})
+
+
+def schedule(name, params=None):
+    """Ставит задачу, если такой же незавершённой ещё нет."""
+    try:
+        return enqueue(name, params, limit=1)
+    except TaskLimit:
+        return None
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _busy_names(stale):
+    running = _tasks().filter(
+        status=Task.RUNNING, heartbeat__gte=stale
+    ).order_by().values('name').annotate(count=Count('id'))
+    return [
+        row['name'] for row in running
+        if row['name'] in registry
+        and row['count'] >= registry[row['name']].concurrency
+    ]
+
+
+def claim(worker):
+    """Забирает следующую задачу для процесса worker; None — задач нет.
+
+    Задача упавшего процесса, исчерпавшая попытки, помечается
+    неудачной.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        _lock()
+        candidates = _tasks().filter(
+            Q(status=Task.QUEUED, run_after__lte=now)
+            | Q(status=Task.RUNNING, heartbeat__lt=stale),
+            name__in=list(registry),
+        ).exclude(name__in=_busy_names(stale)).order_by('run_after', 'id')
+        for task in candidates:
+            if (
+                task.status == Task.RUNNING
+                and task.attempts >= registry[task.name].max_attempts
+            ):
+                task.status = Task.FAILED
+                task.error = f'Процесс {task.worker} перестал отвечать.'
+                task.finished = now
+                task.save(update_fields=('status', 'error', 'finished'))
+                continue
+            task.status = Task.RUNNING
+            task.worker = worker
+            task.heartbeat = now
+            task.attempts += 1
+            task.save(update_fields=(
+                'status', 'worker', 'heartbeat', 'attempts'
+            ))
+            return task
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """Обновляет heartbeat задачи, пока она выполняется."""
+
+    def __init__(self, task):
+        super().__init__(daemon=True)
+        self.task = task
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.TASK_HEARTBEAT_SECONDS):
+                _tasks().filter(
+                    pk=self.task.pk, worker=self.task.worker
+                ).update(heartbeat=timezone.now())
+        finally:
+            connections.close_all()
+
+
+def _finish(task, **fields):
+    # Задачу, которую уже забрал другой процесс, не трогаем.
+    _tasks().filter(pk=task.pk, worker=task.worker).update(**fields)
+
+
+def run_task(task):
+    """Выполняет забранную задачу и сохраняет её итог."""
+    task_type = registry[task.name]
+    heartbeat = Heartbeat(task)
+    heartbeat.start()
+    try:
+        result = task_type.function(task, **task.params)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', task)
+        error = traceback.format_exc()
+        now = timezone.now()
+        if task.attempts < task_type.max_attempts:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+            _finish(
+                task, status=Task.QUEUED, error=error,
+                run_after=now + timedelta(seconds=delay),
+            )
+        else:
+            _finish(task, status=Task.FAILED, error=error, finished=now)
+    else:
+        _finish(
+            task, status=Task.DONE, result=result, error='',
+            finished=timezone.now(),
+        )
+    finally:
+        heartbeat.stopped.set()
+        heartbeat.join()
+
+
+def work(stop, worker=None, once=False):
+    """Выполняет задачи из очереди, пока не установлено событие stop.
+
+    С once процесс завершается, как только готовых задач не осталось.
+    """
+    worker = worker or worker_name()
+    while not stop.is_set():
+        task = claim(worker)
+        if task is not None:
+            run_task(task)
+        elif once:
+            return
+        else:
+            stop.wait(settings.TASK_POLL_INTERVAL)
+
+
+def result_path(task):
+    """Файл с результатом задачи или None."""
+    name = (task.result or {}).get('file')
+    return None if name is None else Path(settings.TASK_RESULTS_DIR) / name
+
+
+def _remove_orphans(directory):
+    """Удаляет файлы задач, которых в таблице уже нет.
+
+    Так пропадают, например, выгрузки автора, удалённого вместе
+    со своими задачами.
+    """
+    files = {}
+    for path in directory.iterdir():
+        task_id = path.name.split('-', 1)[0]
+        if task_id.isdigit():
+            files.setdefault(int(task_id), []).append(path)
+    ids = list(files)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[start:start + IN_CHUNK_SIZE]
+        known = set(_tasks().filter(pk__in=chunk).values_list('pk', flat=True))
+        for task_id in set(chunk) - known:
+            for path in files[task_id]:
+                path.unlink(missing_ok=True)
+
+
+def prune_tasks(keep_days=None):
+    """Удаляет задачи, завершённые больше keep_days дней назад.
+
+    Вместе с задачами удаляются их файлы и файлы задач, которых уже нет.
+    Возвращает число удалённых задач.
+    """
+    if keep_days is None:
+        keep_days = settings.TASK_KEEP_DAYS
+    old = _tasks().filter(
+        status__in=(Task.DONE, Task.FAILED),
+        finished__lt=timezone.now() - timedelta(days=keep_days),
+    ).only('id', 'result').order_by('id')
+    removed = 0
+    while True:
+        batch = list(old[:PRUNE_BATCH_SIZE])
+        if not batch:
+            break
+        for task in batch:
+            path = result_path(task)
+            if path is not None:
+                path.unlink(missing_ok=True)
+        _tasks().filter(pk__in=[task.pk for task in batch]).delete()
+        removed += len(batch)
+    directory = Path(settings.TASK_RESULTS_DIR)
+    if directory.is_dir():
+        _remove_orphans(directory)
+    return removed
+
+
+@register('export', concurrency=2)
+def export_notes(task, author_id, file_format):
+    """Выгружает заметки автора в файл в TASK_RESULTS_DIR."""
+    exporter, content_type, filename = EXPORTERS[file_format]
+    directory = Path(settings.TASK_RESULTS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{task.pk}-{filename}'
+    partial = directory / f'{name}.part'
+    with for_author(author_id), open(partial, 'wb') as output:
+        for chunk in exporter(Note.objects.filter(author_id=author_id)):
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            output.write(chunk)
+    partial.replace(directory / name)
+    return {'file': name, 'filename': filename, 'content_type': content_type}
+
+
+@register('prune_tasks')
+def prune(task, keep_days=None):
+    return {'removed': prune_tasks(keep_days)}
+
+
+@register('reindex')
+def reindex(task, database=DEFAULT_DB_ALIAS):
+    call_command('rebuild_search_index', database=database, stdout=StringIO())
+
+
+@register('purge_user')
+def purge(task, user_id):
+    """Удаляет пользователя вместе с заметками (bulk.purge_user)."""
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is not None:
+        purge_user(user)
+
+
+@register('import')
+def import_notes(task, path, **options):
+    """Импорт из файла командой import_notes.
+
+    Повтор после ошибки продолжает импорт с контрольной точки.
+    """
+    if task.attempts > 1:
+        options['restart'] = False
+    output = StringIO()
+    call_command('import_notes', path, stdout=output, **options)
+    return {'output': output.getvalue().splitlines()[-1:]}
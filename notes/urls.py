@@ -1,6 +1,6 @@
 from django.urls import path
 
-from notes import views
+from notes import api, views
 
 app_name = 'notes'
 
@@ -10,6 +10,47 @@ urlpatterns = [
     path('edit/<slug:slug>/', views.NoteUpdate.as_view(), name='edit'),
     path('note/<slug:slug>/', views.NoteDetail.as_view(), name='detail'),
     path('delete/<slug:slug>/', views.NoteDelete.as_view(), name='delete'),
+    path(
+        'history/<slug:slug>/', views.NoteHistory.as_view(), name='history'
+    ),
+    path(
+        'history/<slug:slug>/<int:number>/',
+        views.NoteRevisionDetail.as_view(),
+        name='revision',
+    ),
+    path(
+        'history/<slug:slug>/<int:number>/restore/',
+        views.NoteRestore.as_view(),
+        name='restore',
+    ),
     path('notes/', views.NotesList.as_view(), name='list'),
+    path('notes/export/', views.NotesExport.as_view(), name='export'),
+    path(
+        'notes/delete/', views.NoteBulkDelete.as_view(), name='bulk_delete'
+    ),
+    path(
+        'notes/export/background/',
+        views.NotesExportStart.as_view(),
+        name='export_start',
+    ),
+    path('tasks/<int:pk>/', views.TaskDetail.as_view(), name='task'),
+    path(
+        'tasks/<int:pk>/status/',
+        views.TaskStatus.as_view(),
+        name='task_status',
+    ),
+    path(
+        'tasks/<int:pk>/download/',
+        views.TaskDownload.as_view(),
+        name='task_download',
+    ),
+    path('search/', views.NoteSearch.as_view(), name='search'),
     path('done/', views.NoteSuccess.as_view(), name='success'),
+    path('api/notes/', api.NoteListApi.as_view(), name='api_list'),
+    path('api/changes/', api.NoteChangesApi.as_view(), name='api_changes'),
+    path(
+        'api/notes/<slug:slug>/',
+        api.NoteDetailApi.as_view(),
+        name='api_detail',
+    ),
 ]
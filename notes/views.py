@@ -1,12 +1,40 @@
+from http import HTTPStatus
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.http import (
+    FileResponse, Http404, JsonResponse, StreamingHttpResponse
+)
+from django.shortcuts import redirect
+from django.urls import reverse, reverse_lazy
 from django.views import generic
 
-from .forms import NoteForm
-from .models import Note
+from .bulk import IN_CHUNK_SIZE, delete_notes
+from .cache import CachedPageMixin, InvalidateCacheMixin
+from .export import EXPORTERS
+from .forms import WARNING, NoteForm
+from .models import Note, Task
+from .pagination import MAX_CURSOR, keyset_paginate, parse_cursor
+from .rendering import split_url
+from .revisions import current_number, diff_lines, load_versions
+from .search import search_notes
+from .stats import stats_for
+from .tags import author_tags, filter_by_tags, filter_query, parse_filter
+from .tasks import TaskLimit, enqueue, result_path
+
+
+class StatsMixin:
+    """Сводка по заметкам пользователя для панели на странице."""
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.user.is_authenticated:
+            context['stats'] = stats_for(self.request.user)
+        return context
 
-class Home(generic.TemplateView):
+
+class Home(StatsMixin, generic.TemplateView):
     """Домашняя страница."""
     template_name = 'notes/home.html'
 
@@ -26,34 +54,314 @@ class NoteBase(LoginRequiredMixin):
         return self.model.objects.filter(author=self.request.user)
 
 
-class NoteCreate(NoteBase, generic.CreateView):
-    """Добавление заметки."""
+class NoteFormMixin:
+    """Сохранение формы заметки без ошибки 500 при гонке за slug."""
     template_name = 'notes/form.html'
     form_class = NoteForm
 
     def form_valid(self, form):
-        new_note = form.save(commit=False)
-        new_note.author = self.request.user
-        new_note.save()
+        try:
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError:
+            # Указанный slug заняли между проверкой формы и вставкой.
+            form.add_error('slug', form.instance.slug + WARNING)
+            return self.form_invalid(form)
+
+
+class NoteCreate(
+    InvalidateCacheMixin, NoteFormMixin, NoteBase, generic.CreateView
+):
+    """Добавление заметки."""
+
+    def form_valid(self, form):
+        form.instance.author = self.request.user
         return super().form_valid(form)
 
 
-class NoteUpdate(NoteBase, generic.UpdateView):
+class NoteUpdate(
+    InvalidateCacheMixin, NoteFormMixin, NoteBase, generic.UpdateView
+):
     """Редактирование заметки."""
-    template_name = 'notes/form.html'
-    form_class = NoteForm
 
 
-class NoteDelete(NoteBase, generic.DeleteView):
+class NoteDelete(InvalidateCacheMixin, NoteBase, generic.DeleteView):
     """Удаление заметки."""
     template_name = 'notes/delete.html'
 
 
-class NotesList(NoteBase, generic.ListView):
+class NoteBulkDelete(NoteBase, generic.ListView):
+    """Удаление заметок, отмеченных в списке.
+
+    GET показывает подтверждение, POST удаляет отмеченные заметки
+    одним набором запросов прямо в запросе: их не больше IN_CHUNK_SIZE,
+    а список сразу после удаления уже не должен их показывать.
+    """
+    template_name = 'notes/bulk_delete.html'
+
+    def get_ids(self):
+        data = self.request.POST if self.request.method == 'POST' else (
+            self.request.GET
+        )
+        return [
+            int(value) for value in data.getlist('ids')
+            # Большие числа не бывают id и не помещаются в запрос.
+            if value.isdecimal() and int(value) <= MAX_CURSOR
+        ][:IN_CHUNK_SIZE]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            id__in=self.get_ids()
+        ).only('id', 'title')
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if not self.object_list:
+            return redirect('notes:list')
+        return response
+
+    def post(self, request, *args, **kwargs):
+        delete_notes(request.user, self.get_ids())
+        return redirect(self.success_url)
+
+
+class DetailLinksMixin:
+    """Готовые части адреса заметки для ссылок в списке."""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        prefix, suffix = split_url('notes:detail')
+        context['detail_url_prefix'] = prefix
+        context['detail_url_suffix'] = suffix
+        return context
+
+
+class NotesList(
+    CachedPageMixin, DetailLinksMixin, StatsMixin, NoteBase, generic.ListView
+):
     """Список всех заметок пользователя."""
     template_name = 'notes/list.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        """Для списка достаточно полей, которые выводятся в шаблоне."""
+        queryset = super().get_queryset().only('id', 'slug', 'title')
+        self.tag_filter = parse_filter(self.request.GET.getlist('tag'))
+        if self.tag_filter:
+            queryset = filter_by_tags(
+                queryset, self.request.user, self.tag_filter
+            )
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tags'] = author_tags(self.request.user)
+        context['tag_filter'] = self.tag_filter
+        context['tag_query'] = filter_query(self.tag_filter)
+        return context
+
+    def paginate_queryset(self, queryset, page_size):
+        """Постраничный вывод по курсору вместо OFFSET."""
+        page = keyset_paginate(
+            queryset,
+            page_size,
+            after=parse_cursor(self.request.GET.get('after')),
+            before=parse_cursor(self.request.GET.get('before')),
+        )
+        return None, page, page.object_list, page.has_other_pages
+
+
+class NotesExport(NoteBase, generic.View):
+    """Выгрузка всех заметок пользователя в JSON Lines, CSV или zip."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            exporter, content_type, filename = EXPORTERS[
+                request.GET.get('format', 'jsonl')
+            ]
+        except KeyError:
+            raise Http404('Неизвестный формат выгрузки.')
+        # Тело читается уже после выхода из ShardMiddleware и
+        # ReplicaMiddleware, поэтому база выбирается сейчас.
+        queryset = self.get_queryset()
+        response = StreamingHttpResponse(
+            exporter(queryset.using(queryset.db)), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
+        )
+        return response
+
+
+class NotesExportStart(NoteBase, generic.TemplateView):
+    """Выгрузка в фоновой задаче: для авторов с большим числом заметок.
+
+    GET показывает подтверждение (список заметок кешируется и не
+    содержит CSRF-токена), POST ставит задачу в очередь. Незавершённых
+    выгрузок у автора не больше TASK_MAX_ACTIVE_EXPORTS.
+    """
+    template_name = 'notes/export_start.html'
 
+    def dispatch(self, request, *args, **kwargs):
+        self.file_format = request.GET.get('format', 'jsonl')
+        if self.file_format not in EXPORTERS:
+            raise Http404('Неизвестный формат выгрузки.')
+        return super().dispatch(request, *args, **kwargs)
 
-class NoteDetail(NoteBase, generic.DetailView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filename'] = EXPORTERS[self.file_format][2]
+        return context
+
+    def post(self, request, *args, **kwargs):
+        try:
+            task = enqueue(
+                'export',
+                {
+                    'author_id': request.user.pk,
+                    'file_format': self.file_format,
+                },
+                author=request.user,
+                limit=settings.TASK_MAX_ACTIVE_EXPORTS,
+            )
+        except TaskLimit:
+            return self.render_to_response(
+                self.get_context_data(limit_reached=True),
+                status=HTTPStatus.TOO_MANY_REQUESTS,
+            )
+        return redirect('notes:task', pk=task.pk)
+
+
+class TaskBase(LoginRequiredMixin):
+    """Фоновые задачи пользователя.
+
+    Состояние читается из основной базы: реплика может отставать
+    от процесса, выполняющего задачу.
+    """
+    model = Task
+
+    def get_queryset(self):
+        return Task.objects.using(DEFAULT_DB_ALIAS).filter(
+            author=self.request.user
+        )
+
+
+def task_state(task):
+    """Состояние задачи для страницы и JSON."""
+    return {
+        'id': task.pk,
+        'name': task.name,
+        'status': task.status,
+        'attempts': task.attempts,
+        'finished': task.is_finished,
+        'download_url': (
+            reverse('notes:task_download', args=(task.pk,))
+            if result_path(task) else None
+        ),
+    }
+
+
+class TaskDetail(TaskBase, generic.DetailView):
+    """Страница задачи; пока задача не завершена, она обновляется."""
+    template_name = 'notes/task.html'
+    refresh_seconds = 2
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['state'] = task_state(self.object)
+        context['refresh_seconds'] = self.refresh_seconds
+        return context
+
+
+class TaskStatus(TaskBase, generic.DetailView):
+    """Состояние задачи в JSON для опроса из интерфейса."""
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(task_state(self.object))
+
+
+class TaskDownload(TaskBase, generic.DetailView):
+    """Файл с результатом завершённой задачи."""
+
+    def render_to_response(self, context, **response_kwargs):
+        path = result_path(self.object)
+        if self.object.status != Task.DONE or path is None or (
+            not path.exists()
+        ):
+            raise Http404('Результата задачи нет.')
+        return FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=self.object.result['filename'],
+            content_type=self.object.result['content_type'],
+        )
+
+
+class NoteDetail(CachedPageMixin, NoteBase, generic.DetailView):
     """Заметка подробно."""
     template_name = 'notes/detail.html'
+
+
+class NoteHistory(NoteBase, generic.DetailView):
+    """Список версий заметки."""
+    template_name = 'notes/history.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        revisions = self.object.revisions.defer('data').order_by('-number')
+        context['revisions'] = revisions
+        context['current'] = current_number(self.object)
+        return context
+
+
+class NoteRevisionDetail(NoteBase, generic.DetailView):
+    """Прежняя версия заметки и её отличия от предыдущей."""
+    template_name = 'notes/revision.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        number = self.kwargs['number']
+        versions = load_versions(self.object, number - 1)
+        if number not in versions:
+            raise Http404('Такой версии нет.')
+        version = versions[number]
+        previous = versions.get(number - 1)
+        context['version'] = version
+        context['previous'] = previous
+        context['diff'] = list(
+            diff_lines(previous.text if previous else '', version.text)
+        )
+        context['current'] = current_number(self.object)
+        return context
+
+
+class NoteRestore(
+    InvalidateCacheMixin, NoteBase, generic.detail.SingleObjectMixin,
+    generic.View,
+):
+    """Восстановление прежней версии как новой текущей."""
+    http_method_names = ('post',)
+
+    def post(self, request, *args, **kwargs):
+        note = self.get_object()
+        number = self.kwargs['number']
+        version = load_versions(note, number).get(number)
+        if version is None:
+            raise Http404('Такой версии нет.')
+        note.title = version.title
+        note.text = version.text
+        note.save()
+        return redirect('notes:detail', slug=note.slug)
+
+
+class NoteSearch(DetailLinksMixin, NoteBase, generic.ListView):
+    """Полнотекстовый поиск по заметкам пользователя."""
+    template_name = 'notes/search.html'
+
+    def get_queryset(self):
+        return search_notes(self.request.user, self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
@@ -0,0 +1,22 @@
+from django.template.defaultfilters import date as date_filter
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.timezone import template_localtime
+from jinja2 import Environment
+
+
+def url(viewname, *args, **kwargs):
+    """Аналог тега {% url %} для шаблонов Jinja2."""
+    return reverse(viewname, args=args, kwargs=kwargs)
+
+
+def date(value, arg=None):
+    """Фильтр date, как в шаблонах Django: в местном времени."""
+    return date_filter(template_localtime(value), arg)
+
+
+def environment(**options):
+    env = Environment(**options)
+    env.globals.update({'static': static, 'url': url})
+    env.filters['date'] = date
+    return env
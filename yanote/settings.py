@@ -1,3 +1,5 @@
+import os
+import tempfile
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -22,11 +24,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.middleware.PerformanceMiddleware',
+    'notes.middleware.MetricsMiddleware',
+    'notes.middleware.ProfilingMiddleware',
+    'notes.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'notes.middleware.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -44,21 +51,192 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'notes.context_processors.templates',
             ],
         },
     },
 ]
 
+# Режим шаблонов: в production шаблоны загружаются через явный
+# кеширующий загрузчик (из DIRS и из приложений — там шаблоны админки),
+# шаблоны из DIRS компилируются при старте, а шапка страницы кешируется
+# для каждого пользователя. В режиме default шапка не кешируется вовсе.
+TEMPLATE_MODE = os.environ.get('YANOTE_TEMPLATE_MODE', 'default')
+TEMPLATE_FRAGMENT_TIMEOUT = 0
+
+if TEMPLATE_MODE == 'production':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    TEMPLATE_FRAGMENT_TIMEOUT = 600
+
+# Шаблоны Jinja2 из jinja2/ повторяют шаблоны Django для заметок
+# и регистрации. С YANOTE_TEMPLATE_ENGINE=jinja2 движок ставится первым,
+# остальные шаблоны (например, админки) по-прежнему берутся у Django.
+TEMPLATE_ENGINE = os.environ.get('YANOTE_TEMPLATE_ENGINE', 'django')
+JINJA2_TEMPLATES = {
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [BASE_DIR / 'jinja2'],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'environment': 'yanote.jinja2.environment',
+        'keep_trailing_newline': True,
+        'context_processors': TEMPLATES[0]['OPTIONS']['context_processors'],
+    },
+}
+
+if TEMPLATE_ENGINE == 'jinja2':
+    TEMPLATES.insert(0, JINJA2_TEMPLATES)
+
 WSGI_APPLICATION = 'yanote.wsgi.application'
 
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('YANOTE_DB_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+}
+
+# Продакшен-профиль SQLite: YANOTE_SQLITE_PROFILE=production.
+# Прагмы применяются к каждому новому соединению (notes.signals).
+SQLITE_PROFILE = os.environ.get('YANOTE_SQLITE_PROFILE', 'default')
+SQLITE_PRAGMAS = {}
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'yanote.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('YANOTE_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(
+            os.environ.get('YANOTE_SQLITE_BUSY_TIMEOUT', 5000)
+        ),
+        'mmap_size': int(
+            os.environ.get('YANOTE_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+        ),
+        # Отрицательное значение — размер кеша в КиБ.
+        'cache_size': int(
+            os.environ.get('YANOTE_SQLITE_CACHE_SIZE', -64 * 1024)
+        ),
+    }
+
+# Реплики для чтения: YANOTE_REPLICA_PATHS — пути к копиям базы SQLite
+# через запятую. Копии обновляет manage.py sync_replicas, открываются
+# они только на чтение. После записи пользователь читает из основной
+# базы ещё REPLICA_PIN_SECONDS секунд.
+REPLICA_PATHS = [
+    path for path in os.environ.get('YANOTE_REPLICA_PATHS', '').split(',')
+    if path
+]
+DATABASE_REPLICAS = []
+for number, path in enumerate(REPLICA_PATHS, start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': Path(path).resolve().as_uri() + '?mode=ro',
+        'OPTIONS': {'uri': True},
+        'READ_ONLY': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+REPLICA_PIN_SECONDS = int(os.environ.get('YANOTE_REPLICA_PIN_SECONDS', 5))
+
+# Шардирование заметок по авторам: YANOTE_SHARD_PATHS — пути к базам
+# SQLite через запятую. Вместе с основной базой они образуют
+# NOTES_SHARDS; заметки каждого автора лежат в одной из них, реестр
+# slug и привязка авторов — в основной. Шарды создаются командой
+# migrate --database=shardN, автор переносится командой
+# move_author_shard. Если заметки создавались до включения, сначала
+# выполните sync_slug_registry.
+SHARD_PATHS = [
+    path for path in os.environ.get('YANOTE_SHARD_PATHS', '').split(',')
+    if path
+]
+NOTES_SHARDS = ['default'] if SHARD_PATHS else []
+for number, path in enumerate(SHARD_PATHS, start=1):
+    DATABASES[f'shard{number}'] = {
+        **DATABASES['default'],
+        'ENGINE': 'yanote.sqlite3',
+        'NAME': path,
+        'SHARD': True,
+    }
+    NOTES_SHARDS.append(f'shard{number}')
+DATABASE_ROUTERS = [
+    'notes.routers.ReplicaRouter',
+    'notes.routers.ShardRouter',
+]
+
+if os.environ.get('YANOTE_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['YANOTE_CACHE_DIR'],
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Версии кеша страниц авторов должны быть общими для всех процессов
+# сервера: иначе запись в одном процессе не сбросит страницы, которые
+# закешировали остальные. Поэтому они всегда в файловом кеше, даже
+# если сами страницы лежат в памяти процесса.
+CACHES['notes_versions'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get(
+        'YANOTE_VERSION_CACHE_DIR',
+        Path(tempfile.gettempdir()) / 'yanote-cache-versions',
+    ),
+    'TIMEOUT': None,
+    'OPTIONS': {'MAX_ENTRIES': 10000},
 }
 
+NOTES_CACHE_ENABLED = os.environ.get('YANOTE_NOTES_CACHE', '1') == '1'
+NOTES_CACHE_ALIAS = 'default'
+NOTES_VERSION_CACHE_ALIAS = 'notes_versions'
+NOTES_CACHE_TIMEOUT = 300
+# Сколько секунд хранится HTML, отрисованный из Markdown-текста заметки.
+NOTES_MARKDOWN_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Сжатие текста заметок: кодек (zlib, zstd на Python 3.14+; пустая
+# строка — без сжатия) и длина текста в символах, с которой он сжимается.
+# Неизвестный кодек отклоняет проверка notes.E001 при запуске.
+NOTES_COMPRESSION = os.environ.get('YANOTE_NOTES_COMPRESSION', 'zlib')
+NOTES_COMPRESS_THRESHOLD = 4096
+
+# Каждая N-я прежняя версия заметки хранится целиком, остальные — дельтой.
+NOTES_REVISION_SNAPSHOT_INTERVAL = 20
+
+# Быстрая аутентификация: YANOTE_AUTH_MODE=fast. Сессии читаются
+# из общего для процессов файлового кеша (каталог
+# YANOTE_SESSION_CACHE_DIR), а изменения пишутся в базу с задержкой до
+# SESSION_WRITE_BEHIND_SECONDS; пользователи кешируются в памяти
+# процесса на AUTH_USER_CACHE_TTL секунд. При смене режима
+# пользователям придётся войти заново.
+AUTH_MODE = os.environ.get('YANOTE_AUTH_MODE', 'default')
+SESSION_WRITE_BEHIND_SECONDS = 30
+AUTH_USER_CACHE_TTL = 60
+if AUTH_MODE == 'fast':
+    SESSION_ENGINE = 'notes.sessions'
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YANOTE_SESSION_CACHE_DIR',
+            Path(tempfile.gettempdir()) / 'yanote-cache-sessions',
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+    SESSION_CACHE_ALIAS = 'sessions'
+    AUTHENTICATION_BACKENDS = ['notes.auth.CachedModelBackend']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -70,6 +248,77 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Замер времени запросов: заголовок Server-Timing и лог notes.performance.
+PERF_INSTRUMENTATION = os.environ.get('YANOTE_PERF_INSTRUMENTATION') == '1'
+# Сколько одинаковых SQL-запросов за запрос считать признаком N+1.
+PERF_NPLUSONE_THRESHOLD = 10
+
+# Метрики Prometheus на /metrics, по умолчанию выключены. Страницу видят
+# сотрудники (is_staff) и запросы с адресов METRICS_ALLOWED_IPS — через
+# запятую в YANOTE_METRICS_ALLOWED_IPS. Если задан каталог, воркеры
+# сбрасывают туда свои значения не реже чем раз в METRICS_FLUSH_INTERVAL
+# секунд.
+METRICS_ENABLED = os.environ.get('YANOTE_METRICS', '0') == '1'
+METRICS_ALLOWED_IPS = [
+    address for address in os.environ.get(
+        'YANOTE_METRICS_ALLOWED_IPS', '127.0.0.1,::1'
+    ).split(',')
+    if address
+]
+METRICS_DIR = os.environ.get('YANOTE_METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+
+# Профилирование медленных запросов: доля запросов под cProfile (0 —
+# выключено), порог сохранения профиля и размер хранилища.
+PROFILER_SAMPLE_RATE = float(
+    os.environ.get('YANOTE_PROFILER_SAMPLE_RATE', 0)
+)
+PROFILER_THRESHOLD_MS = int(
+    os.environ.get('YANOTE_PROFILER_THRESHOLD_MS', 500)
+)
+PROFILER_DIR = os.environ.get('YANOTE_PROFILER_DIR', BASE_DIR / 'profiles')
+PROFILER_MAX_FILES = 200
+
+# Фоновые задачи (notes.tasks): число процессов manage.py run_workers,
+# пауза опроса пустой очереди, сигнал жизни выполняемой задачи и срок,
+# после которого задачу упавшего процесса забирает другой, пауза перед
+# первым повтором (дальше удваивается) и каталог с файлами выгрузок.
+# Завершённые задачи и их файлы хранятся TASK_KEEP_DAYS дней, очистку
+# run_workers ставит в очередь раз в TASK_PRUNE_INTERVAL секунд.
+# У автора не больше TASK_MAX_ACTIVE_EXPORTS незавершённых выгрузок.
+TASK_WORKERS = int(os.environ.get('YANOTE_TASK_WORKERS', 2))
+TASK_POLL_INTERVAL = 1
+TASK_HEARTBEAT_SECONDS = 10
+TASK_LEASE_SECONDS = 60
+TASK_RETRY_DELAY = 5
+TASK_RESULTS_DIR = os.environ.get(
+    'YANOTE_TASK_RESULTS_DIR', BASE_DIR / 'task_results'
+)
+TASK_KEEP_DAYS = int(os.environ.get('YANOTE_TASK_KEEP_DAYS', 7))
+TASK_PRUNE_INTERVAL = 3600
+TASK_MAX_ACTIVE_EXPORTS = 2
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'notes.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'notes.tasks': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
 LANGUAGE_CODE = 'ru'
 
 TIME_ZONE = 'Europe/Moscow'
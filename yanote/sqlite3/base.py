@@ -0,0 +1,56 @@
+"""SQLite-бэкенд для продакшен-профиля yanote.
+
+Отличия от стандартного django.db.backends.sqlite3:
+
+* транзакции начинаются с BEGIN IMMEDIATE. При обычном BEGIN транзакция,
+  которая сначала читает, а потом пишет, не может дождаться блокировки
+  записи: SQLite сразу возвращает "database is locked", не глядя
+  на busy_timeout;
+* is_usable() действительно проверяет соединение, чтобы постоянные
+  соединения (CONN_MAX_AGE) можно было проверять перед запросом;
+* в шардах заметок (SHARD в настройках базы) нет таблицы
+  пользователей, поэтому внешние ключи на неё не проверяются ни при
+  записи, ни после миграций.
+"""
+import sqlite3
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        if self.settings_dict.get('SHARD'):
+            connection.execute('PRAGMA foreign_keys = OFF')
+        return connection
+
+    def enable_constraint_checking(self):
+        if not self.settings_dict.get('SHARD'):
+            super().enable_constraint_checking()
+
+    def check_constraints(self, table_names=None):
+        if not self.settings_dict.get('SHARD'):
+            return super().check_constraints(table_names)
+        with self.cursor() as cursor:
+            existing = set(self.introspection.table_names(cursor))
+            violations = cursor.execute(
+                'PRAGMA foreign_key_check'
+            ).fetchall()
+        tables = {
+            table for table, _, parent, _ in violations
+            if parent in existing
+            and (table_names is None or table in table_names)
+        }
+        if tables:
+            super().check_constraints(tables)
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')